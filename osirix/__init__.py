@@ -1,6 +1,7 @@
 __all__ = ["Osirix",
            "OsirixService",
            "ViewerController",
+           "ViewerControllerSnapshot",
            "DCMPix",
            "ROI",
            "VRController",
@@ -9,6 +10,13 @@ __all__ = ["Osirix",
            "DicomStudy",
            "DicomImage",
            "ROIVolume",
+           "ROIIndex",
+           "ROIPointSet",
+           "ROISpatialIndex",
+           "ViewerWatcher",
+           "CinePlayer",
+           "CineStats",
+           "MetadataCatalogue",
            "VRController",
            "GrpcException",
            "WaitException",
@@ -22,16 +30,29 @@ import sys
 import os
 import json
 import warnings
-from typing import Tuple
+from typing import Any, Callable, Optional, Sequence, Tuple, Union
+
+from numpy import ndarray
 
 from .exceptions import GrpcException, WaitException, OsirixServiceException
-from .viewer_controller import ViewerController, DCMPix, ROI
-from .vr_controller import VRController, ROIVolume
+from .viewer_controller import ViewerController, ViewerControllerSnapshot, DCMPix, ROI
+from .vr_controller import VRController
+from .roi import ROIVolume
+from .roi_index import ROIIndex
+from .roi_geometry import ROIPointSet, ROISpatialIndex
+from .watcher import ViewerWatcher
+from .cine import CinePlayer, CineStats
 from .dicom import DicomSeries, DicomStudy, DicomImage
 from .browser_controller import BrowserController
 from .osirix_utils import Osirix, OsirixService
+from .catalogue import MetadataCatalogue
+from .cache import cache_stats, reset_cache_stats, caching_enabled, set_caching_enabled, caching_disabled
 
 global __port__, __domain__, __osirix__, __osirix_service__
+__port__ = None
+__domain__ = None
+__osirix__ = None
+__osirix_service__ = None
 
 
 def __init_setup__():
@@ -42,6 +63,9 @@ def __init_setup__():
                                      "Library/Application Support/OsirixGRPC")
     server_configs = os.path.join(support_directory,
                                   "server_configs.json")
+    if not os.path.isfile(server_configs):
+        warnings.warn("No server configuration found. You may need to start one in OsiriX.")
+        return
     with open(server_configs) as file:
         server_configs_dict = json.load(file)
         for item in server_configs_dict:
@@ -64,6 +88,8 @@ def __init_setup__():
 
 __init_setup__()
 
+__catalogue__ = None
+
 
 def current_browser() -> BrowserController:
     """
@@ -128,3 +154,114 @@ def displayed_vr_controllers() -> Tuple[VRController, ...]:
     if __osirix__ is None:
         raise ConnectionError("No connection established")
     return __osirix__.displayed_vr_controllers()
+
+
+def for_each_viewer(fn: Callable[[ViewerController], Any], workers: int = 8) -> Tuple[Any, ...]:
+    """
+    Calls a function on every displayed 2D viewer concurrently
+
+    Args:
+        fn : callable taking a ViewerController
+        workers : the maximum number of viewers processed at once
+
+    Returns:
+        Tuple containing the result of fn for each viewer, in viewer order
+    """
+    global __osirix__
+    if __osirix__ is None:
+        raise ConnectionError("No connection established")
+    return __osirix__.for_each_viewer(fn, workers=workers)
+
+
+def current_slice_images(workers: int = 8) -> ndarray:
+    """
+    Provides the image of the current slice of every displayed 2D viewer, requested concurrently
+
+    Returns:
+        ndarray : (viewers, rows, columns) stack of images
+    """
+    global __osirix__
+    if __osirix__ is None:
+        raise ConnectionError("No connection established")
+    return __osirix__.current_slice_images(workers=workers)
+
+
+def viewers_wlww(workers: int = 8) -> ndarray:
+    """
+    Provides the wlww of every displayed 2D viewer, requested concurrently
+
+    Returns:
+        ndarray : (viewers, 2) array of wl and ww
+    """
+    global __osirix__
+    if __osirix__ is None:
+        raise ConnectionError("No connection established")
+    return __osirix__.viewers_wlww(workers=workers)
+
+
+def set_viewers_wlww(wlww: Tuple[float, float], workers: int = 8) -> None:
+    """
+    Sets the same wlww on every displayed 2D viewer concurrently
+
+    Args:
+        wlww : Tuple containing wl and ww
+    """
+    global __osirix__
+    if __osirix__ is None:
+        raise ConnectionError("No connection established")
+    __osirix__.set_viewers_wlww(wlww, workers=workers)
+
+
+def default_catalogue(refresh: bool = False) -> MetadataCatalogue:
+    """
+    Provides the in-memory metadata catalogue used by find_series, indexing the database on first use
+
+    Args:
+        refresh : whether to bring the catalogue up to date with the database, which re-crawls changed studies only
+
+    Returns:
+        MetadataCatalogue
+    """
+    global __osirix__, __catalogue__
+    if __osirix__ is None:
+        raise ConnectionError("No connection established")
+    if __catalogue__ is None:
+        __catalogue__ = MetadataCatalogue()
+        refresh = True
+    if refresh:
+        __catalogue__.refresh(__osirix__.current_browser())
+    return __catalogue__
+
+
+def find_series(modality: Union[str, Sequence[str], None] = None,
+                description: Optional[str] = None,
+                date_range: Optional[Tuple[Any, Any]] = None,
+                date_added_range: Optional[Tuple[Any, Any]] = None,
+                patient_id: Optional[str] = None,
+                refresh: bool = False,
+                pattern: bool = False) -> Tuple[DicomSeries, ...]:
+    """
+    Finds series in the local metadata catalogue, e.g. find_series(modality="MR", description="DWI",
+    date_added_range=(monday, None)). See MetadataCatalogue.query_series for the criteria.
+
+    Args:
+        refresh : whether to bring the catalogue up to date with the database first
+        pattern : whether description is an SQL LIKE pattern rather than text to find
+
+    Returns:
+        Tuple containing the matching DicomSeries, most recent first
+    """
+    return default_catalogue(refresh).find_series(modality=modality, description=description, date_range=date_range,
+                                                  date_added_range=date_added_range, patient_id=patient_id,
+                                                  pattern=pattern)
+
+
+def coalesce(*methods: str) -> None:
+    """
+    Makes concurrent identical requests of read-only service methods share one RPC, e.g.
+    coalesce("DCMPixImage", "ViewerControllerPixList"). See OsirixService.coalesce.
+    """
+    global __osirix_service__
+    if __osirix_service__ is None:
+        raise ConnectionError("No connection established")
+    __osirix_service__.coalesce(*methods)
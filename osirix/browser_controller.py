@@ -4,20 +4,20 @@ import sys
 # sys.path.append("/Users/admintmun/dev/pyosirix/osirix/pb2")
 import osirixgrpc.browsercontroller_pb2 as browsercontroller_pb2
 from osirix.exceptions import GrpcException
-from typing import Tuple, List
+from typing import Any, Callable, Iterator, Optional, Sequence, Tuple, List
+from functools import partial
 from osirix.dicom import DicomSeries, DicomStudy
-from osirix.response_processor import ResponseProcessor
+from osirix.osirix_object import OsirixObject
+from osirix.lazy_sequence import LazySequence
+from osirix.crawler import MetadataCrawler, CrawlResult, CrawlProgress, STUDY_FIELDS, SERIES_FIELDS, IMAGE_FIELDS
+from osirix.importer import BulkImporter, ChunkResult, ImportResult
+from osirix.traversal import SeriesTraversal
 
-class BrowserController(object):
+class BrowserController(OsirixObject):
     """
     Retrives the browser window of Osirix
     """
-
-    def __init__(self, osirixrpc_uid, osirix_service) -> None:
-        self.osirix_service = osirix_service
-        self.osirixrpc_uid = osirixrpc_uid
-        self.response_processor = ResponseProcessor()
-
+    __slots__ = ()
 
     def copy_files_into_database(self, files: List[str]) -> None:
         """
@@ -32,16 +32,61 @@ class BrowserController(object):
         """
         request = browsercontroller_pb2.BrowserControllerCopyFilesIfNeededRequest(browser=self.osirixrpc_uid, paths = files)
         response = self.osirix_service.BrowserControllerCopyFilesIfNeeded(request)
-        self.response_processor.process_basic_response(response)
+        self.response_processor.response_check(response)
+
+    def traverse_series(self, direction: str = "next", workers: int = 8,
+                        studies: Optional[Sequence[DicomStudy]] = None) -> Iterator[DicomSeries]:
+        """
+        Iterates over the series of every study in the database, study by study, in next_series (or
+        previous_series) order. The series and links of all studies are requested concurrently, ahead of the
+        consumer, and a link back to a visited series ends the walk of a study.
+
+        Args:
+            direction: "next" or "previous"
+            workers: the maximum number of requests in flight at once
+            studies: the studies to traverse, all studies of the database if None
+
+        Returns:
+            Iterator over DicomSeries
+
+        """
+        return SeriesTraversal(self, direction=direction, workers=workers).database(studies)
+
+    def import_files(self,
+                     files: Sequence[str],
+                     chunk_size: int = 500,
+                     workers: int = 2,
+                     retries: int = 2,
+                     hash_contents: bool = False,
+                     progress: Optional[Callable[[ChunkResult], Any]] = None) -> ImportResult:
+        """
+        Copies many files into the database of Osirix. Repeated paths are removed and the rest are sent in chunks,
+        with a bounded number of requests in flight, retrying chunks that fail
+
+        Args:
+            files: list of files to copy into database
+            chunk_size: the maximum number of files per request
+            workers: the maximum number of requests in flight at once
+            retries: the number of times a failed chunk is sent again
+            hash_contents: whether files with identical contents (readable from this machine) are copied only once
+            progress: callback receiving a ChunkResult with the time, attempts and any error of each chunk
+
+        Returns:
+            ImportResult
+
+        """
+        importer = BulkImporter(self, chunk_size=chunk_size, workers=workers, retries=retries,
+                                hash_contents=hash_contents, progress=progress)
+        return importer.run(files)
 
     # Check return type of Tuples
-    def database_selection(self) -> Tuple[Tuple[DicomStudy,...], Tuple[DicomSeries,...]]:
+    def database_selection(self) -> Tuple[LazySequence[DicomStudy], LazySequence[DicomSeries]]:
         """
         Queries the Osirix database for its files
 
         Returns:
-            A Tuple containing two Tuples. The first Tuple contains all the Dicom studies and the second
-            Tuple contains all the Dicom series in the database
+            A Tuple containing two LazySequences. The first contains all the Dicom studies and the second
+            contains all the Dicom series in the database
 
         """
         response = self.osirix_service.BrowserControllerDatabaseSelection(self.osirixrpc_uid)
@@ -49,26 +94,34 @@ class BrowserController(object):
 
         if (response.status.status == 1):
 
-            series_tuple: Tuple[DicomSeries, ...] = ()
-            study_tuple: Tuple[DicomStudy, ...] = ()
-
-            for series in response.series:
-                series_obj= DicomSeries(series, self.osirix_service)
-                series_tuple = series_tuple + (series_obj,)
+            study_sequence = LazySequence(response.studies, partial(DicomStudy, osirix_service=self.osirix_service))
+            series_sequence = LazySequence(response.series, partial(DicomSeries, osirix_service=self.osirix_service))
 
-            for study in response.studies:
-                study_obj = DicomStudy(study, self.osirix_service)
-
-                study_tuple = study_tuple + (study_obj,)
-
-            return (study_tuple, series_tuple)
+            return (study_sequence, series_sequence)
         else:
             raise GrpcException("No response")
 
+    def crawl_metadata(self,
+                       study_fields: Sequence[str] = STUDY_FIELDS,
+                       series_fields: Sequence[str] = SERIES_FIELDS,
+                       image_fields: Sequence[str] = IMAGE_FIELDS,
+                       workers: int = 16,
+                       progress: Optional[Callable[[CrawlProgress], Any]] = None) -> CrawlResult:
+        """
+        Collects attributes of the studies, series and images in the database into columnar tables of NumPy arrays,
+        requesting them concurrently with a bounded pool of workers
 
+        Args:
+            study_fields: DicomStudy attributes to collect
+            series_fields: DicomSeries attributes to collect
+            image_fields: DicomImage attributes to collect, images are not visited if empty
+            workers: the maximum number of requests in flight at once
+            progress: callback receiving a CrawlProgress with the number of requests and their rate
 
+        Returns:
+            CrawlResult
 
-
-
-
-
+        """
+        crawler = MetadataCrawler(self, study_fields=study_fields, series_fields=series_fields,
+                                  image_fields=image_fields, workers=workers, progress=progress)
+        return crawler.crawl()
@@ -0,0 +1,151 @@
+from __future__ import annotations
+from contextlib import contextmanager
+from dataclasses import dataclass
+from typing import Any, Callable, Dict, Iterator, Optional, Tuple
+import functools
+import threading
+import time
+
+# Cache policy value of attributes that never change for the lifetime of an object
+IMMUTABLE: Optional[float] = None
+
+_enabled = True
+_stats_lock = threading.Lock()
+_stats: Dict[str, list] = {}
+
+@dataclass(frozen=True)
+class CacheStats:
+    """
+    Hit and miss counts of one cached attribute
+    """
+    hits: int
+    misses: int
+
+    @property
+    def hit_rate(self) -> float:
+        total = self.hits + self.misses
+        return self.hits / total if total > 0 else 0.0
+
+def caching_enabled() -> bool:
+    """
+    Provides whether attribute caching is enabled
+    """
+    return _enabled
+
+def set_caching_enabled(enabled: bool) -> None:
+    """
+    Enables or disables attribute caching for every pyOsirix object, e.g. to debug with every value requested
+    from Osirix. Disabling does not drop values already cached, they are used again once caching is re-enabled.
+    """
+    global _enabled
+    _enabled = bool(enabled)
+
+@contextmanager
+def caching_disabled() -> Iterator[None]:
+    """
+    Context manager disabling attribute caching within its block
+    """
+    enabled = caching_enabled()
+    set_caching_enabled(False)
+    try:
+        yield
+    finally:
+        set_caching_enabled(enabled)
+
+def cache_stats() -> Dict[str, CacheStats]:
+    """
+    Provides the hit and miss counts of cached attributes, keyed by "Class.attribute"
+    """
+    with _stats_lock:
+        return {key: CacheStats(hits=counts[0], misses=counts[1]) for key, counts in _stats.items()}
+
+def reset_cache_stats() -> None:
+    """
+    Sets every hit and miss count back to zero
+    """
+    with _stats_lock:
+        _stats.clear()
+
+def _record(key: str, hit: bool) -> None:
+    with _stats_lock:
+        counts = _stats.setdefault(key, [0, 0])
+        counts[0 if hit else 1] += 1
+
+def cached_attribute(method: Callable) -> Callable:
+    """
+    Decorator caching the value of an attribute (a property or a method without arguments) according to the
+    CACHE_POLICY of the class, a dict mapping attribute names to their time to live in seconds (IMMUTABLE to cache
+    for the lifetime of the object). Attributes missing from the policy are not cached. The object must have an
+    AttributeCache in _cache.
+    """
+    name = method.__name__
+
+    @functools.wraps(method)
+    def wrapper(self):
+        ttl = type(self).CACHE_POLICY.get(name, 0.0)
+        return self._cache.get(name, ttl, lambda: method(self))
+    return wrapper
+
+class AttributeCache(object):
+    '''
+    Class holding cached attribute values of a pyOsirix object, each stored with an optional expiry time
+    '''
+
+    def __init__(self, owner: str = "") -> None:
+        """
+        Args:
+            owner : name under which hits and misses are counted, usually the class of the object
+        """
+        self.owner = owner
+        self._values: Dict[str, Tuple[Any, Optional[float]]] = {}
+        self._lock = threading.Lock()
+
+    def get(self, name: str, ttl: Optional[float], fetch: Callable[[], Any]) -> Any:
+        """
+        Provides the cached value of an attribute, calling fetch when it is missing or expired
+
+        Args:
+            name : the attribute name
+            ttl : time to live in seconds. None caches the value forever and 0 disables caching.
+            fetch : callable requesting the value from the Osirix service
+
+        Returns:
+            the attribute value
+        """
+        if not _enabled or (ttl is not None and ttl <= 0):
+            return fetch()
+        with self._lock:
+            entry = self._values.get(name)
+        key = "%s.%s" % (self.owner, name) if self.owner else name
+        if entry is not None and (entry[1] is None or time.monotonic() < entry[1]):
+            _record(key, True)
+            return entry[0]
+        _record(key, False)
+        value = fetch()
+        self.set(name, value, ttl)
+        return value
+
+    def set(self, name: str, value: Any, ttl: Optional[float]) -> None:
+        """
+        Stores a value for an attribute
+
+        Args:
+            name : the attribute name
+            value : the value
+            ttl : time to live in seconds, None to keep the value forever and 0 to not store it
+        """
+        if not _enabled or (ttl is not None and ttl <= 0):
+            return
+        expiry = None if ttl is None else time.monotonic() + ttl
+        with self._lock:
+            self._values[name] = (value, expiry)
+
+    def invalidate(self, name: Optional[str] = None) -> None:
+        """
+        Drops the cached value of one attribute, or of all attributes if name is None
+        """
+        with self._lock:
+            if name is None:
+                self._values.clear()
+            else:
+                self._values.pop(name, None)
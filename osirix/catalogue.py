@@ -0,0 +1,425 @@
+from __future__ import annotations
+from dataclasses import dataclass
+from typing import Any, Callable, Dict, List, Optional, Sequence, Tuple, Union
+import datetime
+import sqlite3
+import threading
+import time
+
+import numpy as np
+
+import osirixgrpc.types_pb2 as types_pb2
+from osirix.crawler import MetadataCrawler, CrawlProgress, CrawlResult, STUDY_FIELDS, SERIES_FIELDS
+from osirix.dicom import DicomSeries, DicomStudy
+
+IMAGE_FIELDS: Tuple[str, ...] = ("sop_instance_uid", "instance_number", "complete_path")
+
+# Fields requested for every study on each refresh to find the studies that changed
+PROBE_FIELDS: Tuple[str, ...] = ("study_instance_uid", "date_added", "number_of_images")
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS studies (
+    study_instance_uid TEXT PRIMARY KEY,
+    osirixrpc_uid TEXT,
+    patient_id TEXT,
+    name TEXT,
+    date TEXT,
+    date_added TEXT,
+    modalities TEXT,
+    number_of_images INTEGER,
+    indexed_at REAL
+);
+CREATE TABLE IF NOT EXISTS series (
+    series_instance_uid TEXT PRIMARY KEY,
+    study_instance_uid TEXT NOT NULL REFERENCES studies(study_instance_uid) ON DELETE CASCADE,
+    osirixrpc_uid TEXT,
+    name TEXT,
+    series_description TEXT,
+    modality TEXT,
+    date TEXT,
+    number_of_images INTEGER
+);
+CREATE TABLE IF NOT EXISTS images (
+    sop_instance_uid TEXT PRIMARY KEY,
+    series_instance_uid TEXT NOT NULL REFERENCES series(series_instance_uid) ON DELETE CASCADE,
+    osirixrpc_uid TEXT,
+    instance_number INTEGER,
+    path TEXT
+);
+CREATE INDEX IF NOT EXISTS series_study ON series(study_instance_uid);
+CREATE INDEX IF NOT EXISTS series_modality ON series(modality);
+CREATE INDEX IF NOT EXISTS series_date ON series(date);
+CREATE INDEX IF NOT EXISTS images_series ON images(series_instance_uid);
+CREATE INDEX IF NOT EXISTS studies_date_added ON studies(date_added);
+CREATE INDEX IF NOT EXISTS studies_patient_id ON studies(patient_id);
+"""
+
+@dataclass(frozen=True)
+class RefreshStats:
+    """
+    Outcome of a MetadataCatalogue refresh
+    """
+    studies_added: int
+    studies_updated: int
+    studies_removed: int
+    studies_unchanged: int
+    requests: int
+    elapsed: float
+
+def _sql_value(value: Any) -> Any:
+    # Dates are stored as 'YYYY-MM-DDTHH:MM:SS' whether they come from a datetime64 column or, when a value of the
+    # column is missing, from an object column of datetime
+    if value is None:
+        return None
+    if isinstance(value, np.datetime64):
+        return str(value.astype("datetime64[s]"))
+    if isinstance(value, datetime.datetime):
+        return value.isoformat(timespec="seconds")
+    if isinstance(value, datetime.date):
+        return datetime.datetime.combine(value, datetime.time()).isoformat(timespec="seconds")
+    if isinstance(value, np.generic):
+        return value.item()
+    return value
+
+def _rows(table: Dict[str, np.ndarray], fields: Sequence[str]) -> List[Tuple[Any, ...]]:
+    columns = [table[name] for name in fields]
+    return [tuple(_sql_value(column[i]) for column in columns) for i in range(len(table["uid"]))]
+
+DateLike = Union[datetime.date, datetime.datetime, str, None]
+
+def _date_bound(value: DateLike, upper: bool) -> Optional[str]:
+    # Dates are stored as ISO 8601 strings, so bounds compare as strings; a date as upper bound includes its whole day
+    if value is None:
+        return None
+    if isinstance(value, datetime.datetime):
+        return value.isoformat(timespec="seconds")
+    if isinstance(value, datetime.date):
+        return value.isoformat() + ("T23:59:59" if upper else "T00:00:00")
+    return str(value)
+
+def like_escape(text: str) -> str:
+    """
+    Escapes the SQL LIKE wildcards of text, for use with ESCAPE '\\'
+    """
+    return text.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+
+def _range_clause(column: str, date_range: Optional[Tuple[DateLike, DateLike]], clauses: List[str],
+                  parameters: List[Any]) -> None:
+    if date_range is None:
+        return
+    start, end = _date_bound(date_range[0], False), _date_bound(date_range[1], True)
+    if start is not None:
+        clauses.append("%s >= ?" % column)
+        parameters.append(start)
+    if end is not None:
+        clauses.append("%s <= ?" % column)
+        parameters.append(end)
+
+def _key(uid: Any, osirixrpc_uid: str) -> str:
+    # Objects without a DICOM uid are keyed by their Osirix identifier so that they are still indexed
+    return uid if uid else "osirixrpc:" + osirixrpc_uid
+
+class MetadataCatalogue(object):
+    '''
+    Class holding a persistent SQLite index of the studies, series and images of the Osirix database, keyed by
+    study, series and SOP instance UIDs. A refresh only re-crawls the studies whose date_added or number of images
+    changed, and queries are then answered locally.
+
+    The stored osirixrpc_uid identifiers are those of the Osirix session of the last crawl of each study; use
+    refresh(full=True) after Osirix has been restarted.
+    '''
+
+    def __init__(self, path: str = ":memory:", osirix_service=None):
+        """
+        Args:
+            path : the SQLite database file, or ":memory:" for an index that is not persisted
+            osirix_service : the service used by the objects returned from queries, by default the one of the
+                             BrowserController of the last refresh
+        """
+        self.path = path
+        self.osirix_service = osirix_service
+        self._lock = threading.RLock()
+        self.connection = sqlite3.connect(path, check_same_thread=False)
+        self.connection.execute("PRAGMA foreign_keys = ON")
+        self.connection.executescript(SCHEMA)
+        self.connection.commit()
+
+    def close(self) -> None:
+        with self._lock:
+            self.connection.close()
+
+    def __enter__(self) -> MetadataCatalogue:
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self.close()
+
+    def execute(self, sql: str, parameters: Sequence[Any] = ()) -> List[sqlite3.Row]:
+        """
+        Runs a read query against the index
+
+        Args:
+            sql : the SQL statement
+            parameters : values of the statement placeholders
+
+        Returns:
+            list of rows, which can be indexed by column name
+        """
+        with self._lock:
+            cursor = self.connection.cursor()
+            cursor.row_factory = sqlite3.Row
+            return cursor.execute(sql, parameters).fetchall()
+
+    def _indexed_studies(self) -> Dict[str, Tuple[Optional[str], Optional[int]]]:
+        rows = self.execute("SELECT study_instance_uid, date_added, number_of_images FROM studies")
+        return {row[0]: (row[1], row[2]) for row in rows}
+
+    def refresh(self,
+                browser_controller,
+                include_images: bool = True,
+                full: bool = False,
+                workers: int = 16,
+                progress: Optional[Callable[[CrawlProgress], Any]] = None) -> RefreshStats:
+        """
+        Brings the index up to date with the Osirix database. The uid, date added and number of images of every
+        study are requested, and only new or changed studies are crawled in full; studies no longer in the database
+        are removed.
+
+        Args:
+            browser_controller : the BrowserController of the database
+            include_images : whether to index the images (SOP instance UID, instance number and path)
+            full : whether to re-crawl every study, e.g. after Osirix has been restarted
+            workers : the maximum number of requests in flight at once
+            progress : callback receiving a CrawlProgress
+
+        Returns:
+            RefreshStats
+        """
+        start = time.monotonic()
+        self.osirix_service = browser_controller.osirix_service
+        studies, _ = browser_controller.database_selection()
+        probe = MetadataCrawler(browser_controller, study_fields=PROBE_FIELDS, series_fields=(), workers=workers,
+                                progress=progress).crawl(studies)
+
+        indexed = self._indexed_studies()
+        present = {}
+        changed = []
+        unchanged = []
+        for i, study in enumerate(probe.study_objects):
+            osirixrpc_uid = probe.studies["uid"][i]
+            key = _key(probe.studies["study_instance_uid"][i], osirixrpc_uid)
+            date_added = _sql_value(probe.studies["date_added"][i])
+            number_of_images = _sql_value(probe.studies["number_of_images"][i])
+            present[key] = osirixrpc_uid
+            if not full and indexed.get(key) == (date_added, number_of_images):
+                unchanged.append(key)
+            else:
+                changed.append(study)
+        removed = [key for key in indexed if key not in present]
+
+        requests = probe.requests + 1
+        if len(changed) > 0:
+            crawl = MetadataCrawler(browser_controller, study_fields=STUDY_FIELDS, series_fields=SERIES_FIELDS,
+                                    image_fields=IMAGE_FIELDS if include_images else (), workers=workers,
+                                    progress=progress).crawl(changed)
+            requests += crawl.requests
+            self._store(crawl)
+
+        with self._lock, self.connection:
+            self.connection.executemany("DELETE FROM studies WHERE study_instance_uid = ?",
+                                        [(key,) for key in removed])
+            self.connection.executemany("UPDATE studies SET osirixrpc_uid = ? WHERE study_instance_uid = ?",
+                                        [(present[key], key) for key in unchanged])
+
+        n_added = len([key for key in present if key not in indexed])
+        return RefreshStats(studies_added=n_added,
+                            studies_updated=len(changed) - n_added,
+                            studies_removed=len(removed),
+                            studies_unchanged=len(unchanged),
+                            requests=requests,
+                            elapsed=time.monotonic() - start)
+
+    def _store(self, crawl: CrawlResult) -> None:
+        studies, series, images = crawl.studies, crawl.series, crawl.images
+        now = time.time()
+        study_keys = {}
+        study_rows = []
+        for row in _rows(studies, ("uid",) + STUDY_FIELDS):
+            osirixrpc_uid, study_instance_uid, patient_id, name, date, date_added, modalities, n_images = row
+            key = _key(study_instance_uid, osirixrpc_uid)
+            study_keys[osirixrpc_uid] = key
+            study_rows.append((key, osirixrpc_uid, patient_id, name, date, date_added, modalities, n_images, now))
+
+        series_keys = {}
+        series_rows = []
+        if "uid" in series:
+            for row in _rows(series, ("uid", "study_uid") + SERIES_FIELDS):
+                osirixrpc_uid, study_uid, series_instance_uid, name, description, modality, date, n_images = row
+                key = _key(series_instance_uid, osirixrpc_uid)
+                series_keys[osirixrpc_uid] = key
+                series_rows.append((key, study_keys[study_uid], osirixrpc_uid, name, description, modality, date,
+                                    n_images))
+
+        image_rows = []
+        if "uid" in images:
+            for row in _rows(images, ("uid", "series_uid") + IMAGE_FIELDS):
+                osirixrpc_uid, series_uid, sop_instance_uid, instance_number, path = row
+                image_rows.append((_key(sop_instance_uid, osirixrpc_uid), series_keys[series_uid], osirixrpc_uid,
+                                   instance_number, path))
+
+        with self._lock, self.connection:
+            # Replacing a study cascades to its old series and images
+            self.connection.executemany("DELETE FROM studies WHERE study_instance_uid = ?",
+                                        [(row[0],) for row in study_rows])
+            self.connection.executemany("INSERT INTO studies VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)", study_rows)
+            self.connection.executemany("INSERT OR REPLACE INTO series VALUES (?, ?, ?, ?, ?, ?, ?, ?)", series_rows)
+            self.connection.executemany("INSERT OR REPLACE INTO images VALUES (?, ?, ?, ?, ?)", image_rows)
+
+    def study(self, study_instance_uid: str) -> Optional[sqlite3.Row]:
+        """
+        Provides the indexed attributes of a study, or None if it is not indexed
+        """
+        rows = self.execute("SELECT * FROM studies WHERE study_instance_uid = ?", (study_instance_uid,))
+        return rows[0] if rows else None
+
+    def series(self, series_instance_uid: str) -> Optional[sqlite3.Row]:
+        """
+        Provides the indexed attributes of a series, or None if it is not indexed
+        """
+        rows = self.execute("SELECT * FROM series WHERE series_instance_uid = ?", (series_instance_uid,))
+        return rows[0] if rows else None
+
+    def series_of_study(self, study_instance_uid: str) -> List[sqlite3.Row]:
+        """
+        Provides the indexed attributes of the series of a study
+        """
+        return self.execute("SELECT * FROM series WHERE study_instance_uid = ? ORDER BY date, series_instance_uid",
+                            (study_instance_uid,))
+
+    def paths(self, series_instance_uid: str) -> Tuple[str, ...]:
+        """
+        Provides the file paths of the indexed images of a series, in instance number order
+        """
+        rows = self.execute("SELECT path FROM images WHERE series_instance_uid = ? ORDER BY instance_number, path",
+                            (series_instance_uid,))
+        return tuple(row[0] for row in rows)
+
+    def counts(self) -> Dict[str, int]:
+        """
+        Provides the number of indexed studies, series and images
+        """
+        return {table: self.execute("SELECT COUNT(*) FROM %s" % table)[0][0]
+                for table in ("studies", "series", "images")}
+
+    def query_series(self,
+                     modality: Union[str, Sequence[str], None] = None,
+                     description: Optional[str] = None,
+                     date_range: Optional[Tuple[DateLike, DateLike]] = None,
+                     date_added_range: Optional[Tuple[DateLike, DateLike]] = None,
+                     patient_id: Optional[str] = None,
+                     study_instance_uid: Optional[str] = None,
+                     limit: Optional[int] = None,
+                     pattern: bool = False) -> List[sqlite3.Row]:
+        """
+        Selects indexed series. All given criteria must match.
+
+        Args:
+            modality : a modality, or a sequence of modalities any of which may match
+            description : text found anywhere in the series description, case insensitive
+            date_range : (start, end) of the series date, inclusive; either bound may be None. A date as end bound
+                         includes that whole day.
+            date_added_range : (start, end) of the date the study was added to the database, inclusive
+            patient_id : the patient id of the study
+            study_instance_uid : the study instance uid
+            limit : the maximum number of series
+            pattern : whether description is an SQL LIKE pattern, where "%" and "_" are wildcards and "\\" escapes
+                      them, matched against the whole description
+
+        Returns:
+            list of rows of the series table, with the study date_added and patient_id, most recent first
+        """
+        clauses: List[str] = []
+        parameters: List[Any] = []
+        if modality is not None:
+            modalities = [modality] if isinstance(modality, str) else list(modality)
+            clauses.append("series.modality IN (%s)" % ", ".join("?" * len(modalities)))
+            parameters.extend(modalities)
+        if description is not None:
+            if not pattern:
+                description = "%" + like_escape(description) + "%"
+            clauses.append("series.series_description LIKE ? ESCAPE '\\'")
+            parameters.append(description)
+        _range_clause("series.date", date_range, clauses, parameters)
+        _range_clause("studies.date_added", date_added_range, clauses, parameters)
+        if patient_id is not None:
+            clauses.append("studies.patient_id = ?")
+            parameters.append(patient_id)
+        if study_instance_uid is not None:
+            clauses.append("series.study_instance_uid = ?")
+            parameters.append(study_instance_uid)
+
+        sql = "SELECT series.*, studies.date_added AS study_date_added, studies.patient_id AS patient_id " \
+              "FROM series JOIN studies ON series.study_instance_uid = studies.study_instance_uid"
+        if clauses:
+            sql += " WHERE " + " AND ".join(clauses)
+        sql += " ORDER BY series.date DESC, series.series_instance_uid"
+        if limit is not None:
+            sql += " LIMIT ?"
+            parameters.append(int(limit))
+        return self.execute(sql, parameters)
+
+    def find_series(self,
+                    modality: Union[str, Sequence[str], None] = None,
+                    description: Optional[str] = None,
+                    date_range: Optional[Tuple[DateLike, DateLike]] = None,
+                    date_added_range: Optional[Tuple[DateLike, DateLike]] = None,
+                    patient_id: Optional[str] = None,
+                    study_instance_uid: Optional[str] = None,
+                    limit: Optional[int] = None,
+                    pattern: bool = False) -> Tuple[DicomSeries, ...]:
+        """
+        Selects indexed series (see query_series) and provides them as DicomSeries, without any request to Osirix
+
+        Returns:
+            Tuple containing the matching DicomSeries, most recent first
+        """
+        if self.osirix_service is None:
+            raise ValueError("No Osirix service, refresh the catalogue or pass osirix_service first")
+        rows = self.query_series(modality=modality, description=description, date_range=date_range,
+                                 date_added_range=date_added_range, patient_id=patient_id,
+                                 study_instance_uid=study_instance_uid, limit=limit, pattern=pattern)
+        return tuple(DicomSeries(types_pb2.DicomSeries(osirixrpc_uid=row["osirixrpc_uid"]), self.osirix_service)
+                     for row in rows)
+
+    def find_studies(self,
+                     patient_id: Optional[str] = None,
+                     date_added_range: Optional[Tuple[DateLike, DateLike]] = None,
+                     limit: Optional[int] = None) -> Tuple[DicomStudy, ...]:
+        """
+        Selects indexed studies and provides them as DicomStudy, without any request to Osirix
+
+        Args:
+            patient_id : the patient id
+            date_added_range : (start, end) of the date the study was added to the database, inclusive
+            limit : the maximum number of studies
+
+        Returns:
+            Tuple containing the matching DicomStudy, most recently added first
+        """
+        if self.osirix_service is None:
+            raise ValueError("No Osirix service, refresh the catalogue or pass osirix_service first")
+        clauses: List[str] = []
+        parameters: List[Any] = []
+        if patient_id is not None:
+            clauses.append("patient_id = ?")
+            parameters.append(patient_id)
+        _range_clause("date_added", date_added_range, clauses, parameters)
+        sql = "SELECT osirixrpc_uid FROM studies"
+        if clauses:
+            sql += " WHERE " + " AND ".join(clauses)
+        sql += " ORDER BY date_added DESC"
+        if limit is not None:
+            sql += " LIMIT ?"
+            parameters.append(int(limit))
+        return tuple(DicomStudy(types_pb2.DicomStudy(osirixrpc_uid=row[0]), self.osirix_service)
+                     for row in self.execute(sql, parameters))
@@ -0,0 +1,199 @@
+from __future__ import annotations
+from dataclasses import dataclass
+from typing import Optional
+import math
+import threading
+import time
+
+import osirixgrpc.viewercontroller_pb2 as viewercontroller_pb2
+
+@dataclass(frozen=True)
+class CineStats:
+    """
+    Playback statistics of a CinePlayer
+    """
+    frames_shown: int
+    frames_skipped: int
+    target_fps: float
+    achieved_fps: float
+    jitter: float
+    mean_latency: float
+
+class CinePlayer(object):
+    '''
+    Class driving cine playback of a ViewerController on a background thread. Frame k is due at start + k / fps;
+    when a request returns late the frames whose deadline has already passed are skipped rather than queued, so
+    playback keeps to the requested rate. The set requests of all frames are built once before playback starts.
+    '''
+    AXES = ("slice", "movie")
+
+    def __init__(self,
+                 viewer_controller,
+                 axis: str = "slice",
+                 fps: float = 10.0,
+                 loop: bool = True,
+                 frames: Optional[int] = None):
+        """
+        Args:
+            viewer_controller : the ViewerController to play
+            axis : "slice" to step through idx, "movie" to step through movie_idx
+            fps : target frame rate
+            loop : whether to restart at the first frame after the last one
+            frames : number of frames to step through, by default all slices or all movie indices
+        """
+        if axis not in self.AXES:
+            raise ValueError("axis must be one of %s" % (self.AXES,))
+        if fps <= 0:
+            raise ValueError("fps must be positive")
+        self.viewer_controller = viewer_controller
+        self.axis = axis
+        self.fps = float(fps)
+        self.loop = loop
+
+        uid = viewer_controller.osirixrpc_uid
+        service = viewer_controller.osirix_service
+        if axis == "slice":
+            if frames is None:
+                frames = len(viewer_controller.pix_list(viewer_controller.movie_idx))
+            self._requests = [viewercontroller_pb2.ViewerControllerSetIdxRequest(viewer_controller=uid, idx=idx)
+                              for idx in range(frames)]
+            self._send = service.ViewerControllerSetIdx
+        else:
+            if frames is None:
+                frames = viewer_controller.max_movie_index()
+            self._requests = [viewercontroller_pb2.ViewerControllerSetMovieIdxRequest(viewer_controller=uid,
+                                                                                      movie_idx=movie_idx)
+                              for movie_idx in range(frames)]
+            self._send = service.ViewerControllerSetMovieIdx
+        if frames <= 0:
+            raise ValueError("There are no frames to play")
+
+        self._lock = threading.Lock()
+        self._stop_event = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        # Running totals rather than per-frame lists, so that a looping cine uses constant memory
+        self._shown = 0
+        self._first_shown = 0.0
+        self._last_shown = 0.0
+        self._total_latency = 0.0
+        self._late_frames = 0
+        self._mean_lateness = 0.0
+        self._lateness_m2 = 0.0
+        self._skipped = 0
+        self.error: Optional[BaseException] = None
+
+    @property
+    def frames(self) -> int:
+        return len(self._requests)
+
+    def _show(self, frame: int) -> None:
+        sent = time.monotonic()
+        response = self._send(self._requests[frame % len(self._requests)])
+        self.viewer_controller.response_processor.response_check(response)
+        # The viewer state changed behind the attribute cache
+        self.viewer_controller.invalidate_cache()
+        shown = time.monotonic()
+        with self._lock:
+            if self._shown == 0:
+                self._first_shown = shown
+            self._shown += 1
+            self._last_shown = shown
+            self._total_latency += shown - sent
+
+    def _run(self) -> None:
+        period = 1.0 / self.fps
+        start = time.monotonic()
+        next_frame = 0
+        try:
+            while not self._stop_event.is_set():
+                now = time.monotonic()
+                # The most recent frame whose deadline has passed; any frames in between are dropped
+                due = max(next_frame, int((now - start) / period))
+                if not self.loop:
+                    if next_frame >= len(self._requests):
+                        break
+                    # Frames running late never skip the last frame, which ends the playback
+                    due = min(due, len(self._requests) - 1)
+                with self._lock:
+                    self._skipped += due - next_frame
+                    self._add_lateness(now - (start + due * period))
+                self._show(due)
+                next_frame = due + 1
+                self._stop_event.wait(max(0.0, start + next_frame * period - time.monotonic()))
+        except BaseException as exc:
+            self.error = exc
+
+    def _add_lateness(self, lateness: float) -> None:
+        # Welford's update of the mean and sum of squared deviations
+        self._late_frames += 1
+        delta = lateness - self._mean_lateness
+        self._mean_lateness += delta / self._late_frames
+        self._lateness_m2 += delta * (lateness - self._mean_lateness)
+
+    def start(self) -> CinePlayer:
+        """
+        Starts playback on a background daemon thread
+        """
+        if self.running:
+            return self
+        self._stop_event.clear()
+        self._thread = threading.Thread(target=self._run, name="CinePlayer", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self, timeout: Optional[float] = None) -> CineStats:
+        """
+        Stops playback and waits for the background thread to finish
+
+        Returns:
+            CineStats
+        """
+        self._stop_event.set()
+        self.wait(timeout)
+        return self.stats()
+
+    def wait(self, timeout: Optional[float] = None) -> CineStats:
+        """
+        Waits for playback to end, which only happens on its own when not looping
+
+        Returns:
+            CineStats
+        """
+        if self._thread is not None:
+            self._thread.join(timeout)
+        return self.stats()
+
+    @property
+    def running(self) -> bool:
+        return self._thread is not None and self._thread.is_alive()
+
+    def stats(self) -> CineStats:
+        """
+        Provides the playback statistics so far. Jitter is the standard deviation of the lateness of the frames
+        shown relative to their deadlines.
+
+        Returns:
+            CineStats
+        """
+        with self._lock:
+            shown = self._shown
+            duration = self._last_shown - self._first_shown
+            total_latency = self._total_latency
+            late_frames = self._late_frames
+            lateness_m2 = self._lateness_m2
+            skipped = self._skipped
+        achieved_fps = 0.0
+        if shown > 1 and duration > 0:
+            achieved_fps = (shown - 1) / duration
+        return CineStats(frames_shown=shown,
+                         frames_skipped=skipped,
+                         target_fps=self.fps,
+                         achieved_fps=achieved_fps,
+                         jitter=math.sqrt(lateness_m2 / late_frames) if late_frames > 0 else 0.0,
+                         mean_latency=total_latency / shown if shown > 0 else 0.0)
+
+    def __enter__(self) -> CinePlayer:
+        return self.start()
+
+    def __exit__(self, *exc_info) -> None:
+        self.stop()
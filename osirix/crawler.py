@@ -0,0 +1,243 @@
+from __future__ import annotations
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+from typing import Any, Callable, Dict, List, Optional, Sequence, Tuple
+import datetime
+import threading
+import time
+
+from numpy import ndarray
+import grpc
+import numpy as np
+
+from osirix.exceptions import GrpcException
+
+# Errors of a single attribute request, after which the value is recorded as missing and the crawl carries on.
+# ValueError comes from building a datetime out of an empty or zero DICOM date.
+FETCH_ERRORS = (GrpcException, grpc.RpcError, AttributeError, ValueError)
+
+STUDY_FIELDS: Tuple[str, ...] = ("study_instance_uid", "patient_id", "name", "date", "date_added", "modalities",
+                                 "number_of_images")
+SERIES_FIELDS: Tuple[str, ...] = ("series_instance_uid", "name", "series_description", "modality", "date",
+                                  "number_of_images")
+IMAGE_FIELDS: Tuple[str, ...] = ()
+
+@dataclass(frozen=True)
+class CrawlProgress:
+    """
+    Progress of a MetadataCrawler, passed to its progress callback
+    """
+    stage: str
+    done: int
+    total: int
+    requests: int
+    elapsed: float
+
+    @property
+    def requests_per_second(self) -> float:
+        return self.requests / self.elapsed if self.elapsed > 0 else 0.0
+
+@dataclass
+class CrawlResult:
+    """
+    Columnar metadata tables produced by a MetadataCrawler. Each table maps a field name to a NumPy array with one
+    entry per object, plus "uid" (the osirixrpc_uid) and, for series and images, the uid of the parent.
+    Attributes that could not be retrieved are None.
+    """
+    studies: Dict[str, ndarray]
+    series: Dict[str, ndarray]
+    images: Dict[str, ndarray]
+    study_objects: Tuple[Any, ...] = ()
+    series_objects: Tuple[Any, ...] = ()
+    image_objects: Tuple[Any, ...] = ()
+    requests: int = 0
+    errors: int = 0
+    elapsed: float = 0.0
+    stage_times: Dict[str, float] = field(default_factory=dict)
+
+    @property
+    def requests_per_second(self) -> float:
+        return self.requests / self.elapsed if self.elapsed > 0 else 0.0
+
+def fetch_attribute(obj, name: str) -> Any:
+    """
+    Retrieves a property, or calls a method without arguments, of a pyOsirix object
+    """
+    value = getattr(obj, name)
+    if callable(value):
+        value = value()
+    return value
+
+def to_column(values: Sequence[Any]) -> ndarray:
+    """
+    Converts the values of one field into a NumPy array: datetimes become datetime64[s], missing values (None) and
+    mixed types are kept in an object array
+    """
+    present = [value for value in values if value is not None]
+    if len(present) == len(values) and len(values) > 0:
+        if all(isinstance(value, datetime.datetime) for value in values):
+            return np.array(values, dtype="datetime64[s]")
+        if all(isinstance(value, (str, int, float, bool)) for value in values) and \
+                len(set(type(value) for value in values)) == 1:
+            return np.array(values)
+    column = np.empty(len(values), dtype=object)
+    column[:] = list(values)
+    return column
+
+class MetadataCrawler(object):
+    '''
+    Class visiting the studies, series and images of the Osirix database and collecting attributes into columnar
+    tables. Every attribute is one request, so requests are made concurrently by a bounded pool of workers.
+    '''
+
+    def __init__(self,
+                 browser_controller,
+                 study_fields: Sequence[str] = STUDY_FIELDS,
+                 series_fields: Sequence[str] = SERIES_FIELDS,
+                 image_fields: Sequence[str] = IMAGE_FIELDS,
+                 workers: int = 16,
+                 progress: Optional[Callable[[CrawlProgress], Any]] = None,
+                 progress_interval: float = 1.0):
+        """
+        Args:
+            browser_controller : the BrowserController of the database
+            study_fields : DicomStudy attributes to collect
+            series_fields : DicomSeries attributes to collect, series are skipped if empty and no image fields
+            image_fields : DicomImage attributes to collect, images are skipped if empty
+            workers : the maximum number of requests in flight at once
+            progress : callback receiving a CrawlProgress at most every progress_interval seconds and at the end
+                       of each stage
+            progress_interval : seconds between progress reports
+        """
+        self.browser_controller = browser_controller
+        self.study_fields = tuple(study_fields)
+        self.series_fields = tuple(series_fields)
+        self.image_fields = tuple(image_fields)
+        self.workers = workers
+        self.progress = progress
+        self.progress_interval = progress_interval
+        self._lock = threading.Lock()
+        self._requests = 0
+        self._errors = 0
+        self._start = 0.0
+        self._last_report = 0.0
+
+    def _count(self, requests: int = 1, errors: int = 0) -> None:
+        with self._lock:
+            self._requests += requests
+            self._errors += errors
+
+    def _report(self, stage: str, done: int, total: int, force: bool = False) -> None:
+        if self.progress is None:
+            return
+        now = time.monotonic()
+        with self._lock:
+            if not force and now - self._last_report < self.progress_interval:
+                return
+            self._last_report = now
+            requests = self._requests
+        self.progress(CrawlProgress(stage=stage, done=done, total=total, requests=requests,
+                                    elapsed=now - self._start))
+
+    def _fetch(self, obj, name: str) -> Any:
+        try:
+            value = fetch_attribute(obj, name)
+        except FETCH_ERRORS:
+            self._count(errors=1)
+            return None
+        self._count()
+        return value
+
+    def _run(self, executor: ThreadPoolExecutor, stage: str, function, items: Sequence[Any]) -> List[Any]:
+        results = []
+        for done, result in enumerate(executor.map(function, items), start=1):
+            results.append(result)
+            self._report(stage, done, len(items))
+        self._report(stage, len(items), len(items), force=True)
+        return results
+
+    def _table(self, executor: ThreadPoolExecutor, stage: str, objects: Sequence[Any], fields: Sequence[str],
+               parents: Optional[Sequence[str]] = None, parent_key: str = "") -> Dict[str, ndarray]:
+        # The crawl is meant to see the current state of the database, so values cached on the objects are dropped
+        for obj in objects:
+            invalidate = getattr(obj, "invalidate_cache", None)
+            if invalidate is not None:
+                invalidate()
+        tasks = [(obj, name) for obj in objects for name in fields]
+        values = self._run(executor, stage, lambda task: self._fetch(*task), tasks)
+        table = {"uid": to_column([obj.osirixrpc_uid.osirixrpc_uid for obj in objects])}
+        if parents is not None:
+            table[parent_key] = to_column(list(parents))
+        n_fields = len(fields)
+        for i, name in enumerate(fields):
+            table[name] = to_column(values[i::n_fields] if n_fields > 0 else [])
+        return table
+
+    def _children(self, executor: ThreadPoolExecutor, stage: str, parents: Sequence[Any],
+                  attribute: str) -> Tuple[List[Any], List[str]]:
+        children = self._run(executor, stage, lambda parent: self._fetch(parent, attribute), parents)
+        objects, parent_uids = [], []
+        for parent, parent_children in zip(parents, children):
+            for child in parent_children or ():
+                objects.append(child)
+                parent_uids.append(parent.osirixrpc_uid.osirixrpc_uid)
+        return objects, parent_uids
+
+    def crawl(self, studies: Optional[Sequence[Any]] = None) -> CrawlResult:
+        """
+        Visits studies, then the series of each study, then the images of each series, collecting the requested
+        attributes
+
+        Args:
+            studies : the DicomStudy objects to visit, by default all studies of the database
+
+        Returns:
+            CrawlResult
+        """
+        with self._lock:
+            self._requests = 0
+            self._errors = 0
+        self._start = time.monotonic()
+        stage_times: Dict[str, float] = {}
+
+        if studies is None:
+            studies, _ = self.browser_controller.database_selection()
+            self._count()
+        studies = list(studies)
+        series: List[Any] = []
+        series_parents: List[str] = []
+        images: List[Any] = []
+        image_parents: List[str] = []
+        empty: Dict[str, ndarray] = {}
+
+        with ThreadPoolExecutor(max_workers=max(1, self.workers)) as executor:
+            stage_start = time.monotonic()
+            study_table = self._table(executor, "studies", studies, self.study_fields)
+            stage_times["studies"] = time.monotonic() - stage_start
+
+            series_table = empty
+            if self.series_fields or self.image_fields:
+                stage_start = time.monotonic()
+                series, series_parents = self._children(executor, "study series", studies, "series")
+                series_table = self._table(executor, "series", series, self.series_fields, series_parents,
+                                           "study_uid")
+                stage_times["series"] = time.monotonic() - stage_start
+
+            image_table = empty
+            if self.image_fields:
+                stage_start = time.monotonic()
+                images, image_parents = self._children(executor, "series images", series, "images")
+                image_table = self._table(executor, "images", images, self.image_fields, image_parents,
+                                          "series_uid")
+                stage_times["images"] = time.monotonic() - stage_start
+
+        return CrawlResult(studies=study_table,
+                           series=series_table,
+                           images=image_table,
+                           study_objects=tuple(studies),
+                           series_objects=tuple(series),
+                           image_objects=tuple(images),
+                           requests=self._requests,
+                           errors=self._errors,
+                           elapsed=time.monotonic() - self._start,
+                           stage_times=stage_times)
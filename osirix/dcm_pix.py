@@ -12,20 +12,19 @@ import osirixgrpc.vrcontroller_pb2 as vrcontroller_pb2
 import osirixgrpc.dcmpix_pb2 as dcmpix_pb2
 import osirixgrpc.roi_pb2 as roi_pb2
 from osirix.dicom import DicomSeries, DicomStudy, DicomImage
-from osirix.response_processor import ResponseProcessor
+from osirix.osirix_object import OsirixObject
+from osirix.geometry import pixel_to_patient_affine
 
-class DCMPix(object):
+class DCMPix(OsirixObject):
     '''
     Class representing the properties and methods to communicate with the Osirix service through
     gRPC for DCMPix
     '''
+    __slots__ = ("_affine", "_is_rgb", "_slice_location", "_orientation", "_origin", "_pixel_spacing", "_shape",
+                 "_source_file")
 
-    def __init__(self,
-                 osirixrpc_uid,
-                 osirix_service):
-        self.response_processor = ResponseProcessor()
-        self.osirixrpc_uid = osirixrpc_uid
-        self.osirix_service = osirix_service
+    def _setup(self) -> None:
+        self._affine = None
 
     @property
     def is_rgb(self) -> bool:
@@ -104,6 +103,21 @@ class DCMPix(object):
 
         return self._pixel_spacing
 
+    def affine(self, refresh: bool = False) -> ndarray:
+        """
+        Provides the transform from pixel to patient coordinates of the DCMPix, built from its origin,
+        orientation and pixel spacing. The result is cached on the DCMPix.
+
+        Args:
+            bool : refresh, whether to request the geometry again
+
+        Returns:
+            ndarray : (3, 3) matrix A such that patient = A @ (x, y, 1)
+        """
+        if self._affine is None or refresh:
+            self._affine = pixel_to_patient_affine(self.origin, self.orientation, self.pixel_spacing)
+        return self._affine
+
     @property
     def shape(self) -> Tuple[int]:
         """
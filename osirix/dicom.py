@@ -1,27 +1,56 @@
 from __future__ import annotations
 
+import dataclasses
 import datetime
 import sys
+from concurrent.futures import ThreadPoolExecutor
 # sys.path.append("./pb2")
 import osirixgrpc.osirix_pb2_grpc as osirix_pb2_grpc
-from typing import Tuple
-from osirix.response_processor import ResponseProcessor
-
-class DicomStudy(object):
+from typing import Iterator, Optional, Tuple
+from functools import partial
+from osirix.osirix_object import CachedOsirixObject
+from osirix.cache import IMMUTABLE, cached_attribute
+from osirix.lazy_sequence import LazySequence
+from osirix.local_loader import load_files, LocalVolume
+from osirix.slice_order import SliceOrder, geometric_order
+from osirix.exceptions import GrpcException
+from osirix.traversal import SeriesTraversal
+
+# Time to live in seconds of cached attributes that change when files are added to or removed from the database
+VOLATILE_TTL = 5.0
+
+class DicomStudy(CachedOsirixObject):
     '''
     Class representing the properties and methods to communicate with the Osirix service through
     gRPC for a study
     '''
-
-    def __init__(self,
-                 osirixrpc_uid : str,
-                 osirix_service : osirix_pb2_grpc.OsiriXServiceStub,
-                 ):
-        self.response_processor = ResponseProcessor()
-        self.osirixrpc_uid = osirixrpc_uid
-        self.osirix_service = osirix_service
+    __slots__ = ("_date_added", "_date_of_birth", "_institution_name", "_modalities", "_name", "_patient_id",
+                 "_patient_sex", "_patient_uid", "_performing_physician", "_referring_physician", "_series",
+                 "_study_instance_uid", "_study_number_of_images", "_study_study_name")
+
+    CACHE_POLICY = {
+        "date": IMMUTABLE,
+        "date_added": IMMUTABLE,
+        "date_of_birth": IMMUTABLE,
+        "institution_name": IMMUTABLE,
+        "name": IMMUTABLE,
+        "patient_id": IMMUTABLE,
+        "patient_sex": IMMUTABLE,
+        "patient_uid": IMMUTABLE,
+        "performing_physician": IMMUTABLE,
+        "referring_physician": IMMUTABLE,
+        "study_instance_uid": IMMUTABLE,
+        "study_name": IMMUTABLE,
+        "modalities": VOLATILE_TTL,
+        "number_of_images": VOLATILE_TTL,
+        "no_files": VOLATILE_TTL,
+        "no_files_excluding_multframes": VOLATILE_TTL,
+        "paths": VOLATILE_TTL,
+        "raw_no_files": VOLATILE_TTL,
+    }
 
     @property
+    @cached_attribute
     def date(self) -> datetime.datetime:
         """
         Provides the datetime associated with the DicomStudy
@@ -48,6 +77,7 @@ class DicomStudy(object):
     #     self._date = response
 
     @property
+    @cached_attribute
     def date_added(self) -> datetime.datetime:
         """
         Provides date added associated with the DicomStudy
@@ -73,6 +103,7 @@ class DicomStudy(object):
     #     self._date_added = response
 
     @property
+    @cached_attribute
     def date_of_birth(self) -> datetime.datetime:
         """
         Provides the date of the birth for the patient associated with the DicomStudy
@@ -90,6 +121,7 @@ class DicomStudy(object):
         return self._date_of_birth
 
     @property
+    @cached_attribute
     def institution_name(self) -> str:
         """
         Provides institution name associated with the DicomStudy
@@ -107,6 +139,7 @@ class DicomStudy(object):
     #     self._institution_name = response
 
     @property
+    @cached_attribute
     def modalities(self) -> str:
         """
         Provides the modalities associated with the DicomStudy
@@ -120,6 +153,7 @@ class DicomStudy(object):
         return self._modalities
 
     @property
+    @cached_attribute
     def name(self) -> str:
         """
         Provides name associated with the DicomStudy
@@ -133,6 +167,7 @@ class DicomStudy(object):
         return self._name
 
     @property
+    @cached_attribute
     def number_of_images(self) -> int:
         """
         Provides number of images associated with the DicomStudy
@@ -146,6 +181,7 @@ class DicomStudy(object):
         return self._study_number_of_images
 
     @property
+    @cached_attribute
     def patient_id(self) -> str:
         """
         Provides id of the patient associated with the DicomStudy
@@ -159,6 +195,7 @@ class DicomStudy(object):
         return self._patient_id
 
     @property
+    @cached_attribute
     def patient_sex(self) -> str:
         """
         Provides sex of the patient associated with the DicomStudy
@@ -172,6 +209,7 @@ class DicomStudy(object):
         return self._patient_sex
 
     @property
+    @cached_attribute
     def patient_uid(self) -> str:
         """
         Provides uid of the patient associated with the DicomStudy
@@ -186,6 +224,7 @@ class DicomStudy(object):
 
     #TODO
     @property
+    @cached_attribute
     def performing_physician(self) -> str:
         """
         Provides the performing physician associated with the DicomStudy
@@ -200,6 +239,7 @@ class DicomStudy(object):
 
     #TODO
     @property
+    @cached_attribute
     def referring_physician(self) -> str:
         """
         Provides referring physician associated with the DicomStudy
@@ -214,27 +254,21 @@ class DicomStudy(object):
 
     #TODO
     @property
-    def series(self) -> Tuple[DicomSeries, ...]:
+    def series(self) -> LazySequence[DicomSeries]:
         """
         Provides all the series associated with the DicomStudy
         Returns:
-            Tuple containing all the DicomSeries for the study
+            LazySequence containing all the DicomSeries for the study
         """
         response_study_series = self.osirix_service.DicomStudySeries(self.osirixrpc_uid)
         self.response_processor.response_check(response_study_series)
-        dicom_series_tuple : Tuple[DicomSeries, ...] = ()
-
-        for series in response_study_series.series:
-            # print(series.osirixrpc_uid)
-            # series_tuple = series_tuple + (series.osirixrpc_uid,)
-            dicom_series = DicomSeries(series, self.osirix_service)
-            dicom_series_tuple = dicom_series_tuple + (dicom_series,)
-
-        self._series = dicom_series_tuple
+        self._series = LazySequence(response_study_series.series,
+                                    partial(DicomSeries, osirix_service=self.osirix_service))
 
         return self._series
 
     @property
+    @cached_attribute
     def study_instance_uid(self) -> str:
         """
         Provides study instance uid associated with the DicomStudy
@@ -248,6 +282,7 @@ class DicomStudy(object):
         return self._study_instance_uid
 
     @property
+    @cached_attribute
     def study_name(self) -> str:
         """
         Provides the study name associated with the DicomStudy
@@ -261,6 +296,7 @@ class DicomStudy(object):
         return self._study_study_name
 
 
+    @cached_attribute
     def no_files(self) -> int:
         """
         Provides number of files associated with the DicomStudy
@@ -273,41 +309,30 @@ class DicomStudy(object):
 
         return study_no_of_files
 
-    def images(self) -> Tuple[DicomImage, ...]:
+    def images(self) -> LazySequence[DicomImage]:
         """
         Provides all the images associated with the DicomStudy
         Returns:
-            Tuple containing all the DicomImage for the study
+            LazySequence containing all the DicomImage for the study
         """
 
         response_study_images = self.osirix_service.DicomStudyImages(self.osirixrpc_uid)
         self.response_processor.response_check(response_study_images)
 
-        dicom_image_tuple : Tuple[DicomImage, ...] = ()
+        return LazySequence(response_study_images.images, partial(DicomImage, osirix_service=self.osirix_service))
 
-        for image in response_study_images.images:
-            dicom_image = DicomImage(image, self.osirix_service)
-            dicom_image_tuple = dicom_image_tuple + (dicom_image,)
-
-        return dicom_image_tuple
-
-    def image_series(self) -> Tuple[DicomSeries, ...]:
+    def image_series(self) -> LazySequence[DicomSeries]:
         """
         Provides all the series associated with the DicomStudy
         Returns:
-            Tuple containing all the DicomSeries for the study
+            LazySequence containing all the DicomSeries for the study
         """
         response_study_series = self.osirix_service.DicomStudySeries(self.osirixrpc_uid)
         self.response_processor.response_check(response_study_series)
 
-        dicom_series_tuple : Tuple[DicomSeries, ...] = ()
-
-        for series in response_study_series.series:
-            dicom_series = DicomSeries(series, self.osirix_service)
-            dicom_series_tuple = dicom_series_tuple + (dicom_series,)
-
-        return dicom_series_tuple
+        return LazySequence(response_study_series.series, partial(DicomSeries, osirix_service=self.osirix_service))
 
+    @cached_attribute
     def no_files_excluding_multframes(self) -> int:
         """
         Provides number of files excluding multiple frames associated with the DicomStudy
@@ -321,6 +346,7 @@ class DicomStudy(object):
 
         return study_no_of_files_excl_multiframes
 
+    @cached_attribute
     def paths(self) -> Tuple[str, ...]:
         """
         Provides the paths associated with the DicomStudy
@@ -334,6 +360,7 @@ class DicomStudy(object):
 
         return study_paths
 
+    @cached_attribute
     def raw_no_files(self) -> int:
         """
         Provides the raw number of files associated with the DicomStudy
@@ -346,21 +373,39 @@ class DicomStudy(object):
 
         return study_raw_no_of_files
 
-class DicomSeries(object):
+    def traverse_series(self, direction: str = "next", workers: int = 8) -> Iterator[DicomSeries]:
+        """
+        Iterates over the series of the DicomStudy in next_series (or previous_series) order. The links of all
+        series are requested concurrently and a link back to a visited series ends the walk.
+        Args:
+            direction : "next" or "previous"
+            workers : the maximum number of requests in flight at once
+        Returns:
+            Iterator over DicomSeries
+        """
+        return SeriesTraversal(direction=direction, workers=workers).study(self)
+
+class DicomSeries(CachedOsirixObject):
     '''
     Class representing the properties and methods to communicate with the Osirix service through
     gRPC for a series
     '''
-
-    def __init__(self,
-                 osirixrpc_uid: str,
-                 osirix_service: osirix_pb2_grpc.OsiriXServiceStub
-                 ):
-        self.response_processor = ResponseProcessor()
-        self.osirixrpc_uid = osirixrpc_uid
-        self.osirix_service = osirix_service
+    __slots__ = ("_date", "_images", "_modality", "_name", "_number_of_images", "_series_description",
+                 "_series_instance_uid", "_sop_class_uid", "_study")
+
+    CACHE_POLICY = {
+        "date": IMMUTABLE,
+        "modality": IMMUTABLE,
+        "name": IMMUTABLE,
+        "series_description": IMMUTABLE,
+        "series_instance_uid": IMMUTABLE,
+        "sop_class_uid": IMMUTABLE,
+        "number_of_images": VOLATILE_TTL,
+        "paths": VOLATILE_TTL,
+    }
 
     @property
+    @cached_attribute
     def date(self) -> datetime.datetime:
         """
         Provides the date associated with the DicomSeries
@@ -384,26 +429,22 @@ class DicomSeries(object):
     #     self._date = response
 
     @property
-    def images(self) -> Tuple[DicomImage, ...]:
+    def images(self) -> LazySequence[DicomImage]:
         """
         Provides the images associated with the DicomSeries
         Returns:
-            A Tuple containing the DicomImages in the series
+            A LazySequence containing the DicomImages in the series
         """
         response_series_images = self.osirix_service.DicomSeriesImages(self.osirixrpc_uid)
         self.response_processor.response_check(response_series_images)
 
-        dicom_image_tuple : Tuple[DicomImage, ...] = ()
-
-        for image in response_series_images.images:
-            dicom_image = DicomImage(image, self.osirix_service)
-            dicom_image_tuple = dicom_image_tuple + (dicom_image,)
-
-        self._images = dicom_image_tuple
+        self._images = LazySequence(response_series_images.images,
+                                    partial(DicomImage, osirix_service=self.osirix_service))
 
         return self._images
 
     @property
+    @cached_attribute
     def modality(self) -> str:
         response_series_modality = self.osirix_service.DicomSeriesModality(self.osirixrpc_uid)
         self.response_processor.response_check(response_series_modality)
@@ -412,6 +453,7 @@ class DicomSeries(object):
         return self._modality
 
     @property
+    @cached_attribute
     def name(self) -> str:
         """
         Provides thename associated with the DicomSeries
@@ -427,6 +469,7 @@ class DicomSeries(object):
     #TODO
     #No number of images for Dicom Series response
     @property
+    @cached_attribute
     def number_of_images(self) -> int:
         """
         Provides the number of images in the the DicomSeries
@@ -440,6 +483,7 @@ class DicomSeries(object):
         return self._number_of_images
 
     @property
+    @cached_attribute
     def series_description(self) -> str:
         """
         Provides the description of the DicomSeries
@@ -453,6 +497,7 @@ class DicomSeries(object):
         return self._series_description
 
     @property
+    @cached_attribute
     def series_instance_uid(self) -> str:
         """
         Provides the series instance uid associated with the DicomSeries
@@ -466,6 +511,7 @@ class DicomSeries(object):
         return self._series_instance_uid
 
     @property
+    @cached_attribute
     def sop_class_uid(self) -> str:
         """
         Provides the sop class uid associated with the DicomSeries
@@ -507,6 +553,21 @@ class DicomSeries(object):
 
         return series_next_series_obj
 
+    def walk(self, direction: str = "next", max_hops: Optional[int] = None,
+             prefetch: int = 8) -> Iterator[DicomSeries]:
+        """
+        Iterates from this series along next_series (or previous_series), starting with this series. Links are
+        requested in the background ahead of the consumer and a link back to a visited series ends the walk.
+        Args:
+            direction : "next" or "previous"
+            max_hops : the maximum number of links followed, unlimited if None
+            prefetch : the maximum number of series requested ahead of the consumer
+        Returns:
+            Iterator over DicomSeries
+        """
+        return SeriesTraversal(direction=direction, prefetch=prefetch).walk(self, max_hops=max_hops)
+
+    @cached_attribute
     def paths(self) -> Tuple[str, ...]:
         """
         Provides the paths for the series
@@ -520,6 +581,15 @@ class DicomSeries(object):
 
         return series_paths
 
+    def load_volume(self, processes: int = 4) -> LocalVolume:
+        """
+        Reads the files of the DicomSeries directly from disk with pydicom in a process pool, applying rescale slope
+        and intercept. Requires the files to be reachable from this machine.
+        Returns:
+           LocalVolume : the volume sorted along the slice normal (or by instance number) and its paths in order
+        """
+        return load_files(self.paths(), processes=processes, sort=True)
+
     def previous_series(self) -> DicomSeries:
         """
         Provides the previous series in the study
@@ -535,38 +605,65 @@ class DicomSeries(object):
 
         return series_previous_series_obj
 
-    def sorted_images(self) -> Tuple[DicomImage, ...]:
+    def sorted_images(self) -> LazySequence[DicomImage]:
         """
         Provides the sorted images associated with the DicomSeries
         Returns:
-           A Tuple containing DicomImage that are sorted
+           A LazySequence containing DicomImage that are sorted
         """
         response_series_sorted_images = self.osirix_service.DicomSeriesSortedImages(self.osirixrpc_uid)
         self.response_processor.response_check(response_series_sorted_images)
 
-        dicom_image_tuple : Tuple[DicomImage, ...] = ()
+        return LazySequence(response_series_sorted_images.sorted_images,
+                            partial(DicomImage, osirix_service=self.osirix_service))
 
-        for sorted_image in response_series_sorted_images.sorted_images:
-            dicom_image = DicomImage(sorted_image, self.osirix_service)
-            dicom_image_tuple = dicom_image_tuple + (dicom_image,)
+    def geometric_order(self, workers: int = 16, tolerance: float = 0.01) -> SliceOrder:
+        """
+        Sorts the images of the DicomSeries by slice location, breaking ties by instance number, and reports
+        duplicate locations and gaps. The locations and instance numbers of all images are requested concurrently.
+        Args:
+           workers : the maximum number of requests in flight at once
+           tolerance : fraction of the slice spacing below which locations are duplicates (see geometric_order)
+        Returns:
+           SliceOrder : the sorted order, with the DicomImage objects in that order
+        """
+        images = self.images
 
-        return dicom_image_tuple
+        def fetch(image, name):
+            try:
+                return getattr(image, name)
+            except GrpcException:
+                return None
 
-class DicomImage(object):
+        with ThreadPoolExecutor(max_workers=max(1, workers)) as executor:
+            locations = executor.map(fetch, images, ["slice_location"] * len(images))
+            numbers = executor.map(fetch, images, ["instance_number"] * len(images))
+            locations, numbers = list(locations), list(numbers)
+
+        order = geometric_order(locations, numbers, tolerance=tolerance)
+        return dataclasses.replace(order, images=tuple(images[int(i)] for i in order.order))
+
+class DicomImage(CachedOsirixObject):
     '''
     Class representing the properties and methods to communicate with the Osirix service through
     gRPC for an image
     '''
-
-    def __init__(self,
-                 osirixrpc_uid : str,
-                 osirix_service : osirix_pb2_grpc.OsiriXServiceStub
-                 ):
-        self.response_processor = ResponseProcessor()
-        self.osirixrpc_uid = osirixrpc_uid
-        self.osirix_service = osirix_service
+    __slots__ = ("_date", "_instance_number", "_modality", "_number_of_frames", "_series", "_slice_location")
+
+    CACHE_POLICY = {
+        "date": IMMUTABLE,
+        "instance_number": IMMUTABLE,
+        "modality": IMMUTABLE,
+        "number_of_frames": IMMUTABLE,
+        "slice_location": IMMUTABLE,
+        "complete_path": IMMUTABLE,
+        "height": IMMUTABLE,
+        "sop_instance_uid": IMMUTABLE,
+        "width": IMMUTABLE,
+    }
 
     @property
+    @cached_attribute
     def date(self) -> datetime.datetime:
         """
         Provides the datetime for the DicomImage
@@ -587,6 +684,7 @@ class DicomImage(object):
         return self._date
 
     @property
+    @cached_attribute
     def instance_number(self) -> int:
         """
         Provides the instance number for the DicomImage
@@ -599,6 +697,7 @@ class DicomImage(object):
         return self._instance_number
 
     @property
+    @cached_attribute
     def modality(self) -> str:
         """
         Provides the modality for the DicomImage
@@ -611,6 +710,7 @@ class DicomImage(object):
         return self._modality
 
     @property
+    @cached_attribute
     def number_of_frames(self) -> int:
         """
         Provides the number of frames for the DicomImage
@@ -640,6 +740,7 @@ class DicomImage(object):
         return self._series
 
     @property
+    @cached_attribute
     def slice_location(self) -> float:
         """
         Provides the instance number for the DicomImage
@@ -654,6 +755,7 @@ class DicomImage(object):
 
         return self._slice_location
 
+    @cached_attribute
     def complete_path(self) -> str:
         """
         Provides the complete path for the DicomImage
@@ -669,6 +771,7 @@ class DicomImage(object):
 
         return image_complete_path
 
+    @cached_attribute
     def height(self) -> int:
         """
         Provides the height for the DicomImage
@@ -684,6 +787,7 @@ class DicomImage(object):
 
         return image_height
 
+    @cached_attribute
     def sop_instance_uid(self) -> str:
         """
         Provides the sop_instance_uid for the DicomImage
@@ -699,6 +803,7 @@ class DicomImage(object):
 
         return image_sop_instance_uid
 
+    @cached_attribute
     def width(self) -> int:
         """
         Provides the width for the DicomImage
@@ -0,0 +1,143 @@
+from __future__ import annotations
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from typing import Sequence
+import struct
+
+from numpy import ndarray
+import numpy as np
+
+from osirix.geometry import volume_affine
+
+FORMATS = ("nifti", "npy")
+
+# NIfTI-1 datatype codes
+NIFTI_DATATYPES = {np.dtype(np.uint8): 2,
+                   np.dtype(np.int16): 4,
+                   np.dtype(np.int32): 8,
+                   np.dtype(np.float32): 16,
+                   np.dtype(np.float64): 64}
+
+NIFTI_HEADER_FORMAT = "<i10s18sihcc8h3f4h8ffffhccffffii80s24shh6f4f4f4f16s4s"
+NIFTI_VOX_OFFSET = 352
+
+def nifti_affine(affine: ndarray) -> ndarray:
+    """
+    Converts a (slice, row, column) voxel to LPS patient transform into the NIfTI (column, row, slice) voxel to
+    RAS transform
+
+    Args:
+        affine : (4, 4) transform from volume_affine
+
+    Returns:
+        ndarray : (4, 4) NIfTI sform
+    """
+    sform = np.eye(4)
+    sform[0:3, 0] = affine[0:3, 2]
+    sform[0:3, 1] = affine[0:3, 1]
+    sform[0:3, 2] = affine[0:3, 0]
+    sform[0:3, 3] = affine[0:3, 3]
+    sform[0:2, :] *= -1
+    return sform
+
+def nifti_header(shape: Sequence[int], affine: ndarray, dtype, description: str = "") -> bytes:
+    """
+    Builds a single-file NIfTI-1 header, including the empty extension flag, for a (slices, rows, columns) volume
+
+    Args:
+        shape : (slices, rows, columns) of the volume
+        affine : (4, 4) voxel-to-patient transform from volume_affine
+        dtype : dtype of the voxel data
+        description : text stored in the descrip field
+
+    Returns:
+        bytes : the NIFTI_VOX_OFFSET bytes preceding the voxel data
+    """
+    dtype = np.dtype(dtype)
+    if dtype not in NIFTI_DATATYPES:
+        raise ValueError("Unsupported NIfTI dtype %s" % dtype)
+    n_slices, rows, columns = shape
+    sform = nifti_affine(affine)
+    spacing = np.linalg.norm(sform[0:3, 0:3], axis=0)
+    header = struct.pack(NIFTI_HEADER_FORMAT,
+                         348, b"", b"", 0, 0, b"r", b"\0",
+                         3, columns, rows, n_slices, 1, 1, 1, 1,
+                         0.0, 0.0, 0.0,
+                         0, NIFTI_DATATYPES[dtype], dtype.itemsize * 8, 0,
+                         1.0, spacing[0], spacing[1], spacing[2], 1.0, 1.0, 1.0, 1.0,
+                         float(NIFTI_VOX_OFFSET), 1.0, 0.0,
+                         0, b"\0", b"\x02",
+                         0.0, 0.0, 0.0, 0.0,
+                         0, 0,
+                         description.encode("ascii", "replace")[:79], b"",
+                         0, 1,
+                         0.0, 0.0, 0.0, 0.0, 0.0, 0.0,
+                         *sform[0], *sform[1], *sform[2],
+                         b"", b"n+1\0")
+    return header + b"\0\0\0\0"
+
+def export_volume(viewer_controller,
+                  path: str,
+                  format: str = "nifti",
+                  movie_idx: int = None,
+                  workers: int = 4,
+                  dtype=np.float32) -> str:
+    """
+    Streams the slices of a ViewerController into a pre-sized NIfTI-1 (.nii) or NumPy (.npy) file. Slices are
+    written through a memory map as they arrive and at most 2 * workers slices are held at once, so memory use does
+    not depend on the size of the series.
+
+    Args:
+        viewer_controller : the ViewerController to export
+        path : the output file
+        format : "nifti" or "npy"
+        movie_idx : the movie index to export, the current movie index if None
+        workers : the maximum number of image requests in flight at once
+        dtype : dtype of the stored voxels
+
+    Returns:
+        str : the output path
+    """
+    if format not in FORMATS:
+        raise ValueError("format must be one of %s" % (FORMATS,))
+    if format == "nifti" and path.endswith(".gz"):
+        raise ValueError("Compressed NIfTI cannot be streamed, export to .nii instead")
+    if movie_idx is None:
+        movie_idx = viewer_controller.movie_idx
+    pix_list = viewer_controller.pix_list(movie_idx)
+    if len(pix_list) == 0:
+        raise ValueError("The viewer has no slices to export")
+    rows, columns = pix_list[0].shape
+    shape = (len(pix_list), rows, columns)
+
+    if format == "npy":
+        output = np.lib.format.open_memmap(path, mode="w+", dtype=dtype, shape=shape)
+    else:
+        header = nifti_header(shape, viewer_controller.volume_affine(movie_idx, workers=workers), dtype,
+                              description=viewer_controller.title)
+        with open(path, "wb") as file:
+            file.write(header)
+            file.truncate(NIFTI_VOX_OFFSET + int(np.prod(shape)) * np.dtype(dtype).itemsize)
+        # NIfTI stores x (column) fastest, then y (row), then z (slice), i.e. C order for (slices, rows, columns)
+        output = np.memmap(path, mode="r+", dtype=dtype, offset=NIFTI_VOX_OFFSET, shape=shape)
+
+    try:
+        with ThreadPoolExecutor(max_workers=max(1, workers)) as executor:
+            pending = deque()
+            for slice_idx, pix in enumerate(pix_list):
+                pending.append((slice_idx, executor.submit(lambda pix: pix.image, pix)))
+                if len(pending) >= 2 * max(1, workers):
+                    done_idx, future = pending.popleft()
+                    output[done_idx] = _greyscale(future.result(), (rows, columns))
+            while pending:
+                done_idx, future = pending.popleft()
+                output[done_idx] = _greyscale(future.result(), (rows, columns))
+        output.flush()
+    finally:
+        del output
+    return path
+
+def _greyscale(image: ndarray, shape) -> ndarray:
+    if image.shape != tuple(shape):
+        raise ValueError("Only greyscale series with a constant slice shape can be exported")
+    return image
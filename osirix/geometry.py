@@ -0,0 +1,93 @@
+from __future__ import annotations
+from typing import Tuple, Sequence
+
+from numpy import ndarray
+import numpy as np
+
+def pixel_to_patient_affine(origin: Sequence[float],
+                            orientation: Sequence[float],
+                            pixel_spacing: Sequence[float]) -> ndarray:
+    """
+    Builds the transform from (x, y) = (column, row) pixel coordinates of a DCMPix to patient coordinates in mm
+
+    Args:
+        origin : the DCMPix origin, patient position of the first pixel
+        orientation : the DCMPix orientation, row direction cosines followed by column direction cosines
+        pixel_spacing : the DCMPix (rows, columns) pixel spacing
+
+    Returns:
+        ndarray : (3, 3) matrix A such that patient = A @ (x, y, 1)
+    """
+    orientation = np.asarray(orientation, dtype=np.float64)
+    row_direction = orientation[0:3]
+    column_direction = orientation[3:6]
+    spacing_rows, spacing_columns = pixel_spacing
+    affine = np.empty((3, 3))
+    affine[:, 0] = row_direction * spacing_columns
+    affine[:, 1] = column_direction * spacing_rows
+    affine[:, 2] = np.asarray(origin, dtype=np.float64)
+    return affine
+
+def transform_points(points: ndarray, affine: ndarray) -> ndarray:
+    """
+    Applies pixel-to-patient transforms to (x, y) points
+
+    Args:
+        points : (n, 2) pixel coordinates
+        affine : a single (3, 3) transform, or an (n, 3, 3) stack with one transform per point
+
+    Returns:
+        ndarray : (n, 3) patient coordinates in mm
+    """
+    points = np.asarray(points, dtype=np.float64).reshape(-1, 2)
+    if affine.ndim == 2:
+        return points @ affine[:, 0:2].T + affine[:, 2]
+    return np.einsum("nij,nj->ni", affine[:, :, 0:2], points) + affine[:, :, 2]
+
+def slice_normal(affine: ndarray) -> ndarray:
+    """
+    Provides the unit normal of the plane of a DCMPix from its pixel-to-patient transform
+    """
+    normal = np.cross(affine[:, 0], affine[:, 1])
+    return normal / np.linalg.norm(normal)
+
+def slice_thicknesses(affines: Sequence[ndarray]) -> ndarray:
+    """
+    Estimates the thickness of each slice of a stack as the distance between neighbouring slice positions along
+    the normal of the first slice (central differences inside the stack, one-sided at its ends)
+
+    Args:
+        affines : the pixel-to-patient transform of each slice, in stack order
+
+    Returns:
+        ndarray : thickness of each slice in mm
+    """
+    if len(affines) < 2:
+        raise ValueError("At least two slices are needed to estimate slice thickness")
+    normal = slice_normal(affines[0])
+    positions = np.array([affine[:, 2] @ normal for affine in affines])
+    return np.abs(np.gradient(positions))
+
+def volume_affine(slice_affines: Sequence[ndarray]) -> ndarray:
+    """
+    Builds the transform from (slice, row, column) voxel indices of a stack of DCMPix to patient coordinates in
+    mm, assuming evenly spaced parallel slices
+
+    Args:
+        slice_affines : the pixel-to-patient transform of each slice, in stack order
+
+    Returns:
+        ndarray : (4, 4) matrix A such that (patient, 1) = A @ (slice, row, column, 1)
+    """
+    if len(slice_affines) == 0:
+        raise ValueError("At least one slice is needed to build a volume transform")
+    first = slice_affines[0]
+    affine = np.eye(4)
+    if len(slice_affines) > 1:
+        affine[0:3, 0] = (slice_affines[-1][:, 2] - first[:, 2]) / (len(slice_affines) - 1)
+    else:
+        affine[0:3, 0] = slice_normal(first)
+    affine[0:3, 1] = first[:, 1]
+    affine[0:3, 2] = first[:, 0]
+    affine[0:3, 3] = first[:, 2]
+    return affine
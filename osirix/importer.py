@@ -0,0 +1,230 @@
+from __future__ import annotations
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from dataclasses import dataclass, field
+from typing import Any, Callable, Dict, List, Optional, Sequence, Tuple
+import hashlib
+import os
+import threading
+import time
+
+import grpc
+
+import osirixgrpc.browsercontroller_pb2 as browsercontroller_pb2
+from osirix.exceptions import GrpcException
+
+# Errors after which a chunk is submitted again
+RETRY_ERRORS = (GrpcException, grpc.RpcError)
+
+@dataclass(frozen=True)
+class ChunkResult:
+    """
+    Outcome of one chunk of a BulkImporter, passed to its progress callback as each chunk finishes
+    """
+    index: int
+    paths: Tuple[str, ...]
+    attempts: int
+    seconds: float
+    error: Optional[str] = None
+
+    @property
+    def succeeded(self) -> bool:
+        return self.error is None
+
+    @property
+    def retries(self) -> int:
+        return self.attempts - 1
+
+    @property
+    def files_per_second(self) -> float:
+        return len(self.paths) / self.seconds if self.seconds > 0 else 0.0
+
+@dataclass
+class ImportResult:
+    """
+    Summary of a BulkImporter run. Chunks are in submission order.
+    """
+    chunks: Tuple[ChunkResult, ...]
+    requested: int
+    duplicates: int
+    elapsed: float
+    stage_times: Dict[str, float] = field(default_factory=dict)
+
+    @property
+    def imported(self) -> int:
+        return sum(len(chunk.paths) for chunk in self.chunks if chunk.succeeded)
+
+    @property
+    def failed_paths(self) -> Tuple[str, ...]:
+        return tuple(path for chunk in self.chunks if not chunk.succeeded for path in chunk.paths)
+
+    @property
+    def retries(self) -> int:
+        return sum(chunk.retries for chunk in self.chunks)
+
+    @property
+    def files_per_second(self) -> float:
+        return self.imported / self.elapsed if self.elapsed > 0 else 0.0
+
+def file_digest(path: str, block_size: int = 1 << 20) -> Optional[str]:
+    """
+    Provides the SHA-256 digest of a file, or None if it cannot be read on this machine
+    """
+    digest = hashlib.sha256()
+    try:
+        with open(path, "rb") as file:
+            for block in iter(lambda: file.read(block_size), b""):
+                digest.update(block)
+    except OSError:
+        return None
+    return digest.hexdigest()
+
+def unique_paths(paths: Sequence[str], hash_contents: bool = False, workers: int = 8) -> List[str]:
+    """
+    Removes repeated paths, keeping the first occurrence of each. Paths are compared after normalisation, and
+    optionally files with identical contents are also treated as repeats. Files that cannot be read locally are
+    never treated as repeats by content.
+
+    Args:
+        paths : the files to import
+        hash_contents : whether to compare the contents of the files
+        workers : the number of threads hashing files
+
+    Returns:
+        list of paths
+    """
+    seen = set()
+    unique = []
+    for path in paths:
+        key = os.path.normpath(path)
+        if key not in seen:
+            seen.add(key)
+            unique.append(path)
+    if not hash_contents:
+        return unique
+
+    with ThreadPoolExecutor(max_workers=max(1, workers)) as executor:
+        digests = list(executor.map(file_digest, unique))
+    seen_digests = set()
+    unique_contents = []
+    for path, digest in zip(unique, digests):
+        if digest is None or digest not in seen_digests:
+            seen_digests.add(digest)
+            unique_contents.append(path)
+    return unique_contents
+
+def chunk_paths(paths: Sequence[str], chunk_size: int = 500, max_bytes: int = 1 << 20) -> List[Tuple[str, ...]]:
+    """
+    Splits paths into chunks of at most chunk_size paths and about max_bytes of encoded paths, so that each request
+    stays well below the gRPC message limit
+
+    Returns:
+        list of tuples of paths
+    """
+    if chunk_size < 1:
+        raise ValueError("chunk_size must be at least 1")
+    chunks = []
+    chunk: List[str] = []
+    size = 0
+    for path in paths:
+        path_size = len(path.encode("utf-8")) + 4
+        if chunk and (len(chunk) >= chunk_size or size + path_size > max_bytes):
+            chunks.append(tuple(chunk))
+            chunk, size = [], 0
+        chunk.append(path)
+        size += path_size
+    if chunk:
+        chunks.append(tuple(chunk))
+    return chunks
+
+class BulkImporter(object):
+    '''
+    Class copying many files into the Osirix database. Paths are deduplicated and split into chunks, which are
+    submitted by a bounded pool of workers and retried with exponential backoff when they fail.
+    '''
+
+    def __init__(self,
+                 browser_controller,
+                 chunk_size: int = 500,
+                 max_bytes: int = 1 << 20,
+                 workers: int = 2,
+                 retries: int = 2,
+                 backoff: float = 0.5,
+                 hash_contents: bool = False,
+                 progress: Optional[Callable[[ChunkResult], Any]] = None):
+        """
+        Args:
+            browser_controller : the BrowserController of the database
+            chunk_size : the maximum number of paths per request
+            max_bytes : the approximate maximum size of the paths of one request
+            workers : the maximum number of requests in flight at once
+            retries : the number of times a failed chunk is submitted again
+            backoff : seconds before the first retry, doubled for each following retry
+            hash_contents : whether files with identical contents are imported only once
+            progress : callback receiving a ChunkResult as each chunk finishes
+        """
+        self.browser_controller = browser_controller
+        self.chunk_size = chunk_size
+        self.max_bytes = max_bytes
+        self.workers = workers
+        self.retries = retries
+        self.backoff = backoff
+        self.hash_contents = hash_contents
+        self.progress = progress
+        self._lock = threading.Lock()
+
+    def _submit(self, index: int, paths: Tuple[str, ...]) -> ChunkResult:
+        browser = self.browser_controller
+        request = browsercontroller_pb2.BrowserControllerCopyFilesIfNeededRequest(browser=browser.osirixrpc_uid,
+                                                                                    paths=list(paths))
+        start = time.monotonic()
+        error = None
+        attempt = 0
+        while attempt <= self.retries:
+            if attempt > 0:
+                time.sleep(self.backoff * 2 ** (attempt - 1))
+            attempt += 1
+            try:
+                response = browser.osirix_service.BrowserControllerCopyFilesIfNeeded(request)
+                browser.response_processor.response_check(response)
+            except RETRY_ERRORS as exc:
+                error = str(exc) or type(exc).__name__
+                continue
+            error = None
+            break
+        result = ChunkResult(index=index, paths=paths, attempts=attempt, seconds=time.monotonic() - start,
+                             error=error)
+        if self.progress is not None:
+            with self._lock:
+                self.progress(result)
+        return result
+
+    def run(self, paths: Sequence[str]) -> ImportResult:
+        """
+        Imports files into the database
+
+        Args:
+            paths : the files to import, as seen by the machine running Osirix
+
+        Returns:
+            ImportResult
+        """
+        start = time.monotonic()
+        stage_times: Dict[str, float] = {}
+        paths = list(paths)
+        unique = unique_paths(paths, hash_contents=self.hash_contents, workers=max(1, self.workers) * 4)
+        chunks = chunk_paths(unique, chunk_size=self.chunk_size, max_bytes=self.max_bytes)
+        stage_times["prepare"] = time.monotonic() - start
+
+        stage_start = time.monotonic()
+        results: List[ChunkResult] = []
+        with ThreadPoolExecutor(max_workers=max(1, self.workers)) as executor:
+            futures = [executor.submit(self._submit, index, chunk) for index, chunk in enumerate(chunks)]
+            for future in as_completed(futures):
+                results.append(future.result())
+        stage_times["import"] = time.monotonic() - stage_start
+
+        return ImportResult(chunks=tuple(sorted(results, key=lambda chunk: chunk.index)),
+                            requested=len(paths),
+                            duplicates=len(paths) - len(unique),
+                            elapsed=time.monotonic() - start,
+                            stage_times=stage_times)
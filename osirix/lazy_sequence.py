@@ -0,0 +1,53 @@
+from __future__ import annotations
+from collections.abc import Sequence
+from typing import Any, Callable, List, Optional
+
+class LazySequence(Sequence):
+    '''
+    Read-only sequence over the items of a gRPC response that builds the pyOsirix object of each item only when it is
+    first accessed. Indexing, slicing, iteration and len() never copy the underlying response items, so listing a
+    large series or database costs linear time overall.
+    '''
+    __slots__ = ("_items", "_factory", "_objects", "_indices")
+
+    def __init__(self, items: Sequence, factory: Callable[[Any], Any],
+                 _objects: Optional[List[Any]] = None, _indices: Optional[range] = None) -> None:
+        """
+        Args:
+            items : the response items, e.g. a repeated field of osirixrpc_uid messages
+            factory : callable building the pyOsirix object of an item
+        """
+        self._items = items
+        self._factory = factory
+        self._objects = [None] * len(items) if _objects is None else _objects
+        self._indices = range(len(items)) if _indices is None else _indices
+
+    def _get(self, position: int) -> Any:
+        obj = self._objects[position]
+        if obj is None:
+            obj = self._factory(self._items[position])
+            self._objects[position] = obj
+        return obj
+
+    def __len__(self) -> int:
+        return len(self._indices)
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            # Slices are views sharing the items and the objects already built
+            return LazySequence(self._items, self._factory, self._objects, self._indices[index])
+        return self._get(self._indices[index])
+
+    def __iter__(self):
+        for position in self._indices:
+            yield self._get(position)
+
+    def __eq__(self, other) -> bool:
+        if not isinstance(other, (LazySequence, tuple, list)):
+            return NotImplemented
+        return len(self) == len(other) and all(a == b for a, b in zip(self, other))
+
+    __hash__ = None
+
+    def __repr__(self) -> str:
+        return "LazySequence(%d items)" % len(self)
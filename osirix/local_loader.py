@@ -0,0 +1,137 @@
+from __future__ import annotations
+from concurrent.futures import ProcessPoolExecutor
+from typing import Dict, NamedTuple, Optional, Sequence, Tuple
+import os
+import time
+
+from numpy import ndarray
+import numpy as np
+import pydicom
+from pydicom.errors import InvalidDicomError
+
+# Errors meaning that the files cannot be used locally, so that the caller may fall back to gRPC
+LOCAL_LOAD_ERRORS = (OSError, ValueError, InvalidDicomError)
+
+class LocalSlice(NamedTuple):
+    """
+    Pixel data and position of one DICOM file read by the local loader
+    """
+    pixels: ndarray
+    position: Optional[Tuple[float, float, float]]
+    orientation: Optional[Tuple[float, ...]]
+    instance_number: Optional[int]
+
+class LocalVolume(NamedTuple):
+    """
+    Volume assembled from DICOM files, with the paths of its slices in volume order
+    """
+    volume: ndarray
+    paths: Tuple[str, ...]
+
+def read_slice(path: str) -> LocalSlice:
+    """
+    Reads a single-frame greyscale DICOM file and applies its rescale slope and intercept
+
+    Args:
+        path : the DICOM file
+
+    Returns:
+        LocalSlice
+    """
+    dataset = pydicom.dcmread(path)
+    pixels = dataset.pixel_array
+    if pixels.ndim != 2:
+        raise ValueError("Only single-frame greyscale files can be loaded locally: %s" % path)
+    slope = float(getattr(dataset, "RescaleSlope", 1.0) or 1.0)
+    intercept = float(getattr(dataset, "RescaleIntercept", 0.0) or 0.0)
+    pixels = pixels.astype(np.float32) * np.float32(slope) + np.float32(intercept)
+    position = getattr(dataset, "ImagePositionPatient", None)
+    orientation = getattr(dataset, "ImageOrientationPatient", None)
+    instance_number = getattr(dataset, "InstanceNumber", None)
+    return LocalSlice(pixels=pixels,
+                      position=tuple(float(value) for value in position) if position is not None else None,
+                      orientation=tuple(float(value) for value in orientation) if orientation is not None else None,
+                      instance_number=int(instance_number) if instance_number is not None else None)
+
+def files_reachable(paths: Sequence[str]) -> bool:
+    """
+    Provides whether every path is a readable file on this machine
+    """
+    return len(paths) > 0 and all(os.path.isfile(path) and os.access(path, os.R_OK) for path in paths)
+
+def slice_order(slices: Sequence[LocalSlice]) -> ndarray:
+    """
+    Sorts slices along the normal of the first slice when every slice has a position and orientation, otherwise by
+    instance number when every slice has one, otherwise keeps the given order
+
+    Returns:
+        ndarray : indices of the slices in volume order
+    """
+    if all(s.position is not None and s.orientation is not None for s in slices):
+        orientation = np.asarray(slices[0].orientation)
+        normal = np.cross(orientation[0:3], orientation[3:6])
+        return np.argsort(np.asarray([s.position for s in slices]) @ normal, kind="stable")
+    if all(s.instance_number is not None for s in slices):
+        return np.argsort([s.instance_number for s in slices], kind="stable")
+    return np.arange(len(slices))
+
+def load_files(paths: Sequence[str], processes: int = 4, sort: bool = True) -> LocalVolume:
+    """
+    Reads DICOM files with pydicom in a process pool and stacks them into a volume
+
+    Args:
+        paths : the DICOM files, one slice each
+        processes : the number of processes, 0 or 1 to read in this process
+        sort : whether to sort the slices geometrically (see slice_order), otherwise the given order is kept
+
+    Returns:
+        LocalVolume
+    """
+    paths = list(paths)
+    if len(paths) == 0:
+        raise ValueError("No files to load")
+    if processes > 1:
+        with ProcessPoolExecutor(max_workers=processes) as executor:
+            slices = list(executor.map(read_slice, paths, chunksize=max(1, len(paths) // (4 * processes))))
+    else:
+        slices = [read_slice(path) for path in paths]
+    if len(set(s.pixels.shape for s in slices)) > 1:
+        raise ValueError("The files have different image shapes and cannot be stacked")
+
+    order = slice_order(slices) if sort else np.arange(len(slices))
+    volume = np.empty((len(slices),) + slices[0].pixels.shape, dtype=np.float32)
+    for i, index in enumerate(order):
+        volume[i] = slices[index].pixels
+    return LocalVolume(volume=volume, paths=tuple(paths[index] for index in order))
+
+def benchmark(viewer_controller, movie_idx: Optional[int] = None, processes: int = 4,
+              workers: int = 8) -> Dict[str, float]:
+    """
+    Times loading the volume of a ViewerController from its local files and over gRPC
+
+    Args:
+        viewer_controller : the ViewerController
+        movie_idx : the movie index, the current movie index if None
+        processes : the number of processes of the local loader
+        workers : the maximum number of gRPC requests in flight at once
+
+    Returns:
+        dict with the seconds and MB/s of each path ("local_seconds", "local_mb_per_second", "grpc_seconds",
+        "grpc_mb_per_second") and the largest absolute difference between the two volumes
+    """
+    start = time.perf_counter()
+    local = viewer_controller.load_volume(movie_idx, processes=processes, workers=workers, fallback=False,
+                                          cache=False)
+    local_seconds = time.perf_counter() - start
+
+    start = time.perf_counter()
+    remote = viewer_controller.volume(movie_idx, workers=workers, refresh=True)
+    grpc_seconds = time.perf_counter() - start
+
+    megabytes = local.size * 4 / 1e6
+    return {"local_seconds": local_seconds,
+            "local_mb_per_second": megabytes / local_seconds if local_seconds > 0 else float("inf"),
+            "grpc_seconds": grpc_seconds,
+            "grpc_mb_per_second": megabytes / grpc_seconds if grpc_seconds > 0 else float("inf"),
+            "max_abs_difference": float(np.max(np.abs(local - remote))) if local.shape == remote.shape
+            else float("nan")}
@@ -0,0 +1,76 @@
+from __future__ import annotations
+import threading
+import weakref
+
+from typing import Dict, Optional
+
+from osirix.cache import AttributeCache
+from osirix.response_processor import ResponseProcessor
+
+def uid_key(osirixrpc_uid) -> str:
+    """
+    Provides the string identifier of an osirixrpc_uid message (or of a plain string uid)
+    """
+    return getattr(osirixrpc_uid, "osirixrpc_uid", osirixrpc_uid)
+
+class OsirixObject(object):
+    '''
+    Base class of the pyOsirix objects that wrap an osirixrpc_uid. Objects are slotted and interned by uid in a
+    weak-value registry per class, so listing the same Osirix object twice gives the same Python object (and the
+    same per-object caches) for as long as it is referenced.
+    '''
+    __slots__ = ("osirixrpc_uid", "osirix_service", "__weakref__")
+
+    # Response checking is stateless so a single processor is shared by every object
+    response_processor = ResponseProcessor()
+
+    _registry_lock = threading.Lock()
+    _registry: weakref.WeakValueDictionary = weakref.WeakValueDictionary()
+
+    def __init_subclass__(cls, **kwargs) -> None:
+        super().__init_subclass__(**kwargs)
+        cls._registry = weakref.WeakValueDictionary()
+
+    def __new__(cls, osirixrpc_uid, osirix_service, *args, **kwargs):
+        key = (id(osirix_service), uid_key(osirixrpc_uid))
+        with cls._registry_lock:
+            obj = cls._registry.get(key)
+            if obj is None:
+                obj = super().__new__(cls)
+                obj.osirixrpc_uid = osirixrpc_uid
+                obj.osirix_service = osirix_service
+                obj._setup()
+                cls._registry[key] = obj
+        return obj
+
+    def __init__(self, osirixrpc_uid, osirix_service, *args, **kwargs) -> None:
+        # Per-object state is created once in _setup, as __init__ also runs when an interned object is returned
+        pass
+
+    def _setup(self) -> None:
+        """
+        Initialises per-object state when the object is first created
+        """
+        pass
+
+    def __repr__(self) -> str:
+        return "%s(%r)" % (type(self).__name__, uid_key(self.osirixrpc_uid))
+
+class CachedOsirixObject(OsirixObject):
+    '''
+    Base class of pyOsirix objects whose attributes are cached according to a declarative CACHE_POLICY, mapping
+    attribute names (decorated with cached_attribute) to a time to live in seconds, or IMMUTABLE to cache them for
+    the lifetime of the object
+    '''
+    __slots__ = ("_cache",)
+
+    CACHE_POLICY: Dict[str, Optional[float]] = {}
+
+    def _setup(self) -> None:
+        self._cache = AttributeCache(type(self).__name__)
+
+    def invalidate_cache(self, name: Optional[str] = None) -> None:
+        """
+        Drops the cached value of one attribute, or of all attributes if name is None
+        """
+        self._cache.invalidate(name)
@@ -1,5 +1,6 @@
 from __future__ import annotations
-from typing import List, Tuple
+from typing import Any, Callable, List, Optional, Sequence, Tuple
+from concurrent.futures import ThreadPoolExecutor
 
 import grpc
 import sys
@@ -8,6 +9,7 @@ from osirix.viewer_controller import ViewerController
 from osirix.vr_controller import VRController
 from osirix.browser_controller import BrowserController
 from osirix.response_processor import ResponseProcessor
+from osirix.singleflight import CoalescingService
 
 # sys.path.append("./pb2/")
 
@@ -15,6 +17,8 @@ import osirixgrpc.osirix_pb2_grpc as osirix_pb2_grpc
 import osirixgrpc.utilities_pb2 as utilities_pb2
 
 import yaml
+import numpy as np
+from numpy import ndarray
 
 class OsirixService(object):
     """
@@ -24,8 +28,15 @@ class OsirixService(object):
     def __init__(self,
                  channel_opt: List[Tuple[str, int]],
                  domain: str,
-                 port : int = 50051):
-
+                 port : int = 50051,
+                 coalesce: Sequence[str] = ()):
+        """
+        Args:
+            channel_opt: options of the gRPC channel
+            domain: the address of the Osirix server, ending with ":"
+            port: the port of the Osirix server
+            coalesce: read-only service methods whose concurrent identical requests share one RPC
+        """
 
         self.port = port
         self.domain = domain
@@ -33,19 +44,36 @@ class OsirixService(object):
         self.channel_opt = channel_opt
         self.channel = grpc.insecure_channel(self.server_url, options=self.channel_opt)
         try:
-            self.osirix_service = osirix_pb2_grpc.OsiriXServiceStub(self.channel)
+            osirix_service = osirix_pb2_grpc.OsiriXServiceStub(self.channel)
         except:
             raise GrpcException("No connection to OsiriX can be established")
+        self.osirix_service = CoalescingService(osirix_service, coalesce)
 
-    def get_service(self) -> osirix_pb2_grpc.OsiriXServiceStub:
+    def get_service(self) -> CoalescingService:
         """
         Gets the osirix service
 
         Returns:
-            the gRPC OsirixServiceStub
+            the CoalescingService wrapping the gRPC OsiriXServiceStub, which exposes the same methods
         """
         return self.osirix_service
 
+    def coalesce(self, *methods: str) -> None:
+        """
+        Makes concurrent identical requests of the given read-only methods (e.g. "DCMPixImage") share one RPC and
+        its response. Requests are identical when their serialized messages are equal.
+
+        Args:
+            methods: names of service methods, a ValueError is raised for methods that are not read-only
+        """
+        self.osirix_service.coalesce(*methods)
+
+    def uncoalesce(self, *methods: str) -> None:
+        """
+        Stops coalescing the given methods, or every method if none are given
+        """
+        self.osirix_service.uncoalesce(*methods)
+
     @classmethod
     def name(cls) -> str:
         return cls.__name__
@@ -153,6 +181,82 @@ class Osirix(object):
 
         return vr_controller_obj_tuple
 
+    def for_each_viewer(self,
+                        fn: Callable[[ViewerController], Any],
+                        workers: int = 8,
+                        viewers: Optional[Sequence[ViewerController]] = None) -> Tuple[Any, ...]:
+        """
+        Calls a function on every displayed 2D viewer concurrently, so that operations across viewers take about
+        the time of one round trip rather than one per viewer
+
+        Args:
+            fn : callable taking a ViewerController
+            workers : the maximum number of viewers processed at once
+            viewers : the viewers to use, by default all displayed 2D viewers
+
+        Returns:
+            Tuple containing the result of fn for each viewer, in viewer order
+        """
+        if viewers is None:
+            viewers = self.displayed_2d_viewers()
+        if len(viewers) == 0:
+            return ()
+        with ThreadPoolExecutor(max_workers=max(1, min(workers, len(viewers)))) as executor:
+            return tuple(executor.map(fn, viewers))
+
+    def current_slice_images(self,
+                             workers: int = 8,
+                             viewers: Optional[Sequence[ViewerController]] = None) -> ndarray:
+        """
+        Provides the image of the current slice of every displayed 2D viewer, requested concurrently
+
+        Args:
+            workers : the maximum number of viewers processed at once
+            viewers : the viewers to use, by default all displayed 2D viewers
+
+        Returns:
+            ndarray : (viewers, rows, columns) stack of images, in viewer order
+        """
+        images = self.for_each_viewer(lambda viewer: viewer.cur_dcm().image, workers=workers, viewers=viewers)
+        if len(set(image.shape for image in images)) > 1:
+            raise ValueError("The current slices of the viewers have different shapes and cannot be stacked")
+        return np.stack(images) if len(images) > 0 else np.empty((0, 0, 0))
+
+    def viewers_wlww(self,
+                     workers: int = 8,
+                     viewers: Optional[Sequence[ViewerController]] = None) -> ndarray:
+        """
+        Provides the wlww of every displayed 2D viewer, requested concurrently
+
+        Args:
+            workers : the maximum number of viewers processed at once
+            viewers : the viewers to use, by default all displayed 2D viewers
+
+        Returns:
+            ndarray : (viewers, 2) array of wl and ww, in viewer order
+        """
+        wlww = self.for_each_viewer(lambda viewer: viewer.wlww, workers=workers, viewers=viewers)
+        return np.array(wlww, dtype=np.float64).reshape(-1, 2)
+
+    def set_viewers_wlww(self,
+                         wlww: Tuple[float, float],
+                         workers: int = 8,
+                         viewers: Optional[Sequence[ViewerController]] = None) -> None:
+        """
+        Sets the same wlww on every displayed 2D viewer concurrently
+
+        Args:
+            wlww : Tuple containing wl and ww
+            workers : the maximum number of viewers processed at once
+            viewers : the viewers to use, by default all displayed 2D viewers
+
+        Returns:
+            None
+        """
+        def set_wlww(viewer: ViewerController) -> None:
+            viewer.wlww = wlww
+        self.for_each_viewer(set_wlww, workers=workers, viewers=viewers)
+
     # def run_alert_panel(self,
     #                     message: str,
     #                     information_text : str = None,
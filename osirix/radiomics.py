@@ -0,0 +1,281 @@
+from __future__ import annotations
+from typing import Tuple, Dict, Optional, Sequence
+from concurrent.futures import ProcessPoolExecutor
+
+from numpy import ndarray
+import numpy as np
+
+# In-plane (row, column) neighbour offsets at 0, 45, 90 and 135 degrees
+DEFAULT_OFFSETS: Tuple[Tuple[int, int], ...] = ((0, 1), (-1, 1), (-1, 0), (-1, -1))
+
+def _label_ranges(labels: ndarray, n_labels: int) -> Tuple[ndarray, ndarray, ndarray]:
+    order = np.argsort(labels, kind="stable")
+    counts = np.bincount(labels, minlength=n_labels)
+    starts = np.concatenate([[0], np.cumsum(counts)[:-1]])
+    return order, counts, starts
+
+def quantize(values: ndarray, labels: ndarray, n_labels: int, levels: int) -> ndarray:
+    """
+    Quantizes values to gray levels 0..levels-1 using the minimum and maximum of each label separately
+
+    Returns:
+        ndarray : int gray level of each value
+    """
+    order, counts, starts = _label_ranges(labels, n_labels)
+    minimum = np.zeros(n_labels)
+    maximum = np.zeros(n_labels)
+    non_empty = counts > 0
+    if np.any(non_empty):
+        sorted_values = values[order]
+        minimum[non_empty] = np.minimum.reduceat(sorted_values, starts[non_empty])
+        maximum[non_empty] = np.maximum.reduceat(sorted_values, starts[non_empty])
+    span = np.where(maximum > minimum, maximum - minimum, 1.0)
+    gray = np.floor((values - minimum[labels]) / span[labels] * levels).astype(np.int64)
+    return np.clip(gray, 0, levels - 1)
+
+def first_order_features(values: ndarray,
+                         labels: ndarray,
+                         n_labels: int,
+                         levels: int = 32) -> Dict[str, ndarray]:
+    """
+    Computes first-order (histogram) features of the values of many ROIs at once
+
+    Args:
+        values : ndarray of voxel values
+        labels : ndarray of the ROI label (0..n_labels-1) of each value
+        int : n_labels
+        int : levels, the number of bins used for entropy and uniformity
+
+    Returns:
+        Dict of ndarray with one entry per label
+    """
+    values = np.asarray(values, dtype=np.float64)
+    labels = np.asarray(labels, dtype=np.int64)
+    count = np.bincount(labels, minlength=n_labels).astype(np.float64)
+    safe_count = np.where(count > 0, count, 1.0)
+
+    mean = np.bincount(labels, weights=values, minlength=n_labels) / safe_count
+    deviation = values - mean[labels]
+    m2 = np.bincount(labels, weights=deviation ** 2, minlength=n_labels) / safe_count
+    m3 = np.bincount(labels, weights=deviation ** 3, minlength=n_labels) / safe_count
+    m4 = np.bincount(labels, weights=deviation ** 4, minlength=n_labels) / safe_count
+    with np.errstate(invalid="ignore", divide="ignore"):
+        skewness = np.where(m2 > 0, m3 / m2 ** 1.5, 0.0)
+        kurtosis = np.where(m2 > 0, m4 / m2 ** 2, 0.0)
+
+    # Sorting by (label, value) gives order statistics of every label at once
+    order = np.lexsort((values, labels))
+    sorted_values = values[order]
+    starts = np.concatenate([[0], np.cumsum(count)[:-1]]).astype(np.int64)
+
+    def percentile(q: float) -> ndarray:
+        position = q * np.maximum(count - 1, 0)
+        lower = np.floor(position).astype(np.int64)
+        upper = np.ceil(position).astype(np.int64)
+        weight = position - lower
+        if len(sorted_values) == 0:
+            return np.full(n_labels, np.nan)
+        low_values = sorted_values[np.minimum(starts + lower, len(sorted_values) - 1)]
+        high_values = sorted_values[np.minimum(starts + upper, len(sorted_values) - 1)]
+        return np.where(count > 0, low_values + weight * (high_values - low_values), np.nan)
+
+    gray = quantize(values, labels, n_labels, levels)
+    histogram = np.bincount(labels * levels + gray, minlength=n_labels * levels).reshape(n_labels, levels)
+    probability = histogram / safe_count[:, None]
+    with np.errstate(invalid="ignore", divide="ignore"):
+        entropy = -np.sum(np.where(probability > 0, probability * np.log2(probability), 0.0), axis=1)
+
+    return {
+        'count': count,
+        'mean': np.where(count > 0, mean, np.nan),
+        'std_dev': np.where(count > 0, np.sqrt(m2), np.nan),
+        'skewness': skewness,
+        'kurtosis': kurtosis,
+        'min': percentile(0.0),
+        'p10': percentile(0.1),
+        'median': percentile(0.5),
+        'p90': percentile(0.9),
+        'max': percentile(1.0),
+        'energy': np.bincount(labels, weights=values ** 2, minlength=n_labels),
+        'entropy': entropy,
+        'uniformity': np.sum(probability ** 2, axis=1)
+    }
+
+def glcm_matrices(slices: ndarray,
+                  rows: ndarray,
+                  columns: ndarray,
+                  gray: ndarray,
+                  labels: ndarray,
+                  n_labels: int,
+                  levels: int,
+                  offsets: Sequence[Tuple[int, int]] = DEFAULT_OFFSETS) -> ndarray:
+    """
+    Builds the symmetric, normalised gray-level co-occurrence matrix of every label, summed over the in-plane
+    offsets. Neighbours are looked up by sorting voxel keys, so all labels and slices are processed together.
+
+    Returns:
+        ndarray : (n_labels, levels, levels)
+    """
+    rows = np.asarray(rows, dtype=np.int64)
+    columns = np.asarray(columns, dtype=np.int64)
+    slices = np.asarray(slices, dtype=np.int64)
+    labels = np.asarray(labels, dtype=np.int64)
+    if len(gray) == 0:
+        return np.zeros((n_labels, levels, levels))
+
+    height = int(rows.max()) + 2
+    width = int(columns.max()) + 2
+    n_slices = int(slices.max()) + 1
+    keys = ((labels * n_slices + slices) * height + rows) * width + columns
+    keys, first = np.unique(keys, return_index=True)
+    sorted_gray = gray[first]
+    sorted_labels = labels[first]
+    sorted_rows = rows[first]
+    sorted_columns = columns[first]
+
+    counts = np.zeros(n_labels * levels * levels)
+    for row_offset, column_offset in offsets:
+        neighbour_rows = sorted_rows + row_offset
+        neighbour_columns = sorted_columns + column_offset
+        in_plane = ((neighbour_rows >= 0) & (neighbour_rows < height) & (neighbour_columns >= 0) &
+                    (neighbour_columns < width))
+        neighbour_keys = keys + row_offset * width + column_offset
+        position = np.searchsorted(keys, neighbour_keys)
+        position = np.minimum(position, len(keys) - 1)
+        found = in_plane & (keys[position] == neighbour_keys)
+
+        i = sorted_gray[found]
+        j = sorted_gray[position[found]]
+        base = sorted_labels[found] * levels * levels
+        counts += np.bincount(base + i * levels + j, minlength=len(counts))
+        counts += np.bincount(base + j * levels + i, minlength=len(counts))
+
+    matrices = counts.reshape(n_labels, levels, levels)
+    totals = matrices.sum(axis=(1, 2), keepdims=True)
+    return matrices / np.where(totals > 0, totals, 1.0)
+
+def glcm_features(matrices: ndarray) -> Dict[str, ndarray]:
+    """
+    Computes texture features from normalised co-occurrence matrices
+
+    Args:
+        matrices : ndarray (n_labels, levels, levels) as returned by glcm_matrices
+
+    Returns:
+        Dict of ndarray with one entry per label
+    """
+    levels = matrices.shape[1]
+    i, j = np.meshgrid(np.arange(levels), np.arange(levels), indexing="ij")
+    mean_i = np.sum(matrices * i, axis=(1, 2))
+    mean_j = np.sum(matrices * j, axis=(1, 2))
+    std_i = np.sqrt(np.sum(matrices * (i - mean_i[:, None, None]) ** 2, axis=(1, 2)))
+    std_j = np.sqrt(np.sum(matrices * (j - mean_j[:, None, None]) ** 2, axis=(1, 2)))
+    covariance = np.sum(matrices * (i - mean_i[:, None, None]) * (j - mean_j[:, None, None]), axis=(1, 2))
+    with np.errstate(invalid="ignore", divide="ignore"):
+        correlation = np.where(std_i * std_j > 0, covariance / (std_i * std_j), 1.0)
+        entropy = -np.sum(np.where(matrices > 0, matrices * np.log2(matrices), 0.0), axis=(1, 2))
+
+    return {
+        'contrast': np.sum(matrices * (i - j) ** 2, axis=(1, 2)),
+        'dissimilarity': np.sum(matrices * np.abs(i - j), axis=(1, 2)),
+        'homogeneity': np.sum(matrices / (1.0 + (i - j) ** 2), axis=(1, 2)),
+        'energy': np.sum(matrices ** 2, axis=(1, 2)),
+        'correlation': correlation,
+        'entropy': entropy
+    }
+
+def compute_features(slices: ndarray,
+                     rows: ndarray,
+                     columns: ndarray,
+                     values: ndarray,
+                     labels: ndarray,
+                     n_labels: int,
+                     levels: int = 32,
+                     offsets: Sequence[Tuple[int, int]] = DEFAULT_OFFSETS) -> Dict[str, ndarray]:
+    """
+    Computes first-order and GLCM features of many labelled ROIs from COO-style voxel data
+
+    Returns:
+        Dict of ndarray with one entry per label. Keys are prefixed with 'firstorder_' or 'glcm_'.
+    """
+    labels = np.asarray(labels, dtype=np.int64)
+    values = np.asarray(values, dtype=np.float64)
+    features = {}
+    for key, value in first_order_features(values, labels, n_labels, levels).items():
+        features['firstorder_' + key] = value
+    gray = quantize(values, labels, n_labels, levels)
+    matrices = glcm_matrices(slices, rows, columns, gray, labels, n_labels, levels, offsets)
+    for key, value in glcm_features(matrices).items():
+        features['glcm_' + key] = value
+    return features
+
+def _compute_features_star(arguments) -> Dict[str, ndarray]:
+    return compute_features(*arguments)
+
+def compute_features_parallel(slices: ndarray,
+                              rows: ndarray,
+                              columns: ndarray,
+                              values: ndarray,
+                              labels: ndarray,
+                              n_labels: int,
+                              levels: int = 32,
+                              offsets: Sequence[Tuple[int, int]] = DEFAULT_OFFSETS,
+                              processes: int = 4) -> Dict[str, ndarray]:
+    """
+    Same as compute_features, with the labels split into contiguous groups computed in a process pool
+
+    Returns:
+        Dict of ndarray with one entry per label
+    """
+    labels = np.asarray(labels, dtype=np.int64)
+    groups = np.array_split(np.arange(n_labels), max(1, min(processes, n_labels)))
+    jobs = []
+    for group in groups:
+        selected = (labels >= group[0]) & (labels <= group[-1]) if len(group) > 0 else np.zeros(len(labels), bool)
+        jobs.append((np.asarray(slices)[selected], np.asarray(rows)[selected], np.asarray(columns)[selected],
+                     np.asarray(values)[selected], labels[selected] - (group[0] if len(group) > 0 else 0),
+                     len(group), levels, tuple(offsets)))
+
+    with ProcessPoolExecutor(max_workers=max(1, processes)) as executor:
+        results = list(executor.map(_compute_features_star, jobs))
+
+    return {key: np.concatenate([result[key] for result in results]) for key in results[0]}
+
+def extract_features(viewer_controller,
+                     names: Optional[Sequence[str]] = None,
+                     movie_idx: int = 0,
+                     levels: int = 32,
+                     offsets: Sequence[Tuple[int, int]] = DEFAULT_OFFSETS,
+                     workers: int = 8,
+                     processes: int = 0) -> Tuple[Tuple[str, ...], Dict[str, ndarray]]:
+    """
+    Computes first-order and GLCM features for every ROI name of a ViewerController, treating the ROIs of a name
+    across all slices as one region. Voxel values are fetched concurrently with ViewerController.get_rois_values.
+
+    Args:
+        viewer_controller : ViewerController
+        names : the ROI names to include, if None every ROI name of the viewer
+        int : movie_idx
+        int : levels, the number of gray levels used for quantization
+        offsets : the in-plane (row, column) neighbour offsets of the co-occurrence matrices
+        int : workers, the maximum number of requests in flight at once
+        int : processes, if greater than 0 the features are computed in a process pool of this size
+
+    Returns:
+        A Tuple containing the names and a Dict of ndarray with one entry per name
+    """
+    values_by_name = viewer_controller.get_rois_values(names, movie_idx, workers=workers)
+    names = tuple(values_by_name)
+    coo = list(values_by_name.values())
+
+    labels = np.repeat(np.arange(len(names)), [len(values) for _, _, _, values in coo])
+    slices, rows, columns, values = (np.concatenate([c[k] for c in coo]) if len(coo) > 0 else np.empty(0)
+                                     for k in range(4))
+
+    if processes > 0:
+        features = compute_features_parallel(slices, rows, columns, values, labels, len(names), levels, offsets,
+                                             processes=processes)
+    else:
+        features = compute_features(slices, rows, columns, values, labels, len(names), levels, offsets)
+
+    return names, features
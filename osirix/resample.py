@@ -0,0 +1,102 @@
+from __future__ import annotations
+from concurrent.futures import ThreadPoolExecutor
+from typing import Sequence, Tuple
+
+from numpy import ndarray
+import numpy as np
+
+ORDERS = ("linear", "nearest")
+
+def _voxel_coordinates(transform: ndarray, slices: ndarray, rows: int, columns: int) -> Tuple[ndarray, ...]:
+    # Each moving coordinate is a sum of per-axis terms, broadcast instead of building an index grid
+    k = slices[:, None, None].astype(np.float64)
+    r = np.arange(rows, dtype=np.float64)[None, :, None]
+    c = np.arange(columns, dtype=np.float64)[None, None, :]
+    return tuple(transform[i, 0] * k + transform[i, 1] * r + transform[i, 2] * c + transform[i, 3] for i in range(3))
+
+def _sample_nearest(moving: ndarray, coordinates: Tuple[ndarray, ...], fill_value: float) -> ndarray:
+    indices = []
+    valid = np.ones(coordinates[0].shape, dtype=bool)
+    for axis, coordinate in enumerate(coordinates):
+        index = np.rint(coordinate)
+        valid &= (index >= 0) & (index <= moving.shape[axis] - 1)
+        indices.append(np.clip(index, 0, moving.shape[axis] - 1).astype(np.intp))
+    values = moving[tuple(indices)].astype(np.float64)
+    values[~valid] = fill_value
+    return values
+
+def _sample_linear(moving: ndarray, coordinates: Tuple[ndarray, ...], fill_value: float) -> ndarray:
+    lower, upper, weights = [], [], []
+    valid = np.ones(coordinates[0].shape, dtype=bool)
+    for axis, coordinate in enumerate(coordinates):
+        size = moving.shape[axis]
+        # Allow rounding error at the borders so that grids which coincide sample their edges
+        valid &= (coordinate >= -1e-6) & (coordinate <= size - 1 + 1e-6)
+        coordinate = np.clip(coordinate, 0, size - 1)
+        index = np.minimum(np.floor(coordinate), max(size - 2, 0)).astype(np.intp)
+        lower.append(index)
+        upper.append(np.minimum(index + 1, size - 1))
+        weights.append(coordinate - index)
+
+    values = np.zeros(coordinates[0].shape)
+    for corner in range(8):
+        index = []
+        weight = np.ones(coordinates[0].shape)
+        for axis in range(3):
+            if corner >> axis & 1:
+                index.append(upper[axis])
+                weight = weight * weights[axis]
+            else:
+                index.append(lower[axis])
+                weight = weight * (1 - weights[axis])
+        values += weight * moving[tuple(index)]
+    values[~valid] = fill_value
+    return values
+
+def resample(moving: ndarray,
+             moving_affine: ndarray,
+             fixed_affine: ndarray,
+             fixed_shape: Sequence[int],
+             order: str = "linear",
+             fill_value: float = 0.0,
+             chunk_slices: int = 8,
+             workers: int = 4,
+             dtype=np.float32) -> ndarray:
+    """
+    Resamples a (slices, rows, columns) volume onto the voxel grid of another volume, both placed in patient space
+    by their voxel-to-patient transforms. The output is computed in chunks of slices on a thread pool.
+
+    Args:
+        moving : the (slices, rows, columns) volume to resample
+        moving_affine : (4, 4) voxel-to-patient transform of the moving volume
+        fixed_affine : (4, 4) voxel-to-patient transform of the target grid
+        fixed_shape : (slices, rows, columns) shape of the target grid
+        order : "linear" for trilinear interpolation or "nearest" for nearest neighbour
+        fill_value : value of target voxels that fall outside the moving volume
+        chunk_slices : number of target slices computed per task
+        workers : the number of threads
+        dtype : dtype of the output
+
+    Returns:
+        ndarray : the resampled volume with shape fixed_shape
+    """
+    if order not in ORDERS:
+        raise ValueError("order must be one of %s" % (ORDERS,))
+    moving = np.asarray(moving)
+    if moving.ndim != 3:
+        raise ValueError("Only (slices, rows, columns) volumes can be resampled")
+    n_slices, rows, columns = (int(size) for size in fixed_shape)
+    transform = np.linalg.solve(np.asarray(moving_affine, dtype=np.float64), np.asarray(fixed_affine, dtype=np.float64))
+    sample = _sample_linear if order == "linear" else _sample_nearest
+    output = np.empty((n_slices, rows, columns), dtype=dtype)
+
+    def resample_chunk(start: int) -> None:
+        slices = np.arange(start, min(start + chunk_slices, n_slices))
+        coordinates = _voxel_coordinates(transform, slices, rows, columns)
+        output[slices[0]:slices[-1] + 1] = sample(moving, coordinates, fill_value)
+
+    starts = range(0, n_slices, max(1, chunk_slices))
+    with ThreadPoolExecutor(max_workers=max(1, workers)) as executor:
+        # Consume the results so that exceptions raised by a chunk propagate
+        list(executor.map(resample_chunk, starts))
+    return output
@@ -1,5 +1,5 @@
 from __future__ import annotations
-from typing import Tuple, Dict
+from typing import Tuple, Dict, Optional
 import sys
 
 from numpy import ndarray
@@ -11,8 +11,9 @@ import osirixgrpc.dcmpix_pb2 as dcmpix_pb2
 import osirixgrpc.roi_pb2 as roi_pb2
 import osirixgrpc.roivolume_pb2 as roivolume_pb2
 from osirix.dicom import DicomSeries, DicomStudy, DicomImage
-from osirix.response_processor import ResponseProcessor
+from osirix.osirix_object import OsirixObject
 from osirix.dcm_pix import DCMPix
+from osirix.geometry import transform_points
 
 class ROIVolume:
     """
@@ -150,22 +151,12 @@ class ROIVolume:
         if not response.status == 1:
             warnings.warn("Could not set ROIVolume factor")
 
-class ROI(object):
+class ROI(OsirixObject):
     '''
     Class representing the properties and methods to communicate with the Osirix service through
     gRPC for the ROIs in Osirix
     '''
-    # osirixrpc_uid = None
-    # response_processor = None
-    # osirix_service = None
-
-    def __init__(self,
-                 osirixrpc_uid,
-                 osirix_service):
-        self.response_processor = ResponseProcessor()
-        self.osirixrpc_uid = osirixrpc_uid
-        self.osirix_service = osirix_service
-
+    __slots__ = ("_color", "_name", "_opacity", "_points", "_thickness", "_pix")
 
     @property
     def color(self) -> Tuple[int, int, int]:
@@ -266,6 +257,21 @@ class ROI(object):
 
         return self._points
 
+    def points_mm(self, pix: Optional[DCMPix] = None) -> ndarray:
+        """
+          Makes gRPC requests to retrieve the points for the ROI in patient coordinates
+
+          Args:
+            DCMPix : pix that the ROI is drawn on. If given, its cached geometry is reused; otherwise it is
+                requested from the Osirix service
+
+          Returns:
+            ndarray: (n, 3) points in mm
+        """
+        if pix is None:
+            pix = self.pix
+        return transform_points(self.points, pix.affine())
+
     # TODO
     # @points.setter
     # def points(self, points : ndarray) -> None:
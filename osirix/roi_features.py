@@ -0,0 +1,96 @@
+from __future__ import annotations
+from typing import Tuple, Dict, Optional, Union
+
+from numpy import ndarray
+import numpy as np
+
+from osirix.roi_geometry import ROIPointSet, roi_ids, next_vertex, bounding_boxes
+
+def scale_vertices(point_set: ROIPointSet,
+                   pixel_spacing: Union[Tuple[float, float], ndarray]) -> ndarray:
+    """
+    Converts the vertices of a point set from pixels to mm
+
+    Args:
+        point_set : ROIPointSet
+        pixel_spacing : (rows, columns) spacing as given by DCMPix.pixel_spacing, or an (n_rois, 2) array with
+            the spacing of the pix each ROI is drawn on
+
+    Returns:
+        ndarray : (n, 2) vertices in mm
+    """
+    spacing = np.asarray(pixel_spacing, dtype=np.float64)
+    if spacing.ndim == 2:
+        spacing = spacing[roi_ids(point_set.offsets)]
+    # Points are (x, y) = (column, row) so the column spacing applies to x
+    return point_set.vertices * spacing[..., ::-1]
+
+def shape_features(point_set: ROIPointSet,
+                   pixel_spacing: Optional[Union[Tuple[float, float], ndarray]] = None) -> Dict[str, ndarray]:
+    """
+    Computes shape features of every ROI in a point set in one vectorized pass. Each ROI is treated as a closed
+    polygon; ROIs with fewer than three points have zero area.
+
+    Args:
+        point_set : ROIPointSet
+        pixel_spacing : optional (rows, columns) spacing, or an (n_rois, 2) array of spacings, as given by
+            DCMPix.pixel_spacing. If provided the features are in mm, otherwise in pixels.
+
+    Returns:
+        Dict of ndarray with one entry per ROI:
+            'area', 'perimeter', 'compactness' (4 pi area / perimeter^2), 'eccentricity' (of the
+            equivalent ellipse), 'centroid' (n, 2) and 'bounding_box' (n, 4) as (xmin, ymin, xmax, ymax)
+    """
+    n_rois = point_set.n_rois
+    offsets = point_set.offsets
+    vertices = point_set.vertices if pixel_spacing is None else scale_vertices(point_set, pixel_spacing)
+    ids = roi_ids(offsets)
+    following = next_vertex(offsets)
+    closed = np.diff(offsets) >= 3
+
+    x0, y0 = vertices[:, 0], vertices[:, 1]
+    x1, y1 = vertices[following, 0], vertices[following, 1]
+    cross = x0 * y1 - x1 * y0
+
+    def per_roi(weights: ndarray) -> ndarray:
+        return np.bincount(ids, weights=weights, minlength=n_rois)
+
+    signed_area = np.where(closed, 0.5 * per_roi(cross), 0.0)
+    area = np.abs(signed_area)
+    perimeter = per_roi(np.hypot(x1 - x0, y1 - y0))
+
+    # Polygon moments by Green's theorem; the signed area cancels the winding direction
+    with np.errstate(invalid="ignore", divide="ignore"):
+        safe_area = np.where(signed_area != 0, signed_area, 1.0)
+        centroid_x = per_roi((x0 + x1) * cross) / (6 * safe_area)
+        centroid_y = per_roi((y0 + y1) * cross) / (6 * safe_area)
+        mu20 = per_roi((x0 * x0 + x0 * x1 + x1 * x1) * cross) / (12 * safe_area) - centroid_x ** 2
+        mu02 = per_roi((y0 * y0 + y0 * y1 + y1 * y1) * cross) / (12 * safe_area) - centroid_y ** 2
+        mu11 = per_roi((x0 * y1 + 2 * x0 * y0 + 2 * x1 * y1 + x1 * y0) * cross) / (24 * safe_area) \
+            - centroid_x * centroid_y
+
+        half_trace = (mu20 + mu02) / 2
+        root = np.sqrt(np.maximum(((mu20 - mu02) / 2) ** 2 + mu11 ** 2, 0.0))
+        major = half_trace + root
+        minor = np.maximum(half_trace - root, 0.0)
+        eccentricity = np.where(major > 0, np.sqrt(np.clip(1 - minor / np.where(major > 0, major, 1.0), 0, 1)), 0.0)
+        compactness = np.where(perimeter > 0, 4 * np.pi * area / np.where(perimeter > 0, perimeter, 1.0) ** 2, 0.0)
+
+    boxes = bounding_boxes(vertices, offsets)
+    # Degenerate ROIs fall back to the mean of their points
+    counts = np.diff(offsets)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        mean_x = per_roi(x0) / counts
+        mean_y = per_roi(y0) / counts
+    centroid_x = np.where(signed_area != 0, centroid_x, mean_x)
+    centroid_y = np.where(signed_area != 0, centroid_y, mean_y)
+    eccentricity = np.where(signed_area != 0, eccentricity, np.nan)
+
+    return {
+        'area': area,
+        'perimeter': perimeter,
+        'compactness': compactness,
+        'eccentricity': eccentricity,
+        'centroid': np.stack([centroid_x, centroid_y], axis=1),
+        'bounding_box': boxes
+    }
@@ -0,0 +1,353 @@
+from __future__ import annotations
+from typing import Tuple, Dict, List, Optional, NamedTuple, Sequence
+from concurrent.futures import ThreadPoolExecutor
+
+from numpy import ndarray
+import numpy as np
+
+from osirix.roi import ROI
+
+class ROIPointSet(NamedTuple):
+    '''
+    The points of many ROIs held as flat arrays. The vertices of ROI i are
+    vertices[offsets[i]:offsets[i + 1]], given as (x, y) = (column, row) in pixels.
+    '''
+    vertices: ndarray
+    offsets: ndarray
+    slice_indices: ndarray
+    rois: Tuple[ROI, ...]
+
+    @classmethod
+    def from_rois(cls,
+                  rois: Sequence[ROI],
+                  slice_indices: Optional[Sequence[int]] = None,
+                  workers: int = 8) -> ROIPointSet:
+        """
+          Makes concurrent gRPC requests to retrieve the points of many ROIs
+
+          Args:
+            Sequence[ROI] : rois
+            Sequence[int] : slice_indices, the slice each ROI is drawn on (defaults to 0)
+            int : workers, the maximum number of requests in flight at once
+
+          Returns:
+            ROIPointSet
+        """
+        rois = tuple(rois)
+
+        def fetch(roi):
+            response = roi.osirix_service.ROIPoints(roi.osirixrpc_uid)
+            roi.response_processor.response_check(response)
+            return np.array([(point.x, point.y) for point in response.points], dtype=np.float64).reshape(-1, 2)
+
+        with ThreadPoolExecutor(max_workers=max(1, workers)) as executor:
+            points = list(executor.map(fetch, rois))
+
+        return cls.from_arrays(points, slice_indices, rois)
+
+    @classmethod
+    def from_arrays(cls,
+                    points: Sequence[ndarray],
+                    slice_indices: Optional[Sequence[int]] = None,
+                    rois: Tuple[ROI, ...] = ()) -> ROIPointSet:
+        """
+          Builds the flat representation from one (n, 2) array of points per ROI
+
+          Args:
+            Sequence[ndarray] : points
+            Sequence[int] : slice_indices, the slice each ROI is drawn on (defaults to 0)
+            Tuple[ROI, ...] : rois, the ROIs the points belong to, if known
+
+          Returns:
+            ROIPointSet
+        """
+        counts = np.array([len(p) for p in points], dtype=np.int64)
+        offsets = np.zeros(len(counts) + 1, dtype=np.int64)
+        np.cumsum(counts, out=offsets[1:])
+        if len(points) > 0:
+            vertices = np.concatenate([np.asarray(p, dtype=np.float64).reshape(-1, 2) for p in points])
+        else:
+            vertices = np.empty((0, 2), dtype=np.float64)
+        if slice_indices is None:
+            slice_indices = np.zeros(len(counts), dtype=np.int32)
+        return cls(vertices, offsets, np.asarray(slice_indices, dtype=np.int32), tuple(rois))
+
+    @property
+    def n_rois(self) -> int:
+        """
+          Provides the number of ROIs in the point set
+        """
+        return len(self.offsets) - 1
+
+    def points(self, i: int) -> ndarray:
+        """
+          Provides the points of one ROI
+
+          Returns:
+            ndarray : (n, 2) points of ROI i
+        """
+        return self.vertices[self.offsets[i]:self.offsets[i + 1]]
+
+def roi_ids(offsets: ndarray) -> ndarray:
+    """
+    Provides, for each vertex, the index of the ROI it belongs to
+    """
+    return np.repeat(np.arange(len(offsets) - 1), np.diff(offsets))
+
+def next_vertex(offsets: ndarray) -> ndarray:
+    """
+    Provides, for each vertex, the index of the following vertex of the same closed polygon
+    """
+    n_vertices = offsets[-1]
+    following = np.arange(1, n_vertices + 1)
+    counts = np.diff(offsets)
+    non_empty = counts > 0
+    following[offsets[1:][non_empty] - 1] = offsets[:-1][non_empty]
+    return following
+
+def bounding_boxes(vertices: ndarray, offsets: ndarray) -> ndarray:
+    """
+    Provides the (xmin, ymin, xmax, ymax) bounding box of each ROI. Empty ROIs have NaN boxes.
+    """
+    n_rois = len(offsets) - 1
+    boxes = np.full((n_rois, 4), np.nan)
+    non_empty = np.diff(offsets) > 0
+    if np.any(non_empty):
+        starts = offsets[:-1][non_empty]
+        boxes[non_empty, 0:2] = np.minimum.reduceat(vertices, starts, axis=0)
+        boxes[non_empty, 2:4] = np.maximum.reduceat(vertices, starts, axis=0)
+    return boxes
+
+def points_in_polygon(points: ndarray, polygon: ndarray, chunk_size: int = 65536) -> ndarray:
+    """
+    Even-odd test of many (x, y) points against one closed polygon
+
+    Returns:
+        ndarray : bool, whether each point lies inside the polygon
+    """
+    points = np.asarray(points, dtype=np.float64).reshape(-1, 2)
+    inside = np.zeros(len(points), dtype=bool)
+    if len(polygon) < 3:
+        return inside
+    x0, y0 = polygon[:, 0], polygon[:, 1]
+    x1, y1 = np.roll(x0, -1), np.roll(y0, -1)
+    dy = np.where(y1 == y0, 1.0, y1 - y0)
+    step = max(1, chunk_size // len(polygon))
+    for start in range(0, len(points), step):
+        x = points[start:start + step, 0:1]
+        y = points[start:start + step, 1:2]
+        crosses = (y0 > y) != (y1 > y)
+        x_intersect = x0 + (y - y0) * (x1 - x0) / dy
+        inside[start:start + step] = np.count_nonzero(crosses & (x < x_intersect), axis=1) % 2 == 1
+    return inside
+
+def rasterize(polygon: ndarray, origin: Tuple[int, int], shape: Tuple[int, int]) -> ndarray:
+    """
+    Rasterises a polygon by testing pixel centres on a grid of shape (rows, columns) whose first pixel is at
+    origin (column, row)
+
+    Returns:
+        ndarray : bool mask of shape (rows, columns)
+    """
+    rows, columns = np.mgrid[0:shape[0], 0:shape[1]]
+    centres = np.stack([(columns + origin[0] + 0.5).ravel(), (rows + origin[1] + 0.5).ravel()], axis=1)
+    return points_in_polygon(centres, polygon).reshape(shape)
+
+class ROISpatialIndex(object):
+    '''
+    Class representing a uniform-grid index over the bounding boxes of many ROIs, slice by slice, answering
+    point-in-ROI, box-intersection and pairwise overlap queries without contacting the Osirix service
+    '''
+    # Smallest cell size in pixels, so that point ROIs cannot shrink the grid below pixel resolution
+    MIN_CELL_SIZE = 1.0
+    # ROIs covering more cells than this are kept in a per-slice list checked by every query instead
+    MAX_CELLS_PER_ROI = 1024
+
+    def __init__(self,
+                 point_set: ROIPointSet,
+                 cell_size: Optional[float] = None):
+        self.point_set = point_set
+        self.boxes = bounding_boxes(point_set.vertices, point_set.offsets)
+        self._following = next_vertex(point_set.offsets)
+        self._ids = roi_ids(point_set.offsets)
+
+        valid = ~np.isnan(self.boxes[:, 0])
+        if cell_size is None:
+            extents = np.maximum(self.boxes[valid, 2] - self.boxes[valid, 0], self.boxes[valid, 3] - self.boxes[valid, 1])
+            extents = extents[extents > 0]
+            cell_size = float(np.median(extents)) if len(extents) > 0 else self.MIN_CELL_SIZE
+        self.cell_size = max(float(cell_size), self.MIN_CELL_SIZE)
+        self._cells: Dict[Tuple[int, int, int], ndarray] = {}
+        self._large: Dict[int, ndarray] = {}
+        # Occupied cells of each slice, as (x, y) cell coordinates and the ROIs of each cell
+        self._slice_cells: Dict[int, Tuple[ndarray, List[ndarray]]] = {}
+
+        candidates = np.nonzero(valid)[0]
+        if len(candidates) == 0:
+            return
+        cell_min = np.floor(self.boxes[candidates, 0:2] / self.cell_size).astype(np.int64)
+        cell_max = np.floor(self.boxes[candidates, 2:4] / self.cell_size).astype(np.int64)
+        cells_x = cell_max[:, 0] - cell_min[:, 0] + 1
+        cells_y = cell_max[:, 1] - cell_min[:, 1] + 1
+        n_cells = cells_x * cells_y
+
+        large = n_cells > self.MAX_CELLS_PER_ROI
+        for s in np.unique(point_set.slice_indices[candidates[large]]):
+            self._large[int(s)] = candidates[large & (point_set.slice_indices[candidates] == s)]
+        candidates, cell_min = candidates[~large], cell_min[~large]
+        cells_x, n_cells = cells_x[~large], n_cells[~large]
+        if len(candidates) == 0:
+            return
+
+        # One entry per (ROI, covered cell), generated without a Python loop over ROIs
+        entry_roi = np.repeat(np.arange(len(candidates)), n_cells)
+        entry_start = np.repeat(np.cumsum(n_cells) - n_cells, n_cells)
+        local = np.arange(n_cells.sum()) - entry_start
+        entry_x = cell_min[entry_roi, 0] + local % cells_x[entry_roi]
+        entry_y = cell_min[entry_roi, 1] + local // cells_x[entry_roi]
+        entry_slice = point_set.slice_indices[candidates][entry_roi]
+
+        order = np.lexsort((entry_y, entry_x, entry_slice))
+        keys = np.stack([entry_slice[order], entry_x[order], entry_y[order]], axis=1)
+        members = candidates[entry_roi[order]]
+        boundaries = np.nonzero(np.any(np.diff(keys, axis=0) != 0, axis=1))[0] + 1
+        starts = np.concatenate([[0], boundaries])
+        for start, stop in zip(starts, np.concatenate([boundaries, [len(keys)]])):
+            self._cells[tuple(int(k) for k in keys[start])] = members[start:stop]
+        for s in np.unique(keys[starts, 0]):
+            in_slice = starts[keys[starts, 0] == s]
+            self._slice_cells[int(s)] = (keys[in_slice, 1:3], [self._cells[tuple(int(k) for k in keys[start])]
+                                                               for start in in_slice])
+
+    def _cell(self, value: float) -> int:
+        return int(np.floor(value / self.cell_size))
+
+    def query_point(self, x: float, y: float, slice_idx: int) -> ndarray:
+        """
+          Finds the ROIs that contain a point
+
+          Args:
+            float : x, column in pixels
+            float : y, row in pixels
+            int : slice_idx
+
+          Returns:
+            ndarray : indices into the point set of the ROIs containing the point
+        """
+        candidates = self._cells.get((slice_idx, self._cell(x), self._cell(y)), np.empty(0, dtype=np.int64))
+        if slice_idx in self._large:
+            candidates = np.concatenate([candidates, self._large[slice_idx]])
+        boxes = self.boxes[candidates]
+        candidates = candidates[(boxes[:, 0] <= x) & (x <= boxes[:, 2]) & (boxes[:, 1] <= y) & (y <= boxes[:, 3])]
+        if len(candidates) == 0:
+            return candidates
+
+        # Even-odd test of the point against the edges of all candidates at once
+        offsets = self.point_set.offsets
+        edges = np.concatenate([np.arange(offsets[i], offsets[i + 1]) for i in candidates])
+        x0, y0 = self.point_set.vertices[edges, 0], self.point_set.vertices[edges, 1]
+        x1, y1 = self.point_set.vertices[self._following[edges], 0], self.point_set.vertices[self._following[edges], 1]
+        dy = np.where(y1 == y0, 1.0, y1 - y0)
+        crosses = ((y0 > y) != (y1 > y)) & (x < x0 + (y - y0) * (x1 - x0) / dy)
+        counts = np.bincount(self._ids[edges], weights=crosses, minlength=len(self.boxes))[candidates]
+        closed = np.diff(offsets)[candidates] >= 3
+        return candidates[(counts % 2 == 1) & closed]
+
+    def query_box(self, xmin: float, ymin: float, xmax: float, ymax: float, slice_idx: int) -> ndarray:
+        """
+          Finds the ROIs whose bounding box intersects a box
+
+          Args:
+            float : xmin, ymin, xmax, ymax, the box in pixels
+            int : slice_idx
+
+          Returns:
+            ndarray : indices into the point set of the intersecting ROIs
+        """
+        found = [self._large.get(slice_idx, np.empty(0, dtype=np.int64))]
+        if slice_idx in self._slice_cells:
+            coordinates, cell_members = self._slice_cells[slice_idx]
+            # The box is clipped to the occupied cells, so unbounded boxes are supported
+            first, last = coordinates.min(axis=0), coordinates.max(axis=0)
+            x0 = self._cell(max(xmin, first[0] * self.cell_size))
+            x1 = self._cell(min(xmax, last[0] * self.cell_size))
+            y0 = self._cell(max(ymin, first[1] * self.cell_size))
+            y1 = self._cell(min(ymax, last[1] * self.cell_size))
+            if (x1 - x0 + 1) * (y1 - y0 + 1) > len(coordinates):
+                inside = ((coordinates[:, 0] >= x0) & (coordinates[:, 0] <= x1) &
+                          (coordinates[:, 1] >= y0) & (coordinates[:, 1] <= y1))
+                found.extend(cell_members[i] for i in np.nonzero(inside)[0])
+            else:
+                for cell_x in range(x0, x1 + 1):
+                    for cell_y in range(y0, y1 + 1):
+                        members = self._cells.get((slice_idx, cell_x, cell_y))
+                        if members is not None:
+                            found.append(members)
+        candidates = np.unique(np.concatenate(found)).astype(np.int64)
+        boxes = self.boxes[candidates]
+        hit = (boxes[:, 0] <= xmax) & (xmin <= boxes[:, 2]) & (boxes[:, 1] <= ymax) & (ymin <= boxes[:, 3])
+        return candidates[hit]
+
+    def overlaps(self, slice_idx: Optional[int] = None, min_iou: float = 0.0) -> Tuple[ndarray, ndarray, ndarray]:
+        """
+          Computes the overlap of every pair of ROIs on the same slice whose bounding boxes intersect. Areas
+          are measured by rasterising each ROI once at pixel resolution.
+
+          Args:
+            int : slice_idx, if None all slices are considered
+            float : min_iou, pairs with a lower intersection-over-union are dropped
+
+          Returns:
+            A Tuple containing the (n, 2) ROI index pairs, their Dice coefficients and their IoU in ndarray
+        """
+        slices = np.unique(self.point_set.slice_indices) if slice_idx is None else np.array([slice_idx])
+        valid = ~np.isnan(self.boxes[:, 0])
+        pairs = []
+        for s in slices:
+            members = np.nonzero(valid & (self.point_set.slice_indices == s))[0]
+            if len(members) < 2:
+                continue
+            b = self.boxes[members]
+            hit = ((b[:, None, 0] <= b[None, :, 2]) & (b[None, :, 0] <= b[:, None, 2]) &
+                   (b[:, None, 1] <= b[None, :, 3]) & (b[None, :, 1] <= b[:, None, 3]))
+            first, second = np.nonzero(np.triu(hit, k=1))
+            pairs.append(np.stack([members[first], members[second]], axis=1))
+        if len(pairs) == 0:
+            return np.empty((0, 2), dtype=np.int64), np.empty(0), np.empty(0)
+        pairs = np.concatenate(pairs)
+
+        origins = np.floor(np.nan_to_num(self.boxes[:, 0:2])).astype(np.int64)
+        masks: Dict[int, ndarray] = {}
+
+        def mask_of(i: int) -> ndarray:
+            if i not in masks:
+                box = self.boxes[i]
+                shape = (int(np.ceil(box[3])) - origins[i, 1] + 1, int(np.ceil(box[2])) - origins[i, 0] + 1)
+                masks[i] = rasterize(self.point_set.points(i), (origins[i, 0], origins[i, 1]), shape)
+            return masks[i]
+
+        intersections = np.zeros(len(pairs))
+        areas = {}
+        for k, (i, j) in enumerate(pairs):
+            mask_i, mask_j = mask_of(i), mask_of(j)
+            for index, mask in ((i, mask_i), (j, mask_j)):
+                if index not in areas:
+                    areas[index] = np.count_nonzero(mask)
+            column0 = max(origins[i, 0], origins[j, 0])
+            row0 = max(origins[i, 1], origins[j, 1])
+            column1 = min(origins[i, 0] + mask_i.shape[1], origins[j, 0] + mask_j.shape[1])
+            row1 = min(origins[i, 1] + mask_i.shape[0], origins[j, 1] + mask_j.shape[0])
+            if column1 <= column0 or row1 <= row0:
+                continue
+            crop_i = mask_i[row0 - origins[i, 1]:row1 - origins[i, 1], column0 - origins[i, 0]:column1 - origins[i, 0]]
+            crop_j = mask_j[row0 - origins[j, 1]:row1 - origins[j, 1], column0 - origins[j, 0]:column1 - origins[j, 0]]
+            intersections[k] = np.count_nonzero(crop_i & crop_j)
+
+        area_i = np.array([areas[i] for i in pairs[:, 0]], dtype=np.float64)
+        area_j = np.array([areas[j] for j in pairs[:, 1]], dtype=np.float64)
+        union = area_i + area_j - intersections
+        with np.errstate(invalid="ignore", divide="ignore"):
+            dice = np.where(area_i + area_j > 0, 2 * intersections / (area_i + area_j), 0.0)
+            iou = np.where(union > 0, intersections / union, 0.0)
+        keep = iou >= min_iou
+        return pairs[keep], dice[keep], iou[keep]
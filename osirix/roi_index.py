@@ -0,0 +1,138 @@
+from __future__ import annotations
+from typing import Tuple, Dict, List, Optional, Iterable
+from concurrent.futures import ThreadPoolExecutor
+
+from osirix.roi import ROI
+from osirix.lazy_sequence import LazySequence
+
+class ROIIndex(object):
+    '''
+    Class representing an in-memory index of the ROIs of a ViewerController by name. The ROI list is pulled
+    from the Osirix service once and lookups are then answered locally.
+    '''
+
+    def __init__(self,
+                 viewer_controller,
+                 movie_indices: Iterable[int],
+                 workers: int = 8):
+        self.viewer_controller = viewer_controller
+        self.movie_indices = tuple(movie_indices)
+        self.workers = workers
+        self._names: Dict[str, str] = {}
+        self._fingerprint: Tuple[Tuple[Tuple[str, ...], ...], ...] = ()
+        self._index: Dict[int, Dict[str, List[Tuple[int, ROI]]]] = {}
+        self.refresh()
+
+    def _fetch_roi_slices(self) -> Tuple[LazySequence[LazySequence[ROI]], ...]:
+        return tuple(self.viewer_controller.roi_list(movie_idx) for movie_idx in self.movie_indices)
+
+    @staticmethod
+    def _fingerprint_of(movie_roi_slices) -> Tuple[Tuple[Tuple[str, ...], ...], ...]:
+        return tuple(tuple(tuple(roi.osirixrpc_uid.osirixrpc_uid for roi in roi_tuple) for roi_tuple in roi_slices)
+                     for roi_slices in movie_roi_slices)
+
+    def _build(self, movie_roi_slices) -> None:
+        new_rois = {}
+        for roi_slices in movie_roi_slices:
+            for roi_tuple in roi_slices:
+                for roi in roi_tuple:
+                    uid = roi.osirixrpc_uid.osirixrpc_uid
+                    if uid not in self._names:
+                        new_rois[uid] = roi
+
+        if len(new_rois) > 0:
+            with ThreadPoolExecutor(max_workers=max(1, self.workers)) as executor:
+                names = list(executor.map(lambda roi: roi.name, new_rois.values()))
+            self._names.update(zip(new_rois.keys(), names))
+
+        index: Dict[int, Dict[str, List[Tuple[int, ROI]]]] = {}
+        live_uids = set()
+        for movie_idx, roi_slices in zip(self.movie_indices, movie_roi_slices):
+            movie_index: Dict[str, List[Tuple[int, ROI]]] = {}
+            for slice_idx, roi_tuple in enumerate(roi_slices):
+                for roi in roi_tuple:
+                    uid = roi.osirixrpc_uid.osirixrpc_uid
+                    live_uids.add(uid)
+                    movie_index.setdefault(self._names[uid], []).append((slice_idx, roi))
+            index[movie_idx] = movie_index
+
+        # Forget names of ROIs that no longer exist so the cache does not grow without bound
+        self._names = {uid: name for uid, name in self._names.items() if uid in live_uids}
+        self._fingerprint = self._fingerprint_of(movie_roi_slices)
+        self._index = index
+
+    def refresh(self) -> None:
+        """
+          Rebuilds the index from scratch, fetching the ROI list and the name of every ROI. Use this after ROIs
+          have been renamed, which is not visible to has_changed()
+
+          Returns:
+            None
+        """
+        self._names = {}
+        self._build(self._fetch_roi_slices())
+
+    def has_changed(self) -> bool:
+        """
+          Makes a single ROI list request per movie index and compares the ROI identifiers with those indexed
+
+          Returns:
+            bool : whether ROIs have been added, removed or moved since the index was built
+        """
+        return self._fingerprint_of(self._fetch_roi_slices()) != self._fingerprint
+
+    def update(self) -> bool:
+        """
+          Brings the index up to date if ROIs have been added, removed or moved. Only the names of new ROIs
+          are requested from the Osirix service.
+
+          Returns:
+            bool : whether the index was changed
+        """
+        movie_roi_slices = self._fetch_roi_slices()
+        if self._fingerprint_of(movie_roi_slices) == self._fingerprint:
+            return False
+        self._build(movie_roi_slices)
+        return True
+
+    def names(self) -> Tuple[str, ...]:
+        """
+          Provides the names of all indexed ROIs
+
+          Returns:
+            A Tuple containing the ROI names, sorted
+        """
+        names = set()
+        for movie_index in self._index.values():
+            names.update(movie_index.keys())
+        return tuple(sorted(names))
+
+    def rois_with_name(self, name: str, movie_idx: Optional[int] = None) -> List[Tuple[int, ROI]]:
+        """
+          Looks up the ROIs with a given name without contacting the Osirix service
+
+          Args:
+            str : name
+            int : movie_idx, if None the ROIs of all indexed movie indices are returned
+
+          Returns:
+            A List containing (slice index, ROI) for each ROI with the name
+        """
+        if movie_idx is not None:
+            if movie_idx not in self._index:
+                raise KeyError("Movie index %d is not indexed" % movie_idx)
+            return list(self._index[movie_idx].get(name, []))
+
+        rois: List[Tuple[int, ROI]] = []
+        for movie_idx in self.movie_indices:
+            rois.extend(self._index[movie_idx].get(name, []))
+        return rois
+
+    def __getitem__(self, name: str) -> List[Tuple[int, ROI]]:
+        return self.rois_with_name(name)
+
+    def __contains__(self, name: str) -> bool:
+        return any(name in movie_index for movie_index in self._index.values())
+
+    def __len__(self) -> int:
+        return sum(len(rois) for movie_index in self._index.values() for rois in movie_index.values())
@@ -0,0 +1,164 @@
+from __future__ import annotations
+from functools import partial
+from typing import Any, Callable, Dict, FrozenSet, Hashable, Iterable, Tuple
+import threading
+
+# RPCs that only read state from Osirix, the only ones whose concurrent identical calls may be merged
+READ_ONLY_METHODS: FrozenSet[str] = frozenset((
+    "BrowserControllerDatabaseSelection",
+    "DCMPixDicomImage", "DCMPixDicomSeries", "DCMPixDicomStudy", "DCMPixGetMapFromROI", "DCMPixImage",
+    "DCMPixIsRGB", "DCMPixOrientation", "DCMPixOrigin", "DCMPixROIValues", "DCMPixShape", "DCMPixSliceLocation",
+    "DCMPixSourceFile", "DCMPixSpacing",
+    "DicomImageCompletePath", "DicomImageDate", "DicomImageHeight", "DicomImageInstanceNumber",
+    "DicomImageModality", "DicomImageNumberOfFrames", "DicomImageSOPInstanceUID", "DicomImageSeries",
+    "DicomImageSliceLocation", "DicomImageWidth",
+    "DicomSeriesDate", "DicomSeriesImages", "DicomSeriesModality", "DicomSeriesName", "DicomSeriesNextSeries",
+    "DicomSeriesNumberOfImages", "DicomSeriesPaths", "DicomSeriesPreviousSeries", "DicomSeriesSeriesDescription",
+    "DicomSeriesSeriesInstanceUID", "DicomSeriesSeriesSOPClassUID", "DicomSeriesSortedImages", "DicomSeriesStudy",
+    "DicomStudyDate", "DicomStudyDateAdded", "DicomStudyDateOfBirth", "DicomStudyImages",
+    "DicomStudyInstitutionName", "DicomStudyModalities", "DicomStudyName", "DicomStudyNoFiles",
+    "DicomStudyNoFilesExcludingMultiFrames", "DicomStudyNumberOfImages", "DicomStudyPaths", "DicomStudyPatientID",
+    "DicomStudyPatientSex", "DicomStudyPatientUID", "DicomStudyPerformingPhysician", "DicomStudyRawNoFiles",
+    "DicomStudySeries", "DicomStudyStudyInstanceUID", "DicomStudyStudyName",
+    "OsirixCurrentBrowser", "OsirixDisplayed2DViewers", "OsirixDisplayedVRControllers",
+    "OsirixFrontmostVRController", "OsirixFrontmostViewer",
+    "ROIArea", "ROICentroid", "ROIColor", "ROIName", "ROIOpacity", "ROIPix", "ROIPoints", "ROIThickness",
+    "ROIVolumeColor", "ROIVolumeFactor", "ROIVolumeName", "ROIVolumeOpacity", "ROIVolumeTexture",
+    "ROIVolumeVisible", "ROIVolumeVolume",
+    "VRControllerBlendingController", "VRControllerRenderingMode", "VRControllerStyle", "VRControllerTitle",
+    "VRControllerViewer2D", "VRControllerWLWW",
+    "ViewerControllerCurDCM", "ViewerControllerIdx", "ViewerControllerIsDataVolumic", "ViewerControllerMaxMovieIdx",
+    "ViewerControllerModality", "ViewerControllerMovieIdx", "ViewerControllerPixList", "ViewerControllerROIList",
+    "ViewerControllerROIsWithName", "ViewerControllerSelectedROIs", "ViewerControllerTitle",
+    "ViewerControllerVRControllers", "ViewerControllerWLWW",
+))
+
+class _Call(object):
+    __slots__ = ("done", "result", "error")
+
+    def __init__(self) -> None:
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+class SingleFlight(object):
+    '''
+    Class merging concurrent calls with the same key: the first caller runs the function and every caller that
+    arrives before it returns receives the same result (or exception). Results are not kept once the call returns.
+    '''
+
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        self._calls: Dict[Hashable, _Call] = {}
+        self.calls = 0
+        self.coalesced = 0
+
+    def do(self, key: Hashable, function: Callable[[], Any]) -> Any:
+        """
+        Runs function, unless a call with the same key is in flight, in which case its result is waited for
+
+        Args:
+            key : identifies identical calls
+            function : callable without arguments
+
+        Returns:
+            the result of function
+        """
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = _Call()
+                self._calls[key] = call
+                self.calls += 1
+            else:
+                self.coalesced += 1
+        if not leader:
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result
+        try:
+            call.result = function()
+        except BaseException as exc:
+            call.error = exc
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call.done.set()
+        return call.result
+
+class CoalescingService(object):
+    '''
+    Class wrapping the Osirix service stub so that concurrent identical requests of chosen read-only methods share
+    one in-flight RPC. Calls are identical when they have the same method and serialized request. Other methods
+    are taken from the stub unchanged.
+    '''
+
+    def __init__(self, osirix_service, methods: Iterable[str] = ()) -> None:
+        """
+        Args:
+            osirix_service : the OsiriXServiceStub
+            methods : names of the methods to coalesce, each in READ_ONLY_METHODS
+        """
+        self._osirix_service = osirix_service
+        self._single_flight = SingleFlight()
+        # Guards _methods and the stored methods, so a lookup cannot store a stale method after coalesce()
+        self._lock = threading.Lock()
+        self._methods: FrozenSet[str] = frozenset()
+        self.coalesce(*methods)
+
+    def __getattr__(self, name: str) -> Any:
+        # Only reached for methods not yet looked up, which are then stored so later lookups are direct
+        if name.startswith("_"):
+            raise AttributeError(name)
+        method = getattr(self._osirix_service, name)
+        with self._lock:
+            if name in self._methods:
+                method = partial(self._call, name, method)
+            setattr(self, name, method)
+        return method
+
+    @property
+    def methods(self) -> FrozenSet[str]:
+        return self._methods
+
+    @property
+    def stats(self) -> Tuple[int, int]:
+        """
+        Provides the number of RPCs made by coalesced methods and the number of calls that shared one of them
+        """
+        return self._single_flight.calls, self._single_flight.coalesced
+
+    def coalesce(self, *methods: str) -> None:
+        """
+        Starts coalescing concurrent identical calls of methods
+
+        Args:
+            methods : names of read-only service methods
+        """
+        writes = [method for method in methods if method not in READ_ONLY_METHODS]
+        if writes:
+            raise ValueError("Only read-only methods can be coalesced, not %s" % ", ".join(writes))
+        with self._lock:
+            self._methods = self._methods | frozenset(methods)
+            for method in methods:
+                self.__dict__.pop(method, None)
+
+    def uncoalesce(self, *methods: str) -> None:
+        """
+        Stops coalescing calls of methods, or of every method if none are given
+        """
+        with self._lock:
+            methods = methods or tuple(self._methods)
+            self._methods = self._methods - frozenset(methods)
+            for method in methods:
+                self.__dict__.pop(method, None)
+
+    def _call(self, name: str, method: Callable, request, *args, **kwargs) -> Any:
+        if args or kwargs:
+            # Calls with a timeout, metadata or other options are not merged
+            return method(request, *args, **kwargs)
+        key = (name, request.SerializeToString(deterministic=True))
+        return self._single_flight.do(key, partial(method, request))
@@ -0,0 +1,92 @@
+from __future__ import annotations
+from dataclasses import dataclass
+from typing import Any, Optional, Sequence, Tuple
+
+from numpy import ndarray
+import numpy as np
+
+@dataclass(frozen=True)
+class SliceOrder:
+    """
+    Geometric order of the images of a series. Arrays are in sorted order, with order giving the index of each
+    sorted image in the original sequence.
+
+    duplicates holds groups of sorted indices sharing one slice location, and gaps the sorted indices after which
+    the distance to the next location exceeds the slice spacing, with the estimated number of missing slices.
+    """
+    order: ndarray
+    slice_locations: ndarray
+    instance_numbers: ndarray
+    spacing: Optional[float]
+    duplicates: Tuple[Tuple[int, ...], ...]
+    gaps: Tuple[Tuple[int, int], ...]
+    images: Tuple[Any, ...] = ()
+
+    @property
+    def is_regular(self) -> bool:
+        """
+        Whether the slices are evenly spaced with neither duplicates nor gaps
+        """
+        return len(self.duplicates) == 0 and len(self.gaps) == 0
+
+def geometric_order(slice_locations: Sequence[Optional[float]],
+                    instance_numbers: Sequence[Optional[int]],
+                    tolerance: float = 0.01) -> SliceOrder:
+    """
+    Sorts slices by location along the slice normal, breaking ties by instance number. If any location is missing
+    the slices are sorted by instance number only and no duplicates or gaps are reported.
+
+    Args:
+        slice_locations : the slice location of each image, None when unknown
+        instance_numbers : the instance number of each image, None when unknown
+        tolerance : locations closer than tolerance * spacing are duplicates, and steps longer than
+                    (1 + tolerance) * spacing are gaps, where spacing is the median step between distinct locations
+
+    Returns:
+        SliceOrder
+    """
+    locations = np.array([np.nan if value is None else value for value in slice_locations], dtype=np.float64)
+    numbers = np.array([np.nan if value is None else value for value in instance_numbers], dtype=np.float64)
+    if len(locations) != len(numbers):
+        raise ValueError("Slice locations and instance numbers must have the same length")
+
+    if len(locations) == 0 or np.isnan(locations).any():
+        order = np.argsort(numbers, kind="stable")
+        return SliceOrder(order=order, slice_locations=locations[order], instance_numbers=numbers[order],
+                          spacing=None, duplicates=(), gaps=())
+
+    # np.lexsort sorts by its last key first
+    order = np.lexsort((np.nan_to_num(numbers, nan=np.inf), locations))
+    sorted_locations = locations[order]
+    steps = np.diff(sorted_locations)
+    distinct_steps = steps[steps > 0]
+    spacing = float(np.median(distinct_steps)) if len(distinct_steps) > 0 else None
+
+    duplicates = ()
+    gaps = ()
+    if spacing is not None:
+        same = steps <= tolerance * spacing
+        duplicates = _runs(same)
+        large = np.flatnonzero(steps > (1 + tolerance) * spacing)
+        gaps = tuple((int(i), max(1, int(np.rint(steps[i] / spacing)) - 1)) for i in large)
+    elif len(locations) > 1:
+        duplicates = (tuple(range(len(locations))),)
+
+    return SliceOrder(order=order, slice_locations=sorted_locations, instance_numbers=numbers[order],
+                      spacing=spacing, duplicates=duplicates, gaps=gaps)
+
+def _runs(same: ndarray) -> Tuple[Tuple[int, ...], ...]:
+    # Groups consecutive sorted indices i, i + 1, ... for which same[i] is True
+    runs = []
+    run = []
+    for i, value in enumerate(same):
+        if value:
+            if not run:
+                run = [i]
+            run.append(i + 1)
+        elif run:
+            runs.append(tuple(run))
+            run = []
+    if run:
+        runs.append(tuple(run))
+    return tuple(runs)
@@ -0,0 +1,202 @@
+from __future__ import annotations
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Dict, Iterator, List, Optional, Sequence, Tuple
+import queue
+import threading
+
+from osirix.exceptions import GrpcException
+
+DIRECTIONS = ("next", "previous")
+
+def series_uid(series) -> str:
+    return series.osirixrpc_uid.osirixrpc_uid
+
+class SeriesTraversal(object):
+    '''
+    Class walking the next_series / previous_series links of DicomSeries. Hops that are already known to be needed
+    are requested concurrently, so a study costs one round of concurrent requests rather than one request after
+    another. A walk stops when it reaches a series it has already yielded, which is recorded in cycles.
+    '''
+
+    def __init__(self, browser_controller=None, direction: str = "next", workers: int = 8, prefetch: int = 8):
+        """
+        Args:
+            browser_controller : the BrowserController of the database, only needed by database()
+            direction : "next" or "previous"
+            workers : the maximum number of requests in flight at once
+            prefetch : the maximum number of hops walk() requests ahead of the consumer
+        """
+        if direction not in DIRECTIONS:
+            raise ValueError("direction must be one of %s" % (DIRECTIONS,))
+        self.browser_controller = browser_controller
+        self.direction = direction
+        self.workers = workers
+        self.prefetch = prefetch
+        self.cycles: List[Tuple[str, str]] = []
+
+    def _hop(self, series):
+        try:
+            return getattr(series, self.direction + "_series")()
+        except GrpcException:
+            return None
+
+    def walk(self, start, max_hops: Optional[int] = None) -> Iterator:
+        """
+        Follows the links from one series, yielding it first. Each hop depends on the previous one, so hops are
+        requested by a background thread that runs up to prefetch hops ahead of the consumer.
+
+        Args:
+            start : the DicomSeries to start from
+            max_hops : the maximum number of hops, unlimited if None
+
+        Yields:
+            DicomSeries
+        """
+        hops: queue.Queue = queue.Queue(maxsize=max(1, self.prefetch))
+        stop = threading.Event()
+        done = object()
+
+        def put(item) -> bool:
+            while not stop.is_set():
+                try:
+                    hops.put(item, timeout=0.1)
+                    return True
+                except queue.Full:
+                    pass
+            return False
+
+        def run():
+            visited = {series_uid(start)}
+            current = start
+            n_hops = 0
+            try:
+                while not stop.is_set() and (max_hops is None or n_hops < max_hops):
+                    following = self._hop(current)
+                    if following is None:
+                        break
+                    if series_uid(following) in visited:
+                        self.cycles.append((series_uid(current), series_uid(following)))
+                        break
+                    visited.add(series_uid(following))
+                    if not put(following):
+                        return
+                    current = following
+                    n_hops += 1
+            except BaseException as exc:
+                put(exc)
+                return
+            put(done)
+
+        thread = threading.Thread(target=run, daemon=True)
+        thread.start()
+        try:
+            yield start
+            while True:
+                item = hops.get()
+                if item is done:
+                    return
+                if isinstance(item, BaseException):
+                    raise item
+                yield item
+        finally:
+            stop.set()
+
+    def study(self, study) -> Iterator:
+        """
+        Yields the series of one study in link order. The hops of every series of the study are requested
+        concurrently up front; once they have arrived, each chain is yielded from the series that no other series
+        links to, and series in cycles follow in listing order.
+
+        Args:
+            study : the DicomStudy
+
+        Yields:
+            DicomSeries
+        """
+        executor = ThreadPoolExecutor(max_workers=max(1, self.workers))
+        futures: List[Future] = []
+        try:
+            members, hops = self._submit_hops(executor, futures, study.series)
+            yield from self._chains(members, hops)
+        finally:
+            self._shutdown(executor, futures)
+
+    def database(self, studies: Optional[Sequence] = None) -> Iterator:
+        """
+        Yields the series of every study of the database, study by study, in link order (see study()). The series
+        of all studies, then their hops, are requested concurrently while earlier studies are being consumed.
+
+        Args:
+            studies : the DicomStudy objects to visit, by default all studies of the database
+
+        Yields:
+            DicomSeries
+        """
+        if studies is None:
+            if self.browser_controller is None:
+                raise ValueError("A BrowserController is needed to traverse the whole database")
+            studies, _ = self.browser_controller.database_selection()
+        executor = ThreadPoolExecutor(max_workers=max(1, self.workers))
+        futures: List[Future] = []
+        lock = threading.Lock()
+
+        def study_hops(study):
+            members = list(study.series)
+            with lock:
+                return self._submit_hops(executor, futures, members)
+
+        try:
+            study_futures = [executor.submit(study_hops, study) for study in studies]
+            futures.extend(study_futures)
+            for future in study_futures:
+                members, hops = future.result()
+                yield from self._chains(members, hops)
+        finally:
+            self._shutdown(executor, futures)
+
+    def _submit_hops(self, executor: ThreadPoolExecutor, futures: List[Future],
+                     members: Sequence) -> Tuple[List, Dict[str, Future]]:
+        members = list(members)
+        if self.direction == "previous":
+            members.reverse()
+        hops = {}
+        for series in members:
+            future = executor.submit(self._hop, series)
+            futures.append(future)
+            hops[series_uid(series)] = future
+        return members, hops
+
+    def _chains(self, members: Sequence, hops: Dict[str, Future]) -> Iterator:
+        # Chains start at the series no other series links to; cycles and the rest follow in listing order
+        targets = set()
+        for uid, future in hops.items():
+            following = future.result()
+            if following is not None and series_uid(following) != uid:
+                targets.add(series_uid(following))
+        heads = [series for series in members if series_uid(series) not in targets] + list(members)
+        visited = set()
+        for head in heads:
+            if series_uid(head) in visited:
+                continue
+            chain = set()
+            current = head
+            while True:
+                chain.add(series_uid(current))
+                visited.add(series_uid(current))
+                yield current
+                following = hops[series_uid(current)].result()
+                if following is None or series_uid(following) not in hops:
+                    break
+                if series_uid(following) in chain:
+                    self.cycles.append((series_uid(current), series_uid(following)))
+                    break
+                if series_uid(following) in visited:
+                    break
+                current = following
+
+    @staticmethod
+    def _shutdown(executor: ThreadPoolExecutor, futures: List[Future]) -> None:
+        # Drop the hops nobody will consume when iteration stops early
+        for future in list(futures):
+            future.cancel()
+        executor.shutdown(wait=False)
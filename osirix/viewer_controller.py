@@ -1,8 +1,13 @@
 from __future__ import annotations
-from typing import Tuple, Dict
+from typing import Tuple, Dict, List, Optional, Sequence
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+from dataclasses import dataclass
 import sys
+import time
 
 from numpy import ndarray
+import numpy as np
 
 # sys.path.append("./pb2")
 # sys.path.append("/Users/admintmun/dev/pyosirix/osirix/pb2")
@@ -11,32 +16,109 @@ import osirixgrpc.vrcontroller_pb2 as vrcontroller_pb2
 import osirixgrpc.dcmpix_pb2 as dcmpix_pb2
 import osirixgrpc.roi_pb2 as roi_pb2
 from osirix.dicom import DicomSeries, DicomStudy, DicomImage
-from osirix.response_processor import ResponseProcessor
+from osirix.osirix_object import OsirixObject
+from osirix.lazy_sequence import LazySequence
+from osirix.cache import AttributeCache
 from osirix.dcm_pix import DCMPix
 from osirix.roi import ROI
-
-class ViewerController(object):
+from osirix.roi_index import ROIIndex
+from osirix.watcher import ViewerWatcher
+from osirix.cine import CinePlayer
+from osirix.windowing import sample_indices, window_from_values
+from osirix.roi_geometry import ROIPointSet
+from osirix.roi_features import shape_features
+from osirix.geometry import transform_points, slice_thicknesses, volume_affine
+from osirix.resample import resample
+from osirix.export import export_volume
+from osirix.local_loader import load_files, files_reachable, LOCAL_LOAD_ERRORS
+
+@dataclass(frozen=True)
+class ViewerControllerSnapshot:
+    """
+    The state of a ViewerController at one point in time
+    """
+    idx: int
+    movie_idx: int
+    modality: str
+    title: str
+    wlww: Tuple[float, float]
+    max_movie_index: int
+    timestamp: float
+
+class ViewerController(OsirixObject):
     '''
     Class representing the properties and methods to communicate with the Osirix service through
     gRPC for a ViewerController
     '''
 
-    def __init__(self, osirixrpc_uid, osirix_service):
-        self.osirixrpc_uid = osirixrpc_uid
-        self.osirix_service = osirix_service
-        self.response_processor = ResponseProcessor()
+    # Attributes that cannot change during the lifetime of a viewer are cached forever once caching is enabled
+    IMMUTABLE_ATTRIBUTES: Tuple[str, ...] = ("modality",)
+
+    __slots__ = ("cache_ttl", "_cache", "_volumes", "_idx", "_modality", "_movie_idx", "_title", "_wl", "_ww")
+
+    def __init__(self, osirixrpc_uid, osirix_service, cache_ttl: Optional[float] = None):
+        # ViewerControllers are interned, so only an explicitly given cache_ttl changes an existing object
+        if cache_ttl is not None:
+            self.cache_ttl = cache_ttl
+
+    def _setup(self) -> None:
+        self.cache_ttl = 0.0
+        self._cache = AttributeCache("ViewerController")
+        self._volumes: Dict[int, ndarray] = {}
+
+    def _cached(self, name: str, fetch):
+        if self.cache_ttl > 0 and name in self.IMMUTABLE_ATTRIBUTES:
+            return self._cache.get(name, None, fetch)
+        return self._cache.get(name, self.cache_ttl, fetch)
+
+    def _request_idx(self) -> int:
+        response_viewer_idx = self.osirix_service.ViewerControllerIdx(self.osirixrpc_uid)
+        self.response_processor.response_check(response_viewer_idx)
+        return response_viewer_idx.idx
+
+    def _request_modality(self) -> str:
+        response_viewer_modality = self.osirix_service.ViewerControllerModality(self.osirixrpc_uid)
+        self.response_processor.response_check(response_viewer_modality)
+        return response_viewer_modality.modality
+
+    def _request_movie_idx(self) -> int:
+        response_viewer_movie_idx = self.osirix_service.ViewerControllerMovieIdx(self.osirixrpc_uid)
+        self.response_processor.response_check(response_viewer_movie_idx)
+        return response_viewer_movie_idx.movie_idx
+
+    def _request_title(self) -> str:
+        response_viewer_title = self.osirix_service.ViewerControllerTitle(self.osirixrpc_uid)
+        self.response_processor.response_check(response_viewer_title)
+        return response_viewer_title.title
+
+    def _request_wlww(self) -> Tuple[float, float]:
+        response_viewer_wlww = self.osirix_service.ViewerControllerWLWW(self.osirixrpc_uid)
+        self.response_processor.response_check(response_viewer_wlww)
+        return (response_viewer_wlww.wl, response_viewer_wlww.ww)
+
+    def _request_max_movie_index(self) -> int:
+        response = self.osirix_service.ViewerControllerMaxMovieIdx(self.osirixrpc_uid)
+        self.response_processor.response_check(response)
+        return response.max_movie_idx
+
+    def invalidate_cache(self) -> None:
+        """
+          Drops all cached attribute values of the ViewerController
+
+          Returns:
+            None
+        """
+        self._cache.invalidate()
 
     @property
     def idx(self) -> int:
         """
-          Makes a gRPC request to retrieve the idx for the ViewerController
+          Makes a gRPC request to retrieve the idx for the ViewerController, unless a cached value is still valid
 
           Returns:
             int : idx
         """
-        response_viewer_idx = self.osirix_service.ViewerControllerIdx(self.osirixrpc_uid)
-        self.response_processor.response_check(response_viewer_idx)
-        self._idx = response_viewer_idx.idx
+        self._idx = self._cached("idx", self._request_idx)
 
         return self._idx
 
@@ -53,35 +135,32 @@ class ViewerController(object):
         """
         request = viewercontroller_pb2.ViewerControllerSetIdxRequest(viewer_controller=self.osirixrpc_uid, idx=idx)
         response = self.osirix_service.ViewerControllerSetIdx(request)
+        self._cache.invalidate()
         self.response_processor.response_check(response)
 
     @property
     def modality(self) -> str:
         """
-          Makes a gRPC request to retrieve the modality for the ViewerController
+          Makes a gRPC request to retrieve the modality for the ViewerController. When caching is enabled the
+          modality is cached forever.
 
           Returns:
             str : modality
         """
-        response_viewer_modality = self.osirix_service.ViewerControllerModality(self.osirixrpc_uid)
-
-        self.response_processor.response_check(response_viewer_modality)
-
-        self._modality = response_viewer_modality.modality
+        self._modality = self._cached("modality", self._request_modality)
 
         return self._modality
 
     @property
     def movie_idx(self) -> int:
         """
-          Makes a gRPC request to retrieve the movie idx for the ViewerController
+          Makes a gRPC request to retrieve the movie idx for the ViewerController, unless a cached value is still
+          valid
 
           Returns:
             int : movie_idx
         """
-        response_viewer_movie_idx = self.osirix_service.ViewerControllerMovieIdx(self.osirixrpc_uid)
-        self.response_processor.response_check(response_viewer_movie_idx)
-        self._movie_idx = response_viewer_movie_idx.movie_idx
+        self._movie_idx = self._cached("movie_idx", self._request_movie_idx)
 
         return self._movie_idx
 
@@ -98,34 +177,30 @@ class ViewerController(object):
         """
         request = viewercontroller_pb2.ViewerControllerSetMovieIdxRequest(viewer_controller=self.osirixrpc_uid, movie_idx=movie_idx)
         response = self.osirix_service.ViewerControllerSetMovieIdx(request)
+        self._cache.invalidate()
         self.response_processor.response_check(response)
 
     @property
     def title(self) -> str:
         """
-          Makes a gRPC request to retrieve the title for the ViewerController
+          Makes a gRPC request to retrieve the title for the ViewerController, unless a cached value is still valid
 
           Returns:
             str : title
         """
-        response_viewer_title = self.osirix_service.ViewerControllerTitle(self.osirixrpc_uid)
-        self.response_processor.response_check(response_viewer_title)
-        self._title = response_viewer_title.title
+        self._title = self._cached("title", self._request_title)
 
         return self._title
 
     @property
     def wlww(self) -> Tuple[float, float]:
         """
-          Makes a gRPC request to retrieve the wlww for the ViewerController
+          Makes a gRPC request to retrieve the wlww for the ViewerController, unless a cached value is still valid
 
           Returns:
             A Tuple containing wl and ww in float
         """
-        response_viewer_wlww = self.osirix_service.ViewerControllerWLWW(self.osirixrpc_uid)
-        self.response_processor.response_check(response_viewer_wlww)
-        self._ww = response_viewer_wlww.ww
-        self._wl = response_viewer_wlww.wl
+        self._wl, self._ww = self._cached("wlww", self._request_wlww)
         return (self._wl, self._ww)
 
     @wlww.setter
@@ -142,9 +217,37 @@ class ViewerController(object):
         wl, ww = wlww
         request = viewercontroller_pb2.ViewerControllerSetWLWWRequest(viewer_controller=self.osirixrpc_uid, wl=wl, ww=ww)
         response = self.osirix_service.ViewerControllerSetWLWW(request)
+        self._cache.invalidate()
         self.response_processor.response_check(response)
 
-    def process_viewer_pix_list(self, response) -> Tuple[DCMPix, ...]:
+    def snapshot(self, workers: int = 6) -> ViewerControllerSnapshot:
+        """
+          Makes concurrent gRPC requests to retrieve the idx, movie idx, modality, title, wlww and max movie index
+          of the ViewerController. The fetched values also refresh the attribute cache.
+
+          Args:
+            int : workers, the maximum number of requests in flight at once
+
+          Returns:
+            ViewerControllerSnapshot
+        """
+        fetchers = (("idx", self._request_idx),
+                    ("movie_idx", self._request_movie_idx),
+                    ("modality", self._request_modality),
+                    ("title", self._request_title),
+                    ("wlww", self._request_wlww),
+                    ("max_movie_index", self._request_max_movie_index))
+        with ThreadPoolExecutor(max_workers=max(1, workers)) as executor:
+            futures = [(name, executor.submit(fetch)) for name, fetch in fetchers]
+            values = {name: future.result() for name, future in futures}
+
+        if self.cache_ttl > 0:
+            for name, value in values.items():
+                self._cache.set(name, value, None if name in self.IMMUTABLE_ATTRIBUTES else self.cache_ttl)
+
+        return ViewerControllerSnapshot(timestamp=time.time(), **values)
+
+    def process_viewer_pix_list(self, response) -> LazySequence[DCMPix]:
         """
           Process gRPC response to retrieve the pix list for the ViewerController
 
@@ -152,16 +255,11 @@ class ViewerController(object):
             response : response from ViewerControllerPixListResponse
 
           Returns:
-            A Tuple containing DCMPix
+            A LazySequence containing DCMPix
         """
-        pix_tuple: Tuple[DCMPix, ...] = ()
-        for pix in response.pix:
-            dcm_pix = DCMPix(pix, self.osirix_service)
-            pix_tuple = pix_tuple + (dcm_pix,)
+        return LazySequence(response.pix, partial(DCMPix, osirix_service=self.osirix_service))
 
-        return pix_tuple
-
-    def process_viewer_roi_list(self, response) -> Tuple[ROI, ...]:
+    def process_viewer_roi_list(self, response) -> LazySequence[LazySequence[ROI]]:
         """
           Process gRPC response to retrieve the roi list for the ViewerController
 
@@ -169,15 +267,12 @@ class ViewerController(object):
             response : response from ViewerControllerROIListResponse
 
           Returns:
-            A Tuple containing ROIs
+            A LazySequence containing, for each slice, a LazySequence of ROIs
         """
-        roi_tuple: Tuple[ROI, ...] = ()
-        for roi_slice in response.roi_slices:
-            roi = ROI(roi_slice, self.osirix_service)
-            roi_tuple = roi_tuple + (roi,)
-        return roi_tuple
+        roi_factory = partial(ROI, osirix_service=self.osirix_service)
+        return LazySequence(response.roi_slices, lambda roi_slice: LazySequence(roi_slice.rois, roi_factory))
 
-    def process_viewer_rois(self, response) -> Tuple[ROI, ...]:
+    def process_viewer_rois(self, response) -> LazySequence[ROI]:
         """
           Process gRPC response to retrieve the ROIs for the ViewerController
 
@@ -185,13 +280,9 @@ class ViewerController(object):
             response : response from ViewerControllerROIsWithNameResponse/ViewerControllerSelectedROIsResponse
 
           Returns:
-            A Tuple containing DCMPix
+            A LazySequence containing ROIs
         """
-        roi_tuple: Tuple[ROI, ...] = ()
-        for roi in response.rois:
-            roi = ROI(roi, self.osirix_service)
-            roi_tuple = roi_tuple + (roi,)
-        return roi_tuple
+        return LazySequence(response.rois, partial(ROI, osirix_service=self.osirix_service))
 
     def process_vr_controllers(self, response) -> Tuple[VRController, ...]:
         """
@@ -282,14 +373,218 @@ class ViewerController(object):
 
     def max_movie_index(self) -> int:
         """
-          Process gRPC request to retrieve max movie idx for the ViewerController
+          Process gRPC request to retrieve max movie idx for the ViewerController, unless a cached value is still
+          valid
 
           Returns:
             int : max movie inde
         """
-        response = self.osirix_service.ViewerControllerMaxMovieIdx(self.osirixrpc_uid)
-        self.response_processor.response_check(response)
-        return response.max_movie_idx
+        return self._cached("max_movie_index", self._request_max_movie_index)
+
+    def volume(self, movie_idx: Optional[int] = None, workers: int = 8, refresh: bool = False) -> ndarray:
+        """
+          Makes concurrent gRPC requests to retrieve the image of every DCMPix of a movie index, stacked as a
+          volume. The volume is kept in memory and returned without any request on later calls.
+
+          Args:
+            int : movie_idx, the current movie index if None
+            int : workers, the maximum number of requests in flight at once
+            bool : refresh, whether to download the volume again, e.g. after the pixels were modified
+
+          Returns:
+            ndarray : (slices, rows, columns) volume
+        """
+        if movie_idx is None:
+            movie_idx = self.movie_idx
+        volume = self._volumes.get(movie_idx)
+        if volume is None or refresh:
+            volume = self._request_volume(self.pix_list(movie_idx), workers)
+            self._volumes[movie_idx] = volume
+        return volume
+
+    @staticmethod
+    def _request_volume(pix_list, workers: int) -> ndarray:
+        with ThreadPoolExecutor(max_workers=max(1, workers)) as executor:
+            images = list(executor.map(lambda pix: pix.image, pix_list))
+        return np.stack(images)
+
+    def load_volume(self, movie_idx: Optional[int] = None, processes: int = 4, workers: int = 8,
+                    fallback: bool = True, cache: bool = True) -> ndarray:
+        """
+          Loads the volume of a movie index from the DICOM files of its DCMPix with pydicom in a process pool,
+          applying rescale slope and intercept, when the files are reachable from this machine. Otherwise, or when
+          the files cannot be read locally, the images are requested over gRPC as by volume().
+
+          Args:
+            int : movie_idx, the current movie index if None
+            int : processes, the number of processes reading files
+            int : workers, the maximum number of requests in flight at once
+            bool : fallback, whether to use gRPC when the files cannot be read, otherwise the error is raised
+            bool : cache, whether to keep the volume in memory for volume() and the methods using it
+
+          Returns:
+            ndarray : (slices, rows, columns) volume in the slice order of the ViewerController
+        """
+        if movie_idx is None:
+            movie_idx = self.movie_idx
+        pix_list = self.pix_list(movie_idx)
+        with ThreadPoolExecutor(max_workers=max(1, workers)) as executor:
+            paths = list(executor.map(lambda pix: pix.source_file, pix_list))
+        try:
+            if not files_reachable(paths):
+                raise FileNotFoundError("The source files of the ViewerController are not reachable")
+            # Keep the order of the pix list so that slice indices match those of the ViewerController
+            volume = load_files(paths, processes=processes, sort=False).volume
+        except LOCAL_LOAD_ERRORS:
+            if not fallback:
+                raise
+            return self.volume(movie_idx, workers=workers, refresh=True) if cache else \
+                self._request_volume(pix_list, workers)
+        if cache:
+            self._volumes[movie_idx] = volume
+        return volume
+
+    def cached_volume(self, movie_idx: Optional[int] = None) -> Optional[ndarray]:
+        """
+          Provides the volume of a movie index if it has already been retrieved with volume()
+
+          Args:
+            int : movie_idx, the current movie index if None
+
+          Returns:
+            ndarray : (slices, rows, columns) volume, or None
+        """
+        if movie_idx is None:
+            movie_idx = self.movie_idx
+        return self._volumes.get(movie_idx)
+
+    def clear_volumes(self) -> None:
+        """
+          Drops the volumes kept in memory by volume()
+
+          Returns:
+            None
+        """
+        self._volumes.clear()
+
+    def volume_affine(self, movie_idx: Optional[int] = None, workers: int = 8) -> ndarray:
+        """
+          Makes concurrent gRPC requests to retrieve the geometry of every DCMPix of a movie index, and builds the
+          transform from (slice, row, column) voxel indices of volume() to patient coordinates in mm
+
+          Args:
+            int : movie_idx, the current movie index if None
+            int : workers, the maximum number of requests in flight at once
+
+          Returns:
+            ndarray : (4, 4) voxel-to-patient transform
+        """
+        if movie_idx is None:
+            movie_idx = self.movie_idx
+        pix_list = self.pix_list(movie_idx)
+        with ThreadPoolExecutor(max_workers=max(1, workers)) as executor:
+            affines = list(executor.map(lambda pix: pix.affine(), pix_list))
+        return volume_affine(affines)
+
+    def resample_to(self,
+                    fixed: ViewerController,
+                    movie_idx: Optional[int] = None,
+                    fixed_movie_idx: Optional[int] = None,
+                    order: str = "linear",
+                    fill_value: float = 0.0,
+                    chunk_slices: int = 8,
+                    workers: int = 4) -> ndarray:
+        """
+          Resamples the volume of this ViewerController onto the voxel grid of another ViewerController in Python,
+          without involving Osirix beyond fetching the (cached) volume and the DCMPix geometry. Unlike
+          resample_viewer_controller, no new viewer is created.
+
+          Args:
+            ViewerController : fixed, the viewer whose grid is resampled onto
+            int : movie_idx, the movie index of this viewer, its current movie index if None
+            int : fixed_movie_idx, the movie index of the fixed viewer, its current movie index if None
+            str : order, "linear" for trilinear interpolation or "nearest" for nearest neighbour
+            float : fill_value, value of voxels outside this viewer's volume
+            int : chunk_slices, number of fixed slices computed per task
+            int : workers, the number of threads used for requests and for resampling
+
+          Returns:
+            ndarray : (slices, rows, columns) volume on the grid of the fixed viewer
+        """
+        moving = self.volume(movie_idx, workers=workers)
+        moving_affine = self.volume_affine(movie_idx, workers=workers)
+        fixed_affine = fixed.volume_affine(fixed_movie_idx, workers=workers)
+        fixed_pix_list = fixed.pix_list(fixed.movie_idx if fixed_movie_idx is None else fixed_movie_idx)
+        rows, columns = fixed_pix_list[0].shape
+        return resample(moving, moving_affine, fixed_affine, (len(fixed_pix_list), rows, columns), order=order,
+                        fill_value=fill_value, chunk_slices=chunk_slices, workers=workers)
+
+    def export(self, path: str, format: str = "nifti", movie_idx: Optional[int] = None, workers: int = 4,
+               dtype=np.float32) -> str:
+        """
+          Streams the slices of a movie index into a pre-sized NIfTI-1 (.nii) or NumPy (.npy) file as they arrive,
+          so that memory use does not depend on the size of the series. The NIfTI affine is derived from the
+          DCMPix origin, orientation and spacing.
+
+          Args:
+            str : path, the output file
+            str : format, "nifti" or "npy"
+            int : movie_idx, the current movie index if None
+            int : workers, the maximum number of requests in flight at once
+            dtype : dtype of the stored voxels
+
+          Returns:
+            str : the output path
+        """
+        return export_volume(self, path, format=format, movie_idx=movie_idx, workers=workers, dtype=dtype)
+
+    def auto_wlww(self,
+                  method: str = "percentile",
+                  sample: int = 16,
+                  movie_idx: Optional[int] = None,
+                  low: float = 0.5,
+                  high: float = 99.5,
+                  bins: int = 1024,
+                  workers: int = 8,
+                  apply: bool = True) -> Tuple[float, float]:
+        """
+          Computes a robust wlww covering the low to high percentiles of the pixel values and sets it with a
+          single request. Pixels of a volume already retrieved with volume() are used when available, otherwise
+          the images of an evenly strided sample of slices are requested concurrently.
+
+          Args:
+            str : method, "percentile" (exact) or "histogram" (linear time interpolation from a histogram)
+            int : sample, the maximum number of slices to request, 0 or less for all of them
+            int : movie_idx, the current movie index if None
+            float : low, the lower percentile
+            float : high, the upper percentile
+            int : bins, the number of histogram bins for the "histogram" method
+            int : workers, the maximum number of requests in flight at once
+            bool : apply, whether to set the wlww of the ViewerController
+
+          Returns:
+            Tuple containing wl and ww in float
+        """
+        if movie_idx is None:
+            movie_idx = self.movie_idx
+        volume = self._volumes.get(movie_idx)
+        if volume is not None:
+            if volume.ndim != 3:
+                raise ValueError("Automatic wlww requires greyscale images")
+            values = volume[sample_indices(len(volume), sample)]
+        else:
+            pix_list = self.pix_list(movie_idx)
+            sampled = [pix_list[i] for i in sample_indices(len(pix_list), sample).tolist()]
+            with ThreadPoolExecutor(max_workers=max(1, workers)) as executor:
+                images = list(executor.map(lambda pix: pix.image, sampled))
+            if any(image.ndim != 2 for image in images):
+                raise ValueError("Automatic wlww requires greyscale images")
+            values = np.concatenate([image.ravel() for image in images])
+
+        wlww = window_from_values(values, method=method, low=low, high=high, bins=bins)
+        if apply:
+            self.wlww = wlww
+        return wlww
 
     def needs_display_update(self) -> None:
         """
@@ -301,15 +596,15 @@ class ViewerController(object):
         response = self.osirix_service.ViewerControllerNeedsDisplayUpdate(self.osirixrpc_uid)
         self.response_processor.response_check(response)
 
-    def pix_list(self, movie_idx: int) -> Tuple[DCMPix, ...]:
+    def pix_list(self, movie_idx: int) -> LazySequence[DCMPix]:
         """
-          Process gRPC response to retrieve the VR controllers for the ViewerController
+          Process gRPC request to retrieve the pix list based on movie_idx for the ViewerController
 
           Args:
-            response : response from ViewerControllerVRControllersResponse
+            int: movie_idx
 
           Returns:
-            A Tuple containing VR Controllers`
+            A LazySequence containing DCMPix
         """
         request = viewercontroller_pb2.ViewerControllerPixListRequest(viewer_controller=self.osirixrpc_uid, movie_idx=movie_idx)
         response = self.osirix_service.ViewerControllerPixList(request)
@@ -336,7 +631,7 @@ class ViewerController(object):
         return ViewerController(self.osirixrpc_uid, self.osirix_service)
 
     # Check ROISlice and ROI
-    def roi_list(self, movie_idx:int) -> Tuple[ROI, ...]:
+    def roi_list(self, movie_idx:int) -> LazySequence[LazySequence[ROI]]:
         """
           Process gRPC request to retrieve the list of ROIs based on movie_idx for the ViewerController
 
@@ -344,7 +639,7 @@ class ViewerController(object):
             int: movie_idx
 
           Returns:
-            A Tuple containing ROIs
+            A LazySequence containing, for each slice, a LazySequence of ROIs
         """
         request = viewercontroller_pb2.ViewerControllerROIListRequest(viewer_controller=self.osirixrpc_uid,
                                                                       movie_idx=movie_idx)
@@ -355,7 +650,295 @@ class ViewerController(object):
         return roi_tuple
 
 
-    def rois_with_name(self, name: str, movie_idx: int, in_4d: bool = False) -> Tuple[ROI, ...]:
+    def get_roi_values(self, name: str, movie_idx: int = 0, workers: int = 8) -> Tuple[ndarray, ...]:
+        """
+          Makes concurrent gRPC requests to get the values of every ROI with a given name, across all slices of
+          the ViewerController, as a single COO-style result
+
+          Args:
+            str: name
+            int: movie_idx
+            int: workers, the maximum number of requests in flight at once
+
+          Returns:
+            A Tuple containing the ROI values (slices, rows, columns, values) in ndarray. Slice, row and column
+            indices are int32 and values are float32.
+        """
+        pix_tuple = self.pix_list(movie_idx)
+        named_uids = set(roi.osirixrpc_uid.osirixrpc_uid for roi in self.rois_with_name(name, movie_idx))
+
+        requests = []
+        slice_indices = []
+        for slice_idx, roi_tuple in enumerate(self.roi_list(movie_idx)):
+            for roi in roi_tuple:
+                if roi.osirixrpc_uid.osirixrpc_uid in named_uids:
+                    requests.append(dcmpix_pb2.DCMPixROIValuesRequest(pix=pix_tuple[slice_idx].osirixrpc_uid,
+                                                                      roi=roi.osirixrpc_uid))
+                    slice_indices.append(slice_idx)
+
+        return self._roi_values(requests, slice_indices, [0] * len(requests), 1, workers)[0]
+
+    def get_rois_values(self,
+                        names: Optional[Sequence[str]] = None,
+                        movie_idx: int = 0,
+                        workers: int = 8) -> Dict[str, Tuple[ndarray, ...]]:
+        """
+          Makes concurrent gRPC requests to get the values of the ROIs of several names, as one COO-style result
+          per name (see get_roi_values). The ROI list and the pix list are requested once for all names.
+
+          Args:
+            Sequence[str] : names, if None every ROI name of the viewer
+            int: movie_idx
+            int: workers, the maximum number of requests in flight at once
+
+          Returns:
+            Dict mapping each name to a Tuple of ndarray (slices, rows, columns, values)
+        """
+        roi_index = self.roi_index(movie_idx, workers=workers)
+        if names is None:
+            names = roi_index.names()
+        names = tuple(names)
+        pix_tuple = self.pix_list(movie_idx)
+
+        requests, slice_indices, labels = [], [], []
+        for label, name in enumerate(names):
+            for slice_idx, roi in roi_index.rois_with_name(name, movie_idx):
+                requests.append(dcmpix_pb2.DCMPixROIValuesRequest(pix=pix_tuple[slice_idx].osirixrpc_uid,
+                                                                  roi=roi.osirixrpc_uid))
+                slice_indices.append(slice_idx)
+                labels.append(label)
+
+        return dict(zip(names, self._roi_values(requests, slice_indices, labels, len(names), workers)))
+
+    def _roi_values(self, requests, slice_indices, labels, n_labels, workers) -> List[Tuple[ndarray, ...]]:
+        # Fetches all requests in one pool and assembles one (slices, rows, columns, values) result per label
+        def fetch(request):
+            response = self.osirix_service.DCMPixROIValues(request)
+            self.response_processor.response_check(response)
+            return (np.array(response.row_indices, dtype=np.int32),
+                    np.array(response.column_indices, dtype=np.int32),
+                    np.array(response.values, dtype=np.float32))
+
+        with ThreadPoolExecutor(max_workers=max(1, workers)) as executor:
+            results = list(executor.map(fetch, requests))
+
+        label_members = [[] for _ in range(n_labels)]
+        for i, label in enumerate(labels):
+            label_members[label].append(i)
+
+        coo = []
+        for members in label_members:
+            if len(members) == 0:
+                empty_indices = np.empty(0, dtype=np.int32)
+                coo.append((empty_indices, empty_indices.copy(), empty_indices.copy(), np.empty(0, dtype=np.float32)))
+                continue
+            counts = [len(results[i][2]) for i in members]
+            coo.append((np.repeat(np.array([slice_indices[i] for i in members], dtype=np.int32), counts),
+                        np.concatenate([results[i][0] for i in members]),
+                        np.concatenate([results[i][1] for i in members]),
+                        np.concatenate([results[i][2] for i in members])))
+        return coo
+
+    def roi_index(self, movie_idx: Optional[int] = None, workers: int = 8) -> ROIIndex:
+        """
+          Pulls the ROI list once and builds an in-memory index of the ROIs by name for the ViewerController.
+          The names of the ROIs are requested concurrently.
+
+          Args:
+            int : movie_idx, if None all movie indices are indexed
+            int : workers, the maximum number of requests in flight at once
+
+          Returns:
+            ROIIndex
+        """
+        if movie_idx is None:
+            movie_indices = range(self.max_movie_index())
+        else:
+            movie_indices = (movie_idx,)
+        return ROIIndex(self, movie_indices, workers=workers)
+
+    def play(self, axis: str = "slice", fps: float = 10.0, loop: bool = True,
+             frames: Optional[int] = None) -> CinePlayer:
+        """
+          Starts cine playback of the ViewerController on a background thread. Frames whose deadline has passed
+          while a request was in flight are skipped so that playback keeps to the requested rate.
+
+          Args:
+            str : axis, "slice" to step through idx or "movie" to step through movie_idx
+            float : fps, the target frame rate
+            bool : loop, whether to restart at the first frame after the last one
+            int : frames, number of frames to play, by default all slices or all movie indices
+
+          Returns:
+            CinePlayer : the running player, whose stop() returns the achieved frame rate and jitter
+        """
+        return CinePlayer(self, axis=axis, fps=fps, loop=loop, frames=frames).start()
+
+    def watch(self, interval: float = 0.2, max_interval: float = 2.0, backoff: float = 1.5) -> ViewerWatcher:
+        """
+          Creates a watcher that polls the ViewerController for changes and fires callbacks for them.
+          Register callbacks on the watcher, then start() it or call poll() directly.
+
+          Args:
+            float : interval, seconds between polls while changes are seen
+            float : max_interval, longest time between polls when the viewer is idle
+            float : backoff, factor the interval grows by after each poll without changes
+
+          Returns:
+            ViewerWatcher
+        """
+        return ViewerWatcher(self, interval=interval, max_interval=max_interval, backoff=backoff)
+
+    def roi_point_set(self, movie_idx: int = 0, name: Optional[str] = None, workers: int = 8) -> ROIPointSet:
+        """
+          Makes concurrent gRPC requests to retrieve the points of all ROIs (or all ROIs with a given name)
+          for the ViewerController, as flat vertices and offsets
+
+          Args:
+            int : movie_idx
+            str : name, if None all ROIs are included
+            int : workers, the maximum number of requests in flight at once
+
+          Returns:
+            ROIPointSet
+        """
+        if name is not None:
+            named_uids = set(roi.osirixrpc_uid.osirixrpc_uid for roi in self.rois_with_name(name, movie_idx))
+
+        rois = []
+        slice_indices = []
+        for slice_idx, roi_tuple in enumerate(self.roi_list(movie_idx)):
+            for roi in roi_tuple:
+                if name is None or roi.osirixrpc_uid.osirixrpc_uid in named_uids:
+                    rois.append(roi)
+                    slice_indices.append(slice_idx)
+
+        return ROIPointSet.from_rois(rois, slice_indices, workers=workers)
+
+    def roi_shape_features(self,
+                           movie_idx: int = 0,
+                           name: Optional[str] = None,
+                           in_mm: bool = False,
+                           workers: int = 8) -> Tuple[ROIPointSet, Dict[str, ndarray]]:
+        """
+          Computes shape features (area, perimeter, compactness, eccentricity, centroid and bounding box) of all
+          ROIs (or all ROIs with a given name) for the ViewerController in one vectorized pass
+
+          Args:
+            int : movie_idx
+            str : name, if None all ROIs are included
+            bool : in_mm, whether to convert the features to mm using the pixel spacing of each ROI's DCMPix
+            int : workers, the maximum number of requests in flight at once
+
+          Returns:
+            A Tuple containing the ROIPointSet and a Dict of features with one entry per ROI
+        """
+        point_set = self.roi_point_set(movie_idx, name=name, workers=workers)
+        if not in_mm:
+            return point_set, shape_features(point_set)
+
+        pix_tuple = self.pix_list(movie_idx)
+        slices = np.unique(point_set.slice_indices)
+        with ThreadPoolExecutor(max_workers=max(1, workers)) as executor:
+            spacings = dict(zip(slices.tolist(), executor.map(lambda s: pix_tuple[s].pixel_spacing, slices.tolist())))
+        pixel_spacing = np.array([spacings[s] for s in point_set.slice_indices.tolist()], dtype=np.float64).reshape(-1, 2)
+
+        return point_set, shape_features(point_set, pixel_spacing)
+
+    def roi_points_mm(self,
+                      movie_idx: int = 0,
+                      name: Optional[str] = None,
+                      workers: int = 8) -> Tuple[ROIPointSet, ndarray]:
+        """
+          Retrieves the points of all ROIs (or all ROIs with a given name) for the ViewerController in patient
+          coordinates. The geometry of each DCMPix carrying ROIs is requested once and the transform is applied
+          to all vertices together.
+
+          Args:
+            int : movie_idx
+            str : name, if None all ROIs are included
+            int : workers, the maximum number of requests in flight at once
+
+          Returns:
+            A Tuple containing the ROIPointSet (in pixels) and an (n, 3) ndarray of its vertices in mm
+        """
+        point_set = self.roi_point_set(movie_idx, name=name, workers=workers)
+        pix_tuple = self.pix_list(movie_idx)
+        slices = np.unique(point_set.slice_indices).tolist()
+        with ThreadPoolExecutor(max_workers=max(1, workers)) as executor:
+            affines = dict(zip(slices, executor.map(lambda s: pix_tuple[s].affine(), slices)))
+
+        if len(slices) == 0:
+            return point_set, np.empty((0, 3))
+        vertex_slices = np.repeat(point_set.slice_indices, np.diff(point_set.offsets))
+        affine_stack = np.stack([affines[s] for s in slices])
+        vertex_affines = affine_stack[np.searchsorted(slices, vertex_slices)]
+
+        return point_set, transform_points(point_set.vertices, vertex_affines)
+
+    def roi_volumes(self,
+                    movie_idx: int = 0,
+                    names: Optional[Tuple[str, ...]] = None,
+                    method: str = "points",
+                    slice_thickness: Optional[float] = None,
+                    workers: int = 8) -> Dict[str, float]:
+        """
+          Estimates the volume of every ROI name for the ViewerController by integrating the area of its ROIs
+          on each slice over the slice spacing, without a 3D render window
+
+          Args:
+            int : movie_idx
+            Tuple[str, ...] : names, if None every ROI name of the viewer
+            str : method, 'points' to take areas from the ROI polygons or 'mask' to count ROI map pixels
+            float : slice_thickness in mm, if None it is derived from the DCMPix geometry
+            int : workers, the maximum number of requests in flight at once
+
+          Returns:
+            Dict mapping each ROI name to its volume in ml
+        """
+        if method not in ("points", "mask"):
+            raise ValueError("method must be 'points' or 'mask'")
+
+        roi_index = self.roi_index(movie_idx, workers=workers)
+        if names is None:
+            names = roi_index.names()
+        rois, slice_indices, labels = [], [], []
+        for label, name in enumerate(names):
+            for slice_idx, roi in roi_index.rois_with_name(name, movie_idx):
+                rois.append(roi)
+                slice_indices.append(slice_idx)
+                labels.append(label)
+
+        pix_tuple = self.pix_list(movie_idx)
+        with ThreadPoolExecutor(max_workers=max(1, workers)) as executor:
+            if slice_thickness is None:
+                affines = list(executor.map(lambda pix: pix.affine(), pix_tuple))
+                thicknesses = slice_thicknesses(affines)
+                spacings = np.array([[np.linalg.norm(affine[:, 1]), np.linalg.norm(affine[:, 0])]
+                                     for affine in affines]).reshape(-1, 2)
+            else:
+                used = sorted(set(slice_indices))
+                spacings = np.zeros((len(pix_tuple), 2))
+                for slice_idx, spacing in zip(used, executor.map(lambda s: pix_tuple[s].pixel_spacing, used)):
+                    spacings[slice_idx] = spacing
+                thicknesses = np.full(len(pix_tuple), float(slice_thickness))
+
+            slice_indices = np.array(slice_indices, dtype=np.int64)
+            if method == "points":
+                point_set = ROIPointSet.from_rois(rois, slice_indices, workers=workers)
+                areas = shape_features(point_set, spacings[slice_indices])['area']
+            else:
+                def mask_area(item):
+                    slice_idx, roi = item
+                    return np.count_nonzero(pix_tuple[slice_idx].get_map_from_roi(roi))
+                pixel_counts = np.array(list(executor.map(mask_area, zip(slice_indices.tolist(), rois))), dtype=np.float64)
+                areas = pixel_counts * np.prod(spacings[slice_indices], axis=1) if len(rois) > 0 else np.empty(0)
+
+        volumes_mm3 = np.bincount(np.array(labels, dtype=np.int64), weights=areas * thicknesses[slice_indices],
+                                  minlength=len(names))
+        return {name: volume / 1000.0 for name, volume in zip(names, volumes_mm3.tolist())}
+
+    def rois_with_name(self, name: str, movie_idx: int, in_4d: bool = False) -> LazySequence[ROI]:
         """
           Process gRPC request to retrieve the list of ROIs based on movie_idx for the ViewerController
 
@@ -365,7 +948,7 @@ class ViewerController(object):
             bool : in_4d
 
           Returns:
-            A Tuple containing ROIs
+            A LazySequence containing ROIs
         """
         request = viewercontroller_pb2.ViewerControllerROIsWithNameRequest(viewer_controller=self.osirixrpc_uid,
                                                                            name=name,
@@ -377,12 +960,12 @@ class ViewerController(object):
 
         return roi_tuple
 
-    def selected_rois(self) -> Tuple[ROI, ...]:
+    def selected_rois(self) -> LazySequence[ROI]:
         """
           Process gRPC request to retrieve ROIs that are selected for the ViewerController
 
           Returns:
-            A Tuple containing ROIs
+            A LazySequence containing ROIs
         """
         response = self.osirix_service.ViewerControllerSelectedROIs(self.osirixrpc_uid)
         self.response_processor.response_check(response)
@@ -6,21 +6,15 @@ import numpy
 
 import osirixgrpc.viewercontroller_pb2 as viewercontroller_pb2
 import osirixgrpc.vrcontroller_pb2 as vrcontroller_pb2
-from osirix.response_processor import ResponseProcessor
+from osirix.osirix_object import OsirixObject
 from osirix.viewer_controller import ViewerController
 
-class VRController(object):
+class VRController(OsirixObject):
     '''
     Class representing the properties and methods to communicate with the Osirix service through
     gRPC for a VRController
     '''
-
-    def __init__(self,
-                 osirixrpc_uid : str,
-                 osirix_service):
-        self.osirixrpc_uid = osirixrpc_uid
-        self.osirix_service = osirix_service
-        self.response_processor = ResponseProcessor()
+    __slots__ = ("_rendering_mode", "_style", "_title")
 
     @property
     def rendering_mode(self) -> str:
@@ -109,6 +103,33 @@ class VRController(object):
         response = self.osirix_service.VRControllerSetWLWW(request)
         self.response_processor.response_check(response)
 
+    def auto_wlww(self,
+                  method: str = "percentile",
+                  sample: int = 16,
+                  low: float = 0.5,
+                  high: float = 99.5,
+                  bins: int = 1024,
+                  workers: int = 8) -> Tuple[float, float]:
+        """
+          Computes a robust wlww from the pixels of the 2D viewer of the VRController and sets it on the
+          VRController with a single request. See ViewerController.auto_wlww.
+
+          Args:
+            str : method, "percentile" or "histogram"
+            int : sample, the maximum number of slices to request, 0 or less for all of them
+            float : low, the lower percentile
+            float : high, the upper percentile
+            int : bins, the number of histogram bins for the "histogram" method
+            int : workers, the maximum number of requests in flight at once
+
+          Returns:
+            Tuple containing wl and ww in float
+        """
+        wlww = self.viewer_2d().auto_wlww(method=method, sample=sample, low=low, high=high, bins=bins,
+                                          workers=workers, apply=False)
+        self.wlww = wlww
+        return wlww
+
     def blending_controller(self) -> ViewerController:
         """
           Process gRPC request to retrieve the blending controller for the VRController
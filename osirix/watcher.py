@@ -0,0 +1,204 @@
+from __future__ import annotations
+from typing import Any, Callable, Dict, List, Optional, Tuple
+import threading
+import warnings
+
+from osirix.roi import ROI
+
+class ViewerWatcher(object):
+    '''
+    Class polling a ViewerController for changes made by the user in Osirix and firing callbacks for them. Only the
+    state that has callbacks registered is requested, and the polling interval grows while nothing changes.
+
+    Callbacks:
+        on_roi_added(roi, slice_idx), on_roi_removed(roi, slice_idx), on_selection_changed(old_rois, new_rois),
+        on_slice_changed(old_idx, new_idx), on_movie_changed(old_movie_idx, new_movie_idx),
+        on_wlww_changed(old_wlww, new_wlww)
+    '''
+    EVENTS: Tuple[str, ...] = ("roi_added", "roi_removed", "selection_changed", "slice_changed", "movie_changed",
+                               "wlww_changed")
+
+    def __init__(self,
+                 viewer_controller,
+                 interval: float = 0.2,
+                 max_interval: float = 2.0,
+                 backoff: float = 1.5):
+        """
+        Args:
+            viewer_controller : the ViewerController to watch
+            interval : seconds between polls while changes are seen
+            max_interval : longest time between polls when the viewer is idle
+            backoff : factor the interval grows by after each poll without changes
+        """
+        if interval <= 0 or max_interval < interval or backoff < 1:
+            raise ValueError("Require 0 < interval <= max_interval and backoff >= 1")
+        self.viewer_controller = viewer_controller
+        self.interval = interval
+        self.max_interval = max_interval
+        self.backoff = backoff
+        self.current_interval = interval
+        self.polls = 0
+        self._callbacks: Dict[str, List[Callable]] = {event: [] for event in self.EVENTS}
+        self._state: Dict[str, Any] = {}
+        self._lock = threading.Lock()
+        self._stop_event = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def _register(self, event: str, callback: Callable) -> Callable:
+        with self._lock:
+            self._callbacks[event].append(callback)
+            # New subscribers see changes from the next poll only
+            self._state.clear()
+        return callback
+
+    def on_roi_added(self, callback: Callable[[ROI, int], Any]) -> Callable:
+        """
+        Registers a callback fired with (roi, slice_idx) for each ROI added to the current movie index.
+        Can be used as a decorator.
+        """
+        return self._register("roi_added", callback)
+
+    def on_roi_removed(self, callback: Callable[[ROI, int], Any]) -> Callable:
+        """
+        Registers a callback fired with (roi, slice_idx) for each ROI removed from the current movie index.
+        Can be used as a decorator.
+        """
+        return self._register("roi_removed", callback)
+
+    def on_selection_changed(self, callback: Callable[[Tuple[ROI, ...], Tuple[ROI, ...]], Any]) -> Callable:
+        """
+        Registers a callback fired with the previously and newly selected ROIs. Can be used as a decorator.
+        """
+        return self._register("selection_changed", callback)
+
+    def on_slice_changed(self, callback: Callable[[int, int], Any]) -> Callable:
+        """
+        Registers a callback fired with the old and new idx. Can be used as a decorator.
+        """
+        return self._register("slice_changed", callback)
+
+    def on_movie_changed(self, callback: Callable[[int, int], Any]) -> Callable:
+        """
+        Registers a callback fired with the old and new movie idx. Can be used as a decorator.
+        """
+        return self._register("movie_changed", callback)
+
+    def on_wlww_changed(self, callback: Callable[[Tuple[float, float], Tuple[float, float]], Any]) -> Callable:
+        """
+        Registers a callback fired with the old and new (wl, ww). Can be used as a decorator.
+        """
+        return self._register("wlww_changed", callback)
+
+    def _fetch_state(self, events) -> Dict[str, Any]:
+        viewer_controller = self.viewer_controller
+        state: Dict[str, Any] = {}
+        needs_rois = "roi_added" in events or "roi_removed" in events
+        if needs_rois or "movie_changed" in events:
+            state["movie_idx"] = viewer_controller._request_movie_idx()
+        if "slice_changed" in events:
+            state["idx"] = viewer_controller._request_idx()
+        if "wlww_changed" in events:
+            state["wlww"] = viewer_controller._request_wlww()
+        if needs_rois:
+            rois: Dict[str, Tuple[ROI, int]] = {}
+            for slice_idx, roi_slice in enumerate(viewer_controller.roi_list(state["movie_idx"])):
+                for roi in roi_slice:
+                    rois[roi.osirixrpc_uid.osirixrpc_uid] = (roi, slice_idx)
+            state["rois"] = rois
+        if "selection_changed" in events:
+            state["selected"] = tuple(viewer_controller.selected_rois())
+        return state
+
+    @staticmethod
+    def _diff(old: Dict[str, Any], new: Dict[str, Any]) -> List[Tuple[str, tuple]]:
+        changes: List[Tuple[str, tuple]] = []
+        if "movie_idx" in old and old["movie_idx"] != new["movie_idx"]:
+            changes.append(("movie_changed", (old["movie_idx"], new["movie_idx"])))
+        if "idx" in old and old["idx"] != new["idx"]:
+            changes.append(("slice_changed", (old["idx"], new["idx"])))
+        if "wlww" in old and old["wlww"] != new["wlww"]:
+            changes.append(("wlww_changed", (old["wlww"], new["wlww"])))
+        # ROIs are compared within one movie index only, switching frames is reported as a movie change
+        if "rois" in old and old["movie_idx"] == new["movie_idx"]:
+            old_rois, new_rois = old["rois"], new["rois"]
+            for uid in old_rois.keys() - new_rois.keys():
+                changes.append(("roi_removed", old_rois[uid]))
+            for uid in new_rois.keys() - old_rois.keys():
+                changes.append(("roi_added", new_rois[uid]))
+        if "selected" in old:
+            old_uids = [roi.osirixrpc_uid.osirixrpc_uid for roi in old["selected"]]
+            new_uids = [roi.osirixrpc_uid.osirixrpc_uid for roi in new["selected"]]
+            if old_uids != new_uids:
+                changes.append(("selection_changed", (old["selected"], new["selected"])))
+        return changes
+
+    def poll(self) -> List[Tuple[str, tuple]]:
+        """
+        Requests the watched state once, fires the callbacks for every change since the previous poll and adapts
+        the polling interval. The first poll only records the state.
+
+        Returns:
+            list of (event, arguments) for the changes found
+        """
+        with self._lock:
+            callbacks = {event: list(callbacks) for event, callbacks in self._callbacks.items() if callbacks}
+            previous = self._state
+        if not callbacks:
+            return []
+
+        state = self._fetch_state(callbacks)
+        changes = self._diff(previous, state)
+        with self._lock:
+            self._state = state
+            self.polls += 1
+            if changes:
+                self.current_interval = self.interval
+            else:
+                self.current_interval = min(self.current_interval * self.backoff, self.max_interval)
+
+        for event, arguments in changes:
+            for callback in callbacks.get(event, ()):
+                try:
+                    callback(*arguments)
+                except Exception as exc:
+                    warnings.warn("Watcher callback for %s raised %r" % (event, exc))
+        return changes
+
+    def _run(self) -> None:
+        while not self._stop_event.is_set():
+            try:
+                self.poll()
+            except Exception as exc:
+                warnings.warn("Watcher poll failed: %r" % (exc,))
+                self.current_interval = self.max_interval
+            self._stop_event.wait(self.current_interval)
+
+    def start(self) -> ViewerWatcher:
+        """
+        Starts polling on a background daemon thread
+        """
+        if self._thread is not None and self._thread.is_alive():
+            return self
+        self._stop_event.clear()
+        self._thread = threading.Thread(target=self._run, name="ViewerWatcher", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self, timeout: Optional[float] = None) -> None:
+        """
+        Stops polling and waits for the background thread to finish
+        """
+        self._stop_event.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+            self._thread = None
+
+    @property
+    def running(self) -> bool:
+        return self._thread is not None and self._thread.is_alive()
+
+    def __enter__(self) -> ViewerWatcher:
+        return self.start()
+
+    def __exit__(self, *exc_info) -> None:
+        self.stop()
@@ -0,0 +1,64 @@
+from __future__ import annotations
+from typing import Tuple
+
+from numpy import ndarray
+import numpy as np
+
+METHODS = ("percentile", "histogram")
+
+def sample_indices(count: int, sample: int) -> ndarray:
+    """
+    Picks up to sample evenly strided indices out of count, always including the first and last
+
+    Args:
+        count : number of items to sample from
+        sample : maximum number of indices, 0 or less for all of them
+
+    Returns:
+        ndarray : sorted unique indices
+    """
+    if sample <= 0 or sample >= count:
+        return np.arange(count)
+    return np.unique(np.linspace(0, count - 1, sample).round().astype(np.int64))
+
+def window_from_values(values: ndarray,
+                       method: str = "percentile",
+                       low: float = 0.5,
+                       high: float = 99.5,
+                       bins: int = 1024) -> Tuple[float, float]:
+    """
+    Computes a robust window level and width covering the low to high percentiles of pixel values
+
+    Args:
+        values : pixel values of any shape, non-finite values are ignored
+        method : "percentile" sorts the values exactly; "histogram" interpolates the percentiles from the
+                 cumulative histogram, which runs in linear time for large samples
+        low : lower percentile in [0, 100)
+        high : upper percentile in (low, 100]
+        bins : number of histogram bins for the "histogram" method
+
+    Returns:
+        Tuple containing wl and ww in float
+    """
+    if method not in METHODS:
+        raise ValueError("method must be one of %s" % (METHODS,))
+    if not 0 <= low < high <= 100:
+        raise ValueError("Require 0 <= low < high <= 100")
+    values = np.asarray(values).ravel()
+    values = values[np.isfinite(values)]
+    if values.size == 0:
+        raise ValueError("No finite pixel values to compute a window from")
+
+    if method == "percentile":
+        lower, upper = np.percentile(values, (low, high))
+    else:
+        counts, edges = np.histogram(values, bins=bins)
+        cumulative = np.concatenate(([0.0], np.cumsum(counts, dtype=np.float64)))
+        cumulative /= cumulative[-1]
+        # Linear interpolation of the inverse CDF; a flat CDF segment (empty bins) takes its lower edge
+        lower, upper = np.interp((low / 100.0, high / 100.0), cumulative, edges)
+
+    width = float(upper - lower)
+    if width <= 0:
+        width = 1.0
+    return (float(lower) + width / 2.0, width)
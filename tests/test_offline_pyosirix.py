@@ -0,0 +1,565 @@
+import unittest
+
+import datetime
+import struct
+import threading
+import time
+from types import SimpleNamespace
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+from osirix.roi_geometry import ROIPointSet, ROISpatialIndex, bounding_boxes, points_in_polygon, rasterize
+from osirix.roi_features import shape_features
+from osirix import radiomics
+from osirix.lazy_sequence import LazySequence
+from osirix.windowing import sample_indices, window_from_values
+from osirix.resample import resample
+from osirix.export import nifti_header, nifti_affine, NIFTI_HEADER_FORMAT, NIFTI_VOX_OFFSET
+from osirix.slice_order import geometric_order
+from osirix import cache
+from osirix.cache import AttributeCache, IMMUTABLE, cached_attribute
+from osirix.singleflight import CoalescingService, SingleFlight
+from osirix.cine import CinePlayer
+from osirix.traversal import SeriesTraversal
+from osirix.catalogue import MetadataCatalogue
+from osirix.crawler import MetadataCrawler
+from osirix.response_processor import ResponseProcessor
+
+import osirixgrpc.types_pb2 as types_pb2
+
+# The tests defined here need no Osirix/Horos server: they exercise the NumPy and
+# threading helpers of pyOsirix on synthetic data.
+
+def square(x, y, size):
+	return np.array([[x, y], [x + size, y], [x + size, y + size], [x, y + size]], dtype=np.float64)
+
+
+class PyOsirixTestROIGeometry(unittest.TestCase):
+	def testROIGeometryBoundingBoxes(self):
+		point_set = ROIPointSet.from_arrays([square(1, 2, 3), square(10, 10, 1)])
+		boxes = bounding_boxes(point_set.vertices, point_set.offsets)
+		self.assertTrue(np.array_equal(boxes, [[1, 2, 4, 5], [10, 10, 11, 11]]))
+
+	def testROIGeometryPointsInPolygon(self):
+		inside = points_in_polygon(np.array([[2.0, 2.0], [5.0, 2.0], [0.5, 0.5]]), square(0, 0, 4))
+		self.assertEqual(inside.tolist(), [True, False, True])
+
+	def testROIGeometryRasterize(self):
+		mask = rasterize(square(0, 0, 4), (0, 0), (6, 6))
+		self.assertEqual(np.count_nonzero(mask), 16)
+
+	def testROIGeometrySpatialIndexQueries(self):
+		point_set = ROIPointSet.from_arrays([square(0, 0, 4), square(2, 2, 4), square(20, 20, 2)], [0, 0, 1])
+		index = ROISpatialIndex(point_set)
+		self.assertEqual(index.query_point(3, 3, 0).tolist(), [0, 1])
+		self.assertEqual(index.query_point(21, 21, 0).tolist(), [])
+		self.assertEqual(index.query_point(21, 21, 1).tolist(), [2])
+		self.assertEqual(sorted(index.query_box(5, 5, 30, 30, 0).tolist()), [1])
+
+	def testROIGeometrySpatialIndexPointROIs(self):
+		# Point ROIs have zero extent and must not shrink the grid cells below a pixel
+		points = [np.array([[float(i), float(i)]]) for i in range(5)]
+		triangle = np.array([[0.0, 0.0], [0.01, 0.0], [0.0, 0.01]])
+		large = square(0, 0, 5000)
+		index = ROISpatialIndex(ROIPointSet.from_arrays(points + [triangle, large]))
+		self.assertGreaterEqual(index.cell_size, ROISpatialIndex.MIN_CELL_SIZE)
+		self.assertLess(sum(len(members) for members in index._cells.values()), 100)
+		self.assertEqual(index.query_point(0.002, 0.002, 0).tolist(), [5, 6])
+		self.assertEqual(sorted(index.query_box(2, 2, 3, 3, 0).tolist()), [2, 3, 6])
+
+	def testROIGeometrySpatialIndexLargeBox(self):
+		# Boxes far larger than the occupied grid, or unbounded, only visit occupied cells
+		rois = [square(x, y, 1) for x, y in np.random.RandomState(2).randint(0, 400, (200, 2))]
+		index = ROISpatialIndex(ROIPointSet.from_arrays(rois))
+		everything = list(range(len(rois)))
+		self.assertEqual(index.query_box(-np.inf, -np.inf, np.inf, np.inf, 0).tolist(), everything)
+		self.assertEqual(index.query_box(-1e9, -1e9, 1e9, 1e9, 0).tolist(), everything)
+		self.assertEqual(index.query_box(-np.inf, -np.inf, 200, np.inf, 0).tolist(),
+						 np.nonzero(index.boxes[:, 0] <= 200)[0].tolist())
+		self.assertEqual(index.query_box(500, 500, np.inf, np.inf, 0).tolist(), [])
+		self.assertEqual(index.query_box(0, 0, 10, 10, 1).tolist(), [])
+
+	def testROIGeometrySpatialIndexOverlaps(self):
+		point_set = ROIPointSet.from_arrays([square(0, 0, 4), square(2, 0, 4)])
+		pairs, dice, iou = ROISpatialIndex(point_set).overlaps()
+		self.assertEqual(pairs.tolist(), [[0, 1]])
+		self.assertAlmostEqual(iou[0], 8 / 24)
+		self.assertAlmostEqual(dice[0], 16 / 32)
+
+
+class PyOsirixTestROIFeatures(unittest.TestCase):
+	def testROIFeaturesSquare(self):
+		features = shape_features(ROIPointSet.from_arrays([square(1, 1, 2)]))
+		self.assertAlmostEqual(features["area"][0], 4.0)
+		self.assertAlmostEqual(features["perimeter"][0], 8.0)
+		self.assertTrue(np.allclose(features["centroid"][0], [2.0, 2.0]))
+		self.assertAlmostEqual(features["eccentricity"][0], 0.0)
+
+	def testROIFeaturesPixelSpacing(self):
+		features = shape_features(ROIPointSet.from_arrays([square(0, 0, 2)]), pixel_spacing=(0.5, 2.0))
+		self.assertAlmostEqual(features["area"][0], 4.0)
+
+
+class PyOsirixTestRadiomics(unittest.TestCase):
+	def testRadiomicsFirstOrder(self):
+		values = np.array([1.0, 2.0, 3.0, 4.0, 10.0, 10.0])
+		labels = np.array([0, 0, 0, 0, 1, 1])
+		features = radiomics.first_order_features(values, labels, 2)
+		self.assertTrue(np.allclose(features["mean"], [2.5, 10.0]))
+		self.assertTrue(np.allclose(features["median"], [2.5, 10.0]))
+		self.assertTrue(np.allclose(features["min"], [1.0, 10.0]))
+		self.assertTrue(np.allclose(features["std_dev"], [np.std(values[:4]), 0.0]))
+
+	def testRadiomicsGLCMUniform(self):
+		rows, columns = np.mgrid[0:4, 0:4]
+		n = rows.size
+		matrices = radiomics.glcm_matrices(np.zeros(n), rows.ravel(), columns.ravel(), np.zeros(n, dtype=np.int64),
+										   np.zeros(n, dtype=np.int64), 1, 4)
+		self.assertAlmostEqual(matrices[0, 0, 0], 1.0)
+		features = radiomics.glcm_features(matrices)
+		self.assertAlmostEqual(features["contrast"][0], 0.0)
+		self.assertAlmostEqual(features["energy"][0], 1.0)
+
+	def testRadiomicsGLCMStripes(self):
+		rows, columns = np.mgrid[0:4, 0:4]
+		gray = (columns % 2).ravel()
+		n = rows.size
+		matrices = radiomics.glcm_matrices(np.zeros(n), rows.ravel(), columns.ravel(), gray,
+										   np.zeros(n, dtype=np.int64), 1, 2, offsets=((0, 1),))
+		# Horizontal neighbours always alternate between the two gray levels
+		self.assertAlmostEqual(matrices[0, 0, 1] + matrices[0, 1, 0], 1.0)
+
+	def testRadiomicsGLCMNoPairsAcrossSlices(self):
+		# A row offset past the last row must not reach the first row of the next slice
+		matrices = radiomics.glcm_matrices(np.array([0, 1]), np.zeros(2), np.zeros(2), np.array([0, 1]),
+										   np.zeros(2, dtype=np.int64), 1, 2, offsets=((2, 0),))
+		self.assertAlmostEqual(matrices.sum(), 0.0)
+
+
+class PyOsirixTestLazySequence(unittest.TestCase):
+	def testLazySequenceBuildsOnAccess(self):
+		built = []
+		sequence = LazySequence(list(range(10)), lambda item: built.append(item) or item * 2)
+		self.assertEqual(len(sequence), 10)
+		self.assertEqual(built, [])
+		self.assertEqual(sequence[3], 6)
+		self.assertEqual(sequence[3], 6)
+		self.assertEqual(built, [3])
+
+	def testLazySequenceSlicesShareCache(self):
+		built = []
+		sequence = LazySequence(list(range(10)), lambda item: built.append(item) or item)
+		view = sequence[2:8:2]
+		self.assertEqual(list(view), [2, 4, 6])
+		self.assertEqual(sequence[4], 4)
+		self.assertEqual(built, [2, 4, 6])
+		self.assertEqual(view[-1], 6)
+
+
+class PyOsirixTestWindowing(unittest.TestCase):
+	def testWindowingSampleIndices(self):
+		self.assertEqual(sample_indices(5, 0).tolist(), [0, 1, 2, 3, 4])
+		indices = sample_indices(100, 5)
+		self.assertEqual(indices[0], 0)
+		self.assertEqual(indices[-1], 99)
+		self.assertEqual(len(indices), 5)
+
+	def testWindowingMethodsAgree(self):
+		values = np.random.RandomState(0).normal(100.0, 20.0, 100000)
+		wl, ww = window_from_values(values, low=1, high=99)
+		wl_histogram, ww_histogram = window_from_values(values, method="histogram", low=1, high=99)
+		self.assertAlmostEqual(wl, 100.0, delta=1.0)
+		self.assertAlmostEqual(wl_histogram, wl, delta=0.5)
+		self.assertAlmostEqual(ww_histogram, ww, delta=0.5)
+
+	def testWindowingRejectsEmpty(self):
+		with self.assertRaises(ValueError):
+			window_from_values(np.array([np.nan, np.inf]))
+
+
+class PyOsirixTestResample(unittest.TestCase):
+	def testResampleIdentity(self):
+		moving = np.random.RandomState(1).rand(4, 5, 6)
+		output = resample(moving, np.eye(4), np.eye(4), moving.shape, chunk_slices=1, workers=2, dtype=np.float64)
+		self.assertTrue(np.allclose(output, moving))
+
+	def testResampleTranslation(self):
+		moving = np.arange(4 * 5 * 6, dtype=np.float64).reshape(4, 5, 6)
+		fixed_affine = np.eye(4)
+		fixed_affine[2, 3] = 1.0
+		linear = resample(moving, np.eye(4), fixed_affine, moving.shape, fill_value=-1.0, dtype=np.float64)
+		self.assertTrue(np.allclose(linear[:, :, :-1], moving[:, :, 1:]))
+		self.assertTrue(np.all(linear[:, :, -1] == -1.0))
+		fixed_affine[2, 3] = 0.5
+		half = resample(moving, np.eye(4), fixed_affine, moving.shape, dtype=np.float64)
+		self.assertTrue(np.allclose(half[:, :, :-1], moving[:, :, :-1] + 0.5))
+
+
+class PyOsirixTestExport(unittest.TestCase):
+	def testExportNiftiHeader(self):
+		affine = np.diag([3.0, 0.5, 0.8, 1.0])
+		header = nifti_header((4, 8, 10), affine, np.float32, description="T2")
+		self.assertEqual(len(header), NIFTI_VOX_OFFSET)
+		fields = struct.unpack(NIFTI_HEADER_FORMAT, header[:348])
+		self.assertEqual(fields[0], 348)
+		self.assertEqual(fields[7:11], (3, 10, 8, 4))
+		self.assertEqual(header[344:348], b"n+1\0")
+
+	def testExportNiftiAffine(self):
+		affine = np.eye(4)
+		affine[0:3, 3] = (1.0, 2.0, 3.0)
+		sform = nifti_affine(affine)
+		# (slice, row, column) becomes (column, row, slice) and LPS becomes RAS
+		self.assertTrue(np.allclose(sform[0:3, 3], (-1.0, -2.0, 3.0)))
+		self.assertTrue(np.allclose(sform[0:3, 0], (0.0, 0.0, 1.0)))
+
+
+class PyOsirixTestSliceOrder(unittest.TestCase):
+	def testSliceOrderDuplicatesAndGaps(self):
+		order = geometric_order([5.0, 0.0, 2.5, 12.5, 2.5, 15.0], [1, 2, 3, 4, 5, 6])
+		self.assertEqual(order.order.tolist(), [1, 2, 4, 0, 3, 5])
+		self.assertEqual(order.spacing, 2.5)
+		self.assertEqual(order.duplicates, ((1, 2),))
+		self.assertEqual(order.gaps, ((3, 2),))
+		self.assertFalse(order.is_regular)
+
+	def testSliceOrderInstanceNumberFallback(self):
+		order = geometric_order([None, 1.0, 2.0], [3, 1, 2])
+		self.assertEqual(order.order.tolist(), [1, 2, 0])
+		self.assertIsNone(order.spacing)
+
+
+class CachedThing(object):
+	CACHE_POLICY = {"fixed": IMMUTABLE, "changing": 60.0}
+
+	def __init__(self):
+		self._cache = AttributeCache("CachedThing")
+		self.requests = 0
+
+	@property
+	@cached_attribute
+	def fixed(self):
+		self.requests += 1
+		return "fixed"
+
+	@cached_attribute
+	def changing(self):
+		self.requests += 1
+		return self.requests
+
+	@cached_attribute
+	def uncached(self):
+		self.requests += 1
+		return self.requests
+
+
+class PyOsirixTestCache(unittest.TestCase):
+	def setUp(self):
+		cache.reset_cache_stats()
+
+	def tearDown(self):
+		cache.set_caching_enabled(True)
+
+	def testCachePolicy(self):
+		thing = CachedThing()
+		self.assertEqual(thing.fixed, "fixed")
+		self.assertEqual(thing.fixed, "fixed")
+		self.assertEqual(thing.requests, 1)
+		first = thing.changing()
+		self.assertEqual(thing.changing(), first)
+		thing._cache.invalidate("changing")
+		self.assertNotEqual(thing.changing(), first)
+		self.assertNotEqual(thing.uncached(), thing.uncached())
+
+	def testCacheStats(self):
+		thing = CachedThing()
+		for _ in range(4):
+			thing.fixed
+		stats = cache.cache_stats()["CachedThing.fixed"]
+		self.assertEqual((stats.hits, stats.misses), (3, 1))
+		self.assertAlmostEqual(stats.hit_rate, 0.75)
+
+	def testCacheDisabled(self):
+		thing = CachedThing()
+		with cache.caching_disabled():
+			thing.fixed
+			thing.fixed
+		self.assertEqual(thing.requests, 2)
+		self.assertTrue(cache.caching_enabled())
+		self.assertNotIn("CachedThing.fixed", cache.cache_stats())
+
+
+class LateViewerService(object):
+	"""Shows slices, answering late from slice late_from onwards"""
+	def __init__(self, late_from, delay):
+		self.late_from = late_from
+		self.delay = delay
+		self.shown = []
+
+	def ViewerControllerSetIdx(self, request):
+		if request.idx >= self.late_from:
+			time.sleep(self.delay)
+		self.shown.append(request.idx)
+		return SimpleNamespace(status=SimpleNamespace(status=1, message=""))
+
+
+class LateViewer(object):
+	response_processor = ResponseProcessor()
+
+	def __init__(self, service):
+		self.osirixrpc_uid = types_pb2.ViewerController(osirixrpc_uid="viewer")
+		self.osirix_service = service
+
+	def invalidate_cache(self):
+		pass
+
+
+class PyOsirixTestCine(unittest.TestCase):
+	def testCineLateFramesStillShowLast(self):
+		service = LateViewerService(late_from=10, delay=0.12)
+		player = CinePlayer(LateViewer(service), fps=50, loop=False, frames=20).start()
+		stats = player.wait(timeout=10)
+		self.assertIsNone(player.error)
+		self.assertEqual(service.shown[-1], 19)
+		self.assertEqual(stats.frames_shown + stats.frames_skipped, 20)
+
+	def testCineLoopKeepsRunningTotals(self):
+		service = LateViewerService(late_from=3, delay=0.0)
+		player = CinePlayer(LateViewer(service), fps=200, loop=True, frames=3).start()
+		time.sleep(0.2)
+		stats = player.stop(timeout=10)
+		self.assertIsNone(player.error)
+		self.assertEqual(stats.frames_shown, len(service.shown))
+		self.assertGreater(stats.frames_shown, 3)
+		self.assertGreater(stats.achieved_fps, 0.0)
+		self.assertGreaterEqual(stats.jitter, 0.0)
+		# Only the prebuilt requests are kept per frame, so a long-running loop does not grow
+		self.assertEqual([name for name, value in vars(player).items() if isinstance(value, list)], ["_requests"])
+
+
+class LinkedSeries(object):
+	"""Series whose next_series link is given by the study"""
+	def __init__(self, study, uid):
+		self.study = study
+		self.osirixrpc_uid = SimpleNamespace(osirixrpc_uid=uid)
+
+	def next_series(self):
+		time.sleep(0.02)
+		with self.study.lock:
+			self.study.requests += 1
+		following = self.study.links.get(self.osirixrpc_uid.osirixrpc_uid)
+		return None if following is None else self.study.members[following]
+
+
+class LinkedStudy(object):
+	def __init__(self, listing, links):
+		self.lock = threading.Lock()
+		self.requests = 0
+		self.links = links
+		self.members = {uid: LinkedSeries(self, uid) for uid in listing}
+		self.listing = listing
+
+	@property
+	def series(self):
+		time.sleep(0.05)
+		return [self.members[uid] for uid in self.listing]
+
+
+def uids(series):
+	return [s.osirixrpc_uid.osirixrpc_uid for s in series]
+
+
+class PyOsirixTestTraversal(unittest.TestCase):
+	def testTraversalStartsAtChainHead(self):
+		# Osirix lists B before A although A links to B
+		study = LinkedStudy(["B", "A", "C"], {"A": "B", "B": "C"})
+		self.assertEqual(uids(SeriesTraversal().study(study)), ["A", "B", "C"])
+
+	def testTraversalCycle(self):
+		study = LinkedStudy(["B", "A", "C"], {"A": "B", "B": "C", "C": "A"})
+		traversal = SeriesTraversal()
+		self.assertEqual(uids(traversal.study(study)), ["B", "C", "A"])
+		self.assertEqual(traversal.cycles, [("A", "B")])
+
+	def testTraversalDatabaseConcurrent(self):
+		studies = [LinkedStudy(["A%d" % i, "B%d" % i], {"A%d" % i: "B%d" % i}) for i in range(8)]
+		start = time.monotonic()
+		traversed = uids(SeriesTraversal(workers=16).database(studies))
+		elapsed = time.monotonic() - start
+		self.assertEqual(traversed, [uid for i in range(8) for uid in ("A%d" % i, "B%d" % i)])
+		# Eight series listings of 50 ms each would take 400 ms one after another
+		self.assertLess(elapsed, 0.3)
+
+	def testTraversalWalk(self):
+		study = LinkedStudy(["A", "B", "C"], {"A": "B", "B": "C", "C": "A"})
+		traversal = SeriesTraversal()
+		self.assertEqual(uids(traversal.walk(study.members["B"])), ["B", "C", "A"])
+		self.assertEqual(traversal.cycles, [("A", "B")])
+
+
+class CrawledStudy(object):
+	def __init__(self, uid, date):
+		self.osirixrpc_uid = SimpleNamespace(osirixrpc_uid=uid)
+		self.study_instance_uid = uid
+		self._date = date
+
+	@property
+	def date(self):
+		# Osirix answers with a zero date when the DICOM date is empty
+		return datetime.datetime(*self._date)
+
+
+class PyOsirixTestCrawler(unittest.TestCase):
+	def testCrawlerRecordsFailedValues(self):
+		studies = [CrawledStudy("1", (2024, 1, 2)), CrawledStudy("2", (0, 0, 0))]
+		result = MetadataCrawler(None, study_fields=("study_instance_uid", "date"), series_fields=()).crawl(studies)
+		self.assertEqual(result.studies["study_instance_uid"].tolist(), ["1", "2"])
+		self.assertEqual(result.studies["date"].tolist(), [datetime.datetime(2024, 1, 2), None])
+		self.assertEqual(result.errors, 1)
+
+
+class PyOsirixTestCatalogue(unittest.TestCase):
+	def setUp(self):
+		self.catalogue = MetadataCatalogue()
+		self.catalogue.connection.execute("INSERT INTO studies (study_instance_uid, patient_id) VALUES ('1.2', 'P')")
+		for uid, description in (("1.2.1", "DWI_b1000"), ("1.2.2", "DWIxb1000"), ("1.2.3", "T1 100% dose")):
+			self.catalogue.connection.execute("INSERT INTO series (series_instance_uid, study_instance_uid, "
+											  "series_description) VALUES (?, '1.2', ?)", (uid, description))
+
+	def tearDown(self):
+		self.catalogue.close()
+
+	def descriptions(self, **criteria):
+		return sorted(row["series_description"] for row in self.catalogue.query_series(**criteria))
+
+	def testCatalogueDescriptionIsLiteral(self):
+		self.assertEqual(self.descriptions(description="DWI_b"), ["DWI_b1000"])
+		self.assertEqual(self.descriptions(description="b1000"), ["DWI_b1000", "DWIxb1000"])
+		self.assertEqual(self.descriptions(description="100%"), ["T1 100% dose"])
+
+	def testCatalogueDescriptionPattern(self):
+		self.assertEqual(self.descriptions(description="DWI_b%", pattern=True), ["DWI_b1000", "DWIxb1000"])
+		self.assertEqual(self.descriptions(description="DWI\\_b%", pattern=True), ["DWI_b1000"])
+
+
+class IndexedBrowser(object):
+	def __init__(self, studies):
+		self.osirix_service = None
+		self.studies = studies
+
+	def database_selection(self):
+		return self.studies, ()
+
+
+def indexed_study(uid, date_added, series_dates):
+	series = [SimpleNamespace(osirixrpc_uid=SimpleNamespace(osirixrpc_uid="%s.%d" % (uid, i)),
+							  series_instance_uid="%s.%d" % (uid, i), name="", series_description="",
+							  modality="MR", date=date, number_of_images=1)
+			  for i, date in enumerate(series_dates)]
+	return SimpleNamespace(osirixrpc_uid=SimpleNamespace(osirixrpc_uid=uid), study_instance_uid=uid, patient_id="P",
+						   name="", date=date_added, date_added=date_added, modalities="MR", number_of_images=1,
+						   series=series)
+
+
+class PyOsirixTestCatalogueDates(unittest.TestCase):
+	def testCatalogueMissingDates(self):
+		# A missing date turns the crawled column into datetime objects, which must be stored like datetime64
+		noon = datetime.datetime(2024, 5, 1, 12)
+		browser = IndexedBrowser([indexed_study("1", noon, [noon, None]), indexed_study("2", None, [noon])])
+		with MetadataCatalogue() as catalogue:
+			catalogue.refresh(browser, include_images=False, workers=2)
+			self.assertEqual(catalogue.series("1.0")["date"], "2024-05-01T12:00:00")
+			self.assertEqual(catalogue.study("1")["date_added"], "2024-05-01T12:00:00")
+			rows = catalogue.query_series(date_range=(datetime.date(2024, 5, 1), noon))
+			self.assertEqual(sorted(row["series_instance_uid"] for row in rows), ["1.0", "2.0"])
+			catalogue.osirix_service = object()
+			self.assertEqual(len(catalogue.find_series(date_range=(datetime.date(2024, 5, 1), noon))), 2)
+			stats = catalogue.refresh(browser, include_images=False, workers=2)
+			self.assertEqual((stats.studies_updated, stats.studies_unchanged), (0, 2))
+
+
+class Request(object):
+	def __init__(self, uid):
+		self.uid = uid
+
+	def SerializeToString(self, deterministic=False):
+		return self.uid.encode()
+
+
+class SlowService(object):
+	def __init__(self):
+		self.calls = 0
+		self.lock = threading.Lock()
+
+	def DCMPixImage(self, request):
+		with self.lock:
+			self.calls += 1
+		time.sleep(0.05)
+		return "image of " + request.uid
+
+	def ViewerControllerSetWLWW(self, request):
+		return None
+
+
+class PyOsirixTestSingleFlight(unittest.TestCase):
+	def testSingleFlightSharesResult(self):
+		group = SingleFlight()
+		calls = []
+
+		def slow():
+			calls.append(1)
+			time.sleep(0.05)
+			return object()
+
+		with ThreadPoolExecutor(max_workers=4) as executor:
+			results = list(executor.map(lambda _: group.do("key", slow), range(4)))
+		self.assertEqual(len(calls), 1)
+		self.assertTrue(all(result is results[0] for result in results))
+		self.assertEqual((group.calls, group.coalesced), (1, 3))
+
+	def testSingleFlightSharesError(self):
+		group = SingleFlight()
+
+		def fail():
+			time.sleep(0.05)
+			raise KeyError("no")
+
+		def call(_):
+			try:
+				group.do("key", fail)
+			except KeyError:
+				return True
+			return False
+
+		with ThreadPoolExecutor(max_workers=3) as executor:
+			self.assertTrue(all(executor.map(call, range(3))))
+
+	def testCoalescingService(self):
+		stub = SlowService()
+		service = CoalescingService(stub, ["DCMPixImage"])
+		with ThreadPoolExecutor(max_workers=4) as executor:
+			images = list(executor.map(lambda _: service.DCMPixImage(Request("a")), range(4)))
+		self.assertEqual(images, ["image of a"] * 4)
+		self.assertEqual(stub.calls, 1)
+		with ThreadPoolExecutor(max_workers=2) as executor:
+			list(executor.map(lambda uid: service.DCMPixImage(Request(uid)), ["b", "c"]))
+		self.assertEqual(stub.calls, 3)
+
+	def testCoalescingServiceRejectsWrites(self):
+		service = CoalescingService(SlowService())
+		with self.assertRaises(ValueError):
+			service.coalesce("ViewerControllerSetWLWW")
+		self.assertEqual(service.methods, frozenset())
+
+	def testCoalescingServiceUncoalesce(self):
+		stub = SlowService()
+		service = CoalescingService(stub, ["DCMPixImage"])
+		service.uncoalesce("DCMPixImage")
+		with ThreadPoolExecutor(max_workers=2) as executor:
+			list(executor.map(lambda _: service.DCMPixImage(Request("a")), range(2)))
+		self.assertEqual(stub.calls, 2)
+
+
+if __name__ == '__main__':
+	unittest.main()
@@ -2,8 +2,12 @@ import unittest
 
 import sys
 import os
+import tempfile
+from concurrent.futures import ThreadPoolExecutor
 
+import osirix
 from osirix import ViewerController
+from osirix import radiomics
 
 import grpc
 import pytest
@@ -86,6 +90,17 @@ class PyOsirixTestOsirix(GrpcTest):
 		self.assertTrue(len(displayed_2d_viewers) > 0)
 		self.assertEqual(len(response.viewer_controllers), len(displayed_2d_viewers))
 
+	def testOsirixForEachViewer(self):
+		displayed_2d_viewers = self.osirix.displayed_2d_viewers()
+		titles = self.osirix.for_each_viewer(lambda viewer: viewer.title)
+		self.assertEqual(titles, tuple(viewer.title for viewer in displayed_2d_viewers))
+		wlww = self.osirix.viewers_wlww()
+		self.assertEqual(wlww.shape, (len(displayed_2d_viewers), 2))
+		self.osirix.set_viewers_wlww((100.0, 200.0))
+		self.assertTrue(np.all(self.osirix.viewers_wlww() == (100.0, 200.0)))
+		for viewer, viewer_wlww in zip(displayed_2d_viewers, wlww):
+			viewer.wlww = tuple(viewer_wlww)
+
 	def testOsirixFrontmostVRController(self):
 		frontmost_vr_controller = self.osirix.frontmost_vr_controller()
 
@@ -125,6 +140,12 @@ class PyOsirixTestViewerController(GrpcTest):
 		self.assertTrue(len(response.pix) > 0)
 		self.assertEqual(len(response.pix), len(pix_list))
 
+	def testViewerControllerPixListLazy(self):
+		pix_list = self.viewer_controller_pyosirix.pix_list(movie_idx=0)
+		self.assertIs(pix_list[-1], list(pix_list)[-1])
+		self.assertEqual(list(pix_list[1::2]), list(pix_list)[1::2])
+		self.assertEqual(pix_list[0].osirixrpc_uid, pix_list[:1][0].osirixrpc_uid)
+
 	def testViewerControllerNeedsDisplayUpdate(self):
 		self.viewer_controller_pyosirix.needs_display_update() # Check for response is build in and it returns none
 
@@ -293,6 +314,66 @@ class PyOsirixTestViewerController(GrpcTest):
 		response = self.stub.ViewerControllerROIsWithName(request)
 		self.assertEqual(response.status.status, 1)
 
+	def testViewerControllerROIValues(self):
+		slices, rows, columns, values = self.viewer_controller_pyosirix.get_roi_values(name="test_grpc", movie_idx=0)
+		self.assertEqual(slices.dtype, np.int32)
+		self.assertEqual(rows.dtype, np.int32)
+		self.assertEqual(columns.dtype, np.int32)
+		self.assertEqual(values.dtype, np.float32)
+		self.assertTrue(len(values) > 0)
+		self.assertEqual(len(slices), len(values))
+
+		pix_list = self.viewer_controller_pyosirix.pix_list(movie_idx=0)
+		roi_list = self.viewer_controller_pyosirix.roi_list(movie_idx=0)
+		total = 0
+		for slice_idx, rois in enumerate(roi_list):
+			for roi in rois:
+				if roi.name == "test_grpc":
+					total += len(pix_list[slice_idx].get_roi_values(roi)[2])
+		self.assertEqual(total, len(values))
+
+	def testViewerControllerROIIndex(self):
+		roi_index = self.viewer_controller_pyosirix.roi_index(movie_idx=0)
+		roi_with_names = self.viewer_controller_pyosirix.rois_with_name(name="test_grpc", movie_idx=0)
+		self.assertTrue("test_grpc" in roi_index)
+		self.assertEqual(len(roi_index.rois_with_name("test_grpc", movie_idx=0)), len(roi_with_names))
+		self.assertFalse(roi_index.has_changed())
+		self.assertFalse(roi_index.update())
+
+	def testViewerControllerROISpatialIndex(self):
+		point_set = self.viewer_controller_pyosirix.roi_point_set(movie_idx=0, name="test_grpc")
+		self.assertTrue(point_set.n_rois > 0)
+		self.assertTrue(np.array_equal(point_set.points(0), point_set.rois[0].points))
+
+		spatial_index = osirix.ROISpatialIndex(point_set)
+		xmin, ymin, xmax, ymax = spatial_index.boxes[0]
+		hits = spatial_index.query_box(xmin, ymin, xmax, ymax, int(point_set.slice_indices[0]))
+		self.assertTrue(0 in hits)
+
+	def testViewerControllerROIShapeFeatures(self):
+		point_set, features = self.viewer_controller_pyosirix.roi_shape_features(movie_idx=0, name="test_grpc")
+		self.assertEqual(len(features["area"]), point_set.n_rois)
+		self.assertTrue(np.all(features["compactness"] <= 1.0 + 1e-9))
+
+		roi = point_set.rois[0]
+		x, y = roi.centroid()
+		self.assertAlmostEqual(features["centroid"][0, 0], x, places=1)
+		self.assertAlmostEqual(features["centroid"][0, 1], y, places=1)
+
+	def testViewerControllerRadiomics(self):
+		names, features = radiomics.extract_features(self.viewer_controller_pyosirix, names=["test_grpc"], movie_idx=0)
+		slices, rows, columns, values = self.viewer_controller_pyosirix.get_roi_values(name="test_grpc", movie_idx=0)
+		self.assertEqual(names, ("test_grpc",))
+		self.assertEqual(features["firstorder_count"][0], len(values))
+		self.assertAlmostEqual(features["firstorder_mean"][0], float(np.mean(values, dtype=np.float64)), places=3)
+		self.assertTrue(0.0 <= features["glcm_energy"][0] <= 1.0)
+
+	def testViewerControllerROIVolumes(self):
+		volumes = self.viewer_controller_pyosirix.roi_volumes(movie_idx=0, names=("test_grpc",))
+		volumes_mask = self.viewer_controller_pyosirix.roi_volumes(movie_idx=0, names=("test_grpc",), method="mask")
+		self.assertTrue(volumes["test_grpc"] > 0)
+		self.assertAlmostEqual(volumes["test_grpc"], volumes_mask["test_grpc"], delta=0.25 * volumes["test_grpc"])
+
 	def testViewerControllerSelectedROIs(self):
 		selected_rois = self.viewer_controller_pyosirix.selected_rois()
 		response = self.stub.ViewerControllerSelectedROIs(self.viewer_controller)
@@ -370,6 +451,80 @@ class PyOsirixTestViewerController(GrpcTest):
 		self.assertEqual(response2.wl, wlww_value[0])
 		self.assertEqual(response2.ww, wlww_value[1])
 
+	def testViewerControllerSnapshot(self):
+		snapshot = self.viewer_controller_pyosirix.snapshot()
+		self.assertEqual(snapshot.idx, self.viewer_controller_pyosirix.idx)
+		self.assertEqual(snapshot.movie_idx, self.viewer_controller_pyosirix.movie_idx)
+		self.assertEqual(snapshot.modality, self.viewer_controller_pyosirix.modality)
+		self.assertEqual(snapshot.title, self.viewer_controller_pyosirix.title)
+		self.assertEqual(snapshot.wlww, self.viewer_controller_pyosirix.wlww)
+		self.assertEqual(snapshot.max_movie_index, self.viewer_controller_pyosirix.max_movie_index())
+
+	def testViewerControllerCacheTTL(self):
+		self.viewer_controller_pyosirix.cache_ttl = 60.0
+		wlww = self.viewer_controller_pyosirix.wlww
+		self.assertEqual(self.viewer_controller_pyosirix.wlww, wlww)
+		self.viewer_controller_pyosirix.wlww = (wlww[0] + 1, wlww[1])
+		self.assertEqual(self.viewer_controller_pyosirix.wlww, (wlww[0] + 1, wlww[1]))
+		self.viewer_controller_pyosirix.wlww = wlww
+		self.viewer_controller_pyosirix.cache_ttl = 0.0
+
+	def testViewerControllerInterned(self):
+		self.assertIs(self.osirix.frontmost_viewer(), self.viewer_controller_pyosirix)
+		pix = self.viewer_controller_pyosirix.pix_list(0)
+		self.assertIs(self.viewer_controller_pyosirix.pix_list(0)[0], pix[0])
+		with self.assertRaises(AttributeError):
+			self.viewer_controller_pyosirix.unknown_attribute = None
+
+	def testViewerControllerPlay(self):
+		idx = self.viewer_controller_pyosirix.idx
+		player = self.viewer_controller_pyosirix.play(axis="slice", fps=20.0, loop=False)
+		stats = player.wait(timeout=60)
+		self.assertIsNone(player.error)
+		self.assertEqual(stats.frames_shown + stats.frames_skipped, player.frames)
+		self.assertEqual(self.viewer_controller_pyosirix.idx, player.frames - 1)
+		self.viewer_controller_pyosirix.idx = idx
+
+	def testViewerControllerResampleTo(self):
+		volume = self.viewer_controller_pyosirix.volume()
+		resampled = self.viewer_controller_pyosirix.resample_to(self.viewer_controller_pyosirix, order="nearest")
+		self.assertEqual(resampled.shape, volume.shape)
+		self.assertTrue(np.allclose(resampled, volume))
+
+	def testViewerControllerExport(self):
+		volume = self.viewer_controller_pyosirix.volume()
+		with tempfile.TemporaryDirectory() as directory:
+			path = self.viewer_controller_pyosirix.export(os.path.join(directory, "volume.npy"), format="npy")
+			self.assertTrue(np.array_equal(np.load(path), volume.astype(np.float32)))
+			path = self.viewer_controller_pyosirix.export(os.path.join(directory, "volume.nii"), format="nifti")
+			voxels = np.fromfile(path, dtype=np.float32, offset=352).reshape(volume.shape)
+			self.assertTrue(np.array_equal(voxels, volume.astype(np.float32)))
+
+	def testViewerControllerLoadVolume(self):
+		volume = self.viewer_controller_pyosirix.volume(refresh=True)
+		loaded = self.viewer_controller_pyosirix.load_volume(processes=2, cache=False)
+		self.assertEqual(loaded.shape, volume.shape)
+		self.assertTrue(np.allclose(loaded, volume, atol=1e-3))
+
+	def testViewerControllerAutoWLWW(self):
+		wlww = self.viewer_controller_pyosirix.wlww
+		for method in ("percentile", "histogram"):
+			wl, ww = self.viewer_controller_pyosirix.auto_wlww(method=method, sample=4)
+			self.assertTrue(ww > 0)
+			self.assertEqual(self.viewer_controller_pyosirix.wlww, (wl, ww))
+		self.viewer_controller_pyosirix.wlww = wlww
+
+	def testViewerControllerWatch(self):
+		watcher = self.viewer_controller_pyosirix.watch()
+		changes = []
+		watcher.on_wlww_changed(lambda old, new: changes.append((old, new)))
+		self.assertEqual(watcher.poll(), [])
+		wlww = self.viewer_controller_pyosirix.wlww
+		self.viewer_controller_pyosirix.wlww = (wlww[0] + 1, wlww[1])
+		watcher.poll()
+		self.viewer_controller_pyosirix.wlww = wlww
+		self.assertEqual(changes, [(wlww, (wlww[0] + 1, wlww[1]))])
+
 	def testViewerControllerWLWW(self):
 		wl, ww = self.viewer_controller_pyosirix.wlww
 		response = self.stub.ViewerControllerWLWW(self.viewer_controller)
@@ -399,6 +554,18 @@ class PyOsirixTestDCMPix(GrpcTest):
 																			   name="test_grpc", movie_idx=0)
 		self.roi = self.stub.ViewerControllerROIsWithName(roi_request).rois[0]
 
+	def testDCMPixImageCoalesced(self):
+		self.osirix_service.coalesce("DCMPixImage")
+		service = self.osirix_service.get_service()
+		pix = osirix.DCMPix(self.pix, service)
+		with ThreadPoolExecutor(max_workers=4) as executor:
+			images = list(executor.map(lambda _: pix.image, range(4)))
+		calls, coalesced = service.stats
+		self.assertEqual(calls + coalesced, 4)
+		self.assertTrue(all(np.array_equal(image, images[0]) for image in images))
+		with self.assertRaises(ValueError):
+			self.osirix_service.coalesce("ViewerControllerSetWLWW")
+
 	def testDCMPixConvertToRGB(self):
 		self.pix_pyosirix.convert_to_rgb() # Catches a failed response implicityl
 
@@ -700,6 +867,21 @@ class PyOsirixTestROI(GrpcTest):
 
 		self.assertTrue(np.array_equal(points, points_py))
 
+	def testROIPointsMM(self):
+		points = self.roi_pyosirix.points
+		points_mm = self.roi_pyosirix.points_mm()
+		self.assertEqual(points_mm.shape, (len(points), 3))
+
+		pix = self.roi_pyosirix.pix
+		orientation = np.array(pix.orientation)
+		spacing_rows, spacing_columns = pix.pixel_spacing
+		expected = np.array(pix.origin) + points[0, 0] * spacing_columns * orientation[0:3] \
+			+ points[0, 1] * spacing_rows * orientation[3:6]
+		self.assertTrue(np.allclose(points_mm[0], expected))
+
+		point_set, vertices_mm = self.viewer_controller_pyosirix.roi_points_mm(movie_idx=0, name="test_grpc")
+		self.assertEqual(vertices_mm.shape, (len(point_set.vertices), 3))
+
 	def testROISetPoints(self):
 		# points_array = self.roi_pyosirix.points
 		# self.roi_pyosirix.points = points_array
@@ -819,6 +1001,76 @@ class PyOsirixTestBrowserController(GrpcTest):
 		self.assertEqual(len(response.studies), len(study_series[0]))
 		self.assertEqual(len(response.series), len(study_series[1]))
 
+	def testBrowserControllerCrawlMetadata(self):
+		studies, _ = self.browser_controller_pyosirix.database_selection()
+		reports = []
+		result = self.browser_controller_pyosirix.crawl_metadata(image_fields=("sop_instance_uid",),
+																 progress=reports.append)
+		self.assertEqual(len(result.studies["uid"]), len(studies))
+		self.assertEqual(len(result.series["uid"]), len(result.series["study_uid"]))
+		self.assertEqual(len(result.images["sop_instance_uid"]), len(result.image_objects))
+		self.assertTrue(len(reports) > 0)
+		self.assertEqual(result.studies["patient_id"][0], studies[0].patient_id)
+
+	def testBrowserControllerImportFiles(self):
+		_, series = self.browser_controller_pyosirix.database_selection()
+		paths = list(series[0].paths())
+		chunks = []
+		result = self.browser_controller_pyosirix.import_files(paths + paths, chunk_size=2, progress=chunks.append)
+		self.assertEqual(result.duplicates, len(paths))
+		self.assertEqual(result.imported, len(paths))
+		self.assertEqual(len(result.failed_paths), 0)
+		self.assertEqual(len(chunks), len(result.chunks))
+
+	def testBrowserControllerMetadataCatalogue(self):
+		studies, _ = self.browser_controller_pyosirix.database_selection()
+		with osirix.MetadataCatalogue() as catalogue:
+			stats = catalogue.refresh(self.browser_controller_pyosirix)
+			self.assertEqual(stats.studies_added, len(studies))
+			self.assertEqual(catalogue.counts()["studies"], len(studies))
+			stats = catalogue.refresh(self.browser_controller_pyosirix)
+			self.assertEqual(stats.studies_unchanged, len(studies))
+			self.assertEqual(catalogue.study(studies[0].study_instance_uid)["patient_id"], studies[0].patient_id)
+
+	def testBrowserControllerFindSeries(self):
+		_, series = self.browser_controller_pyosirix.database_selection()
+		with osirix.MetadataCatalogue() as catalogue:
+			catalogue.refresh(self.browser_controller_pyosirix, include_images=False)
+			modality = series[0].modality
+			found = catalogue.find_series(modality=modality)
+			self.assertTrue(len(found) > 0)
+			self.assertTrue(all(found_series.modality == modality for found_series in found))
+			self.assertEqual(catalogue.find_series(description="no series is described like this"), ())
+
+	def testBrowserControllerAttributeCache(self):
+		studies, _ = self.browser_controller_pyosirix.database_selection()
+		osirix.reset_cache_stats()
+		uid = studies[0].study_instance_uid
+		self.assertEqual(studies[0].study_instance_uid, uid)
+		stats = osirix.cache_stats()["DicomStudy.study_instance_uid"]
+		self.assertEqual((stats.hits, stats.misses), (1, 1))
+		with osirix.caching_disabled():
+			self.assertEqual(studies[0].study_instance_uid, uid)
+		self.assertEqual(osirix.cache_stats()["DicomStudy.study_instance_uid"].hits, 1)
+		self.assertTrue(osirix.caching_enabled())
+
+	def testBrowserControllerTraverseSeries(self):
+		studies, series = self.browser_controller_pyosirix.database_selection()
+		traversed = list(self.browser_controller_pyosirix.traverse_series())
+		uids = [s.osirixrpc_uid.osirixrpc_uid for s in traversed]
+		self.assertEqual(len(uids), len(set(uids)))
+		self.assertEqual(len(list(studies[0].traverse_series())), len(studies[0].series))
+		walked = list(series[0].walk(max_hops=1))
+		self.assertTrue(walked[0] is series[0])
+		self.assertTrue(len(walked) <= 2)
+
+	def testBrowserControllerSeriesGeometricOrder(self):
+		_, series = self.browser_controller_pyosirix.database_selection()
+		order = series[0].geometric_order()
+		self.assertEqual(len(order.images), len(series[0].images))
+		self.assertTrue(np.all(np.diff(order.slice_locations) >= 0))
+		self.assertEqual(sorted(order.order.tolist()), list(range(len(order.images))))
+
 
 if __name__ == '__main__':
     unittest.main()